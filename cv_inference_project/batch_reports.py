@@ -0,0 +1,276 @@
+"""Concurrent LLM report generation for a whole cohort.
+
+Every video in all_results.json gets a whole-video comparison (see
+compare_frames.FrameIndex), a token-budgeted prompt (see send_to_llm) and a
+<video>_report.md next to its summary. Requests go through one pooled
+httpx.AsyncClient with at most `concurrency` in flight, an optional
+requests-per-minute limit, retries with exponential backoff and jitter on
+429/5xx/network errors (honouring Retry-After), and a shared pause when the
+server reports its rate limit as exhausted.
+
+    python batch_reports.py --all-results out/all_results.json --concurrency 16
+    python llm_stub.py --port 8000 &    # local OpenAI-compatible server for testing
+    python batch_reports.py --all-results out/all_results.json --base-url http://127.0.0.1:8000/v1
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+from compare_frames import FrameIndex
+from send_to_llm import (generate_range_analysis_prompt, CompletionCache, save_analysis_results,
+                         MODEL, BASE_URL)
+
+logger = logging.getLogger("inference")
+
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+def _reset_delay(value):
+    """Seconds until a rate limit resets, from X-RateLimit-Reset style
+    headers: epoch milliseconds, seconds, or durations such as "6m0s"/"20ms"."""
+    if not value:
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        total, num = 0.0, ""
+        units = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+        i = 0
+        while i < len(value):
+            ch = value[i]
+            if ch.isdigit() or ch == ".":
+                num += ch
+                i += 1
+                continue
+            unit = "ms" if value[i:i + 2] == "ms" else ch
+            if unit not in units or not num:
+                return None
+            total += float(num) * units[unit]
+            num = ""
+            i += len(unit)
+        return total
+    if number > 1e12:
+        return max(0.0, number / 1000.0 - time.time())
+    if number > 1e9:
+        return max(0.0, number - time.time())
+    return number
+
+class RateLimiter:
+    """Spaces request starts to at most `rpm` per minute and holds every
+    request while the server asked us to back off"""
+
+    def __init__(self, rpm=None):
+        self.interval = 60.0 / rpm if rpm else 0.0
+        self._next = 0.0
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next, self._paused_until)
+            self._next = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+class LLMClient:
+    """Chat completions over one pooled connection set"""
+
+    def __init__(self, base_url=BASE_URL, api_key=None, concurrency=8, rpm=None,
+                 max_retries=5, backoff=1.0, max_backoff=60.0, timeout=120.0):
+        api_key = api_key if api_key is not None else os.environ.get("OPENROUTER_API_KEY", "")
+        self.http = httpx.AsyncClient(
+            base_url=base_url.rstrip("/") + "/",
+            headers={"Authorization": f"Bearer {api_key}"} if api_key else {},
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+            timeout=timeout,
+        )
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.limiter = RateLimiter(rpm)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    async def close(self):
+        await self.http.aclose()
+
+    def _delay(self, attempt, response=None):
+        if response is not None:
+            retry_after = _reset_delay(response.headers.get("retry-after"))
+            if retry_after is not None:
+                return retry_after
+        return min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    def _watch_limits(self, response):
+        remaining = response.headers.get("x-ratelimit-remaining-requests",
+                                         response.headers.get("x-ratelimit-remaining"))
+        if remaining is not None and remaining.strip() == "0":
+            delay = _reset_delay(response.headers.get("x-ratelimit-reset-requests",
+                                                      response.headers.get("x-ratelimit-reset")))
+            if delay:
+                logger.info(f"Rate limit exhausted, pausing requests for {delay:.1f}s")
+                self.limiter.pause(delay)
+
+    async def complete(self, payload):
+        """POST chat/completions; returns (content, latency_s, attempts)"""
+        async with self.semaphore:
+            for attempt in range(self.max_retries + 1):
+                await self.limiter.acquire()
+                start = time.perf_counter()
+                response = None
+                try:
+                    response = await self.http.post("chat/completions", json=payload)
+                    if response.status_code not in RETRY_STATUS:
+                        response.raise_for_status()
+                        self._watch_limits(response)
+                        content = response.json()["choices"][0]["message"]["content"]
+                        return content, time.perf_counter() - start, attempt + 1
+                    error = f"HTTP {response.status_code}"
+                except (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError) as e:
+                    error = f"{type(e).__name__}: {str(e)}"
+                if attempt == self.max_retries:
+                    raise RuntimeError(f"giving up after {attempt + 1} attempts ({error})")
+                delay = self._delay(attempt, response)
+                if response is not None and response.status_code == 429:
+                    self.limiter.pause(delay)
+                logger.warning(f"Request failed ({error}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+def latency_stats(latencies):
+    if not latencies:
+        return {}
+    values = np.asarray(latencies)
+    return {
+        "count": len(values),
+        "mean": float(values.mean()),
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+        "max": float(values.max()),
+    }
+
+def collect_jobs(all_results_path):
+    """(key, summary_path, events_path, report_path) for every finished video"""
+    with open(all_results_path) as f:
+        results = json.load(f)
+    jobs = []
+    for key, entry in results.items():
+        if not isinstance(entry, dict) or "summary_path" not in entry:
+            continue
+        summary = Path(entry["summary_path"])
+        if not summary.exists():
+            logger.warning(f"Summary of {key} not found: {summary}")
+            continue
+        stem = summary.name[:-len("_summary.json")] if summary.suffix == ".json" else summary.name[:-len("_summary")]
+        jobs.append((key, summary, entry.get("events_path"), summary.parent / f"{stem}_report.md"))
+    return jobs
+
+def build_prompt(summary_path, events_path, budget):
+    index = FrameIndex.load(summary_path)
+    data = index.compare()
+    fps = 30.0
+    if len(index.frames) > 1 and index.timestamps[-1] > 0:
+        fps = float(index.frames[-1] / index.timestamps[-1])
+    events = None
+    if events_path and Path(events_path).exists():
+        with open(events_path) as f:
+            events = json.load(f)["events"]
+    return generate_range_analysis_prompt(data, budget, fps, events)
+
+async def generate_reports(jobs, client, model=MODEL, budget=6000, temperature=0.3,
+                           max_tokens=2000, cache=None, overwrite=False):
+    """Run every job; returns per-video records and latency stats"""
+    records = {}
+
+    async def run(key, summary, events, report):
+        record = records[key] = {"report_path": str(report)}
+        if report.exists() and not overwrite:
+            record["status"] = "exists"
+            return
+        try:
+            prompt = await asyncio.to_thread(build_prompt, summary, events, budget)
+            messages = [{"role": "user", "content": prompt}]
+            payload = {"model": model, "messages": messages,
+                       "temperature": temperature, "max_tokens": max_tokens}
+            cache_key = None
+            content = None
+            if cache is not None:
+                cache_key = cache.key(base_url=str(client.http.base_url).rstrip("/"), model=model,
+                                      messages=messages, temperature=temperature, max_tokens=max_tokens)
+                content = cache.get(cache_key)
+            if content is not None:
+                record["status"] = "cached"
+            else:
+                content, latency, attempts = await client.complete(payload)
+                record.update(status="ok", latency=latency, attempts=attempts)
+                if cache is not None:
+                    cache.put(cache_key, content)
+            await asyncio.to_thread(save_analysis_results, str(report), content)
+        except Exception as e:
+            record.update(status="failed", error=str(e))
+            logger.error(f"Report for {key} failed: {str(e)}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run(*job) for job in jobs))
+    latencies = [r["latency"] for r in records.values() if "latency" in r]
+    statuses = [r["status"] for r in records.values()]
+    return {
+        "videos": records,
+        "wall_time": time.perf_counter() - start,
+        "counts": {s: statuses.count(s) for s in sorted(set(statuses))},
+        "retries": sum(r.get("attempts", 1) - 1 for r in records.values()),
+        "latency": latency_stats(latencies),
+    }
+
+async def _main(args):
+    jobs = collect_jobs(args.all_results)
+    logger.info(f"Generating {len(jobs)} reports with concurrency {args.concurrency}")
+    client = LLMClient(args.base_url, concurrency=args.concurrency, rpm=args.rpm,
+                       max_retries=args.max_retries, timeout=args.timeout)
+    cache = None if args.no_cache else CompletionCache(args.cache_dir)
+    try:
+        return await generate_reports(jobs, client, args.model, args.budget, args.temperature,
+                                      args.max_tokens, cache, args.overwrite)
+    finally:
+        await client.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate LLM reports for every video of a run")
+    parser.add_argument("--all-results", required=True)
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--model", default=MODEL)
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight")
+    parser.add_argument("--rpm", type=float, default=None, help="Client-side requests per minute limit")
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--budget", type=int, default=6000, help="Prompt size limit in tokens")
+    parser.add_argument("--temperature", type=float, default=0.3)
+    parser.add_argument("--max-tokens", type=int, default=2000)
+    parser.add_argument("--cache-dir", default=".llm_cache")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--overwrite", action="store_true", help="Regenerate existing reports")
+    parser.add_argument("--stats", default=None, help="Defaults to reports.json next to all_results.json")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    stats = asyncio.run(_main(args))
+    stats_path = Path(args.stats) if args.stats else Path(args.all_results).with_name("reports.json")
+    with open(stats_path, 'w') as f:
+        json.dump(stats, f, indent=2)
+    latency = stats["latency"]
+    logger.info(f"Done in {stats['wall_time']:.1f}s: {stats['counts']}, {stats['retries']} retries"
+                + (f", latency p50 {latency['p50']:.2f}s p95 {latency['p95']:.2f}s" if latency else ""))
+    logger.info(f"Per-video status written to {stats_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import queue
+import threading
+import time
+
+_DONE = object()
+
+class _Failure:
+    def __init__(self, exc):
+        self.exc = exc
+
+class MicroBatcher:
+    """Groups a stream of items into lists of up to `batch_size` items.
+
+    With `max_wait` set, the source is drained by a background thread and a
+    batch is flushed as soon as `max_wait` seconds have passed since its first
+    item arrived, so a slow producer never holds results back for long.
+    """
+
+    def __init__(self, batch_size=1, max_wait=None):
+        self.batch_size = max(1, int(batch_size))
+        self.max_wait = max_wait
+
+    def batches(self, items):
+        if self.batch_size == 1 or self.max_wait is None:
+            return self._fixed(items)
+        return self._timed(items)
+
+    def _fixed(self, items):
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _timed(self, items):
+        q = queue.Queue(maxsize=self.batch_size * 2)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        def produce():
+            try:
+                for item in items:
+                    if stop.is_set():
+                        return
+                    put(item)
+            except Exception as e:
+                put(_Failure(e))
+            finally:
+                put(_DONE)
+
+        threading.Thread(target=produce, name="micro-batcher", daemon=True).start()
+        try:
+            batch, deadline = [], None
+            while True:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    item = q.get(timeout=timeout)
+                except queue.Empty:
+                    yield batch
+                    batch, deadline = [], None
+                    continue
+
+                if item is _DONE:
+                    break
+                if isinstance(item, _Failure):
+                    raise item.exc
+
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.max_wait
+                if len(batch) == self.batch_size:
+                    yield batch
+                    batch, deadline = [], None
+            if batch:
+                yield batch
+        finally:
+            stop.set()
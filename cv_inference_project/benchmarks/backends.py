@@ -0,0 +1,149 @@
+"""Accuracy and speed of the CPU backends against the torch path.
+
+    python -m models.backend convert --backend openvino --int8 --calib downloads/
+    python benchmarks/backends.py --source downloads/ --frames 200 \
+        --configs torch onnx onnx-int8 openvino openvino-int8 --output backends.json
+
+Frames are sampled from --source on a grid offset from the calibration
+frames. Every configuration runs the YOLOv8 detector on each frame and the
+ArcFace recognizer on each aligned face (the same crops for all of them) and
+is compared with the torch run: detection precision/recall (same class,
+IoU >= 0.5), mean confidence shift and person/phone count agreement;
+embedding cosine similarity and agreement of the identity match decision.
+"""
+import sys
+import json
+import time
+import argparse
+import logging
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from models.backend import calibration_frames
+from models.detector import DetectionStage, PERSON, CELL_PHONE
+
+def timed(fn, items):
+    outputs, latencies = [], []
+    for item in items:
+        start = time.perf_counter()
+        outputs.append(fn(item))
+        latencies.append(time.perf_counter() - start)
+    ms = 1000 * np.asarray(latencies)
+    return outputs, {"ms_mean": float(ms.mean()), "ms_p50": float(np.percentile(ms, 50)),
+                     "ms_p95": float(np.percentile(ms, 95)), "per_s": float(1000 / ms.mean())}
+
+def box_iou(a, b):
+    """Pairwise IoU of xyxy boxes a (N, 4) and b (M, 4)"""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = lambda r: (r[:, 2] - r[:, 0]) * (r[:, 3] - r[:, 1])
+    union = area(a)[:, None] + area(b)[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+def match_detections(ref, dets, iou=0.5, conf=0.3):
+    """Greedy same-class matching of `dets` to the reference detections
+    above `conf`; returns (matched, n_ref, n_dets, confidence shifts)"""
+    matched, shifts = 0, []
+    keep_ref, keep = ref.conf > conf, dets.conf > conf
+    for cls in np.unique(np.concatenate([ref.cls[keep_ref], dets.cls[keep]])):
+        r = keep_ref & (ref.cls == cls)
+        d = keep & (dets.cls == cls)
+        ious = box_iou(ref.boxes[r], dets.boxes[d])
+        r_conf, d_conf = ref.conf[r], dets.conf[d]
+        used = set()
+        for i in np.argsort(-r_conf):
+            candidates = [j for j in np.argsort(-ious[i]) if j not in used and ious[i, j] >= iou]
+            if candidates:
+                used.add(candidates[0])
+                matched += 1
+                shifts.append(abs(float(d_conf[candidates[0]] - r_conf[i])))
+    return matched, int(keep_ref.sum()), int(keep.sum()), shifts
+
+def count_agreement(ref, dets, class_id, conf=0.3):
+    return [int(((r.cls == class_id) & (r.conf > conf)).sum()) == int(((d.cls == class_id) & (d.conf > conf)).sum())
+            for r, d in zip(ref, dets)]
+
+def detector_report(ref, dets):
+    matched = n_ref = n_dets = 0
+    shifts = []
+    for r, d in zip(ref, dets):
+        m, nr, nd, s = match_detections(r, d)
+        matched, n_ref, n_dets = matched + m, n_ref + nr, n_dets + nd
+        shifts.extend(s)
+    return {
+        "precision": matched / n_dets if n_dets else 1.0,
+        "recall": matched / n_ref if n_ref else 1.0,
+        "conf_shift": float(np.mean(shifts)) if shifts else 0.0,
+        "person_count_agreement": float(np.mean(count_agreement(ref, dets, PERSON))),
+        "phone_count_agreement": float(np.mean(count_agreement(ref, dets, CELL_PHONE))),
+    }
+
+def recognizer_report(ref, feats, thr):
+    ref, feats = np.asarray(ref), np.asarray(feats)
+    cos = (ref * feats).sum(1) / (np.linalg.norm(ref, axis=1) * np.linalg.norm(feats, axis=1))
+    # IdentityModel's decision: L2 distance to the enrolled (first) face below thr
+    decide = lambda vecs: np.linalg.norm(vecs[1:] - vecs[0], axis=1) < thr
+    return {
+        "cosine_mean": float(cos.mean()),
+        "cosine_min": float(cos.min()),
+        "match_agreement": float(np.mean(decide(ref) == decide(feats))) if len(ref) > 1 else 1.0,
+    }
+
+def parse_config(name):
+    backend, _, precision = name.partition("-")
+    return backend, precision == "int8"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--source", required=True, help="Videos or images to sample evaluation frames from")
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--configs", nargs="+", default=["torch", "onnx", "onnx-int8", "openvino", "openvino-int8"])
+    parser.add_argument("--det-size", type=int, default=640)
+    parser.add_argument("--output", default=None, help="Write the report as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    from models.identity import IdentityModel
+
+    # Offset from the calibration grid so INT8 is not evaluated on its own calibration frames
+    frames = calibration_frames(args.source, args.frames, offset=0.5)
+    faces = IdentityModel(mode="fast", det_size=args.det_size).aligned_faces(frames)
+    print(f"{len(frames)} frames, {len(faces)} faces")
+
+    report, reference = {}, None
+    for name in ["torch"] + [c for c in args.configs if c != "torch"]:
+        backend, int8 = parse_config(name)
+        stage = DetectionStage(backend=backend, int8=int8)
+        stage.process(frames[0])
+        dets, det_speed = timed(stage.process, frames)
+
+        identity = IdentityModel(mode="fast", det_size=args.det_size, backend=backend, int8=int8)
+        rec = identity.app.models['recognition']
+        feats, rec_speed = timed(lambda face: rec.get_feat([face]).flatten(), faces)
+
+        if reference is None:
+            reference = dets, feats
+        entry = report[name] = {"detector": det_speed, "recognizer": rec_speed}
+        entry["detector"].update(detector_report(reference[0], dets))
+        if faces:
+            entry["recognizer"].update(recognizer_report(reference[1], feats, identity.thr))
+
+    configs = [c for c in report if c in args.configs]
+    print(f"{'config':<15} {'det ms':>8} {'det/s':>7} {'prec':>6} {'recall':>6} {'persons':>8} "
+          f"{'rec ms':>8} {'cos min':>8} {'match':>6}")
+    for name in configs:
+        det, rec = report[name]["detector"], report[name]["recognizer"]
+        print(f"{name:<15} {det['ms_mean']:>8.1f} {det['per_s']:>7.1f} {det['precision']:>6.3f} "
+              f"{det['recall']:>6.3f} {det['person_count_agreement']:>8.3f} {rec['ms_mean']:>8.2f} "
+              f"{rec.get('cosine_min', float('nan')):>8.4f} {rec.get('match_agreement', float('nan')):>6.3f}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({name: report[name] for name in configs}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Frames/sec of the batch-capable models versus --batch-size on CPU.
+
+    python benchmarks/batch_throughput.py --video downloads/student/exam.mp4 --batch-sizes 1 2 4 8 16
+"""
+import sys
+import time
+import argparse
+import logging
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from run_inference import load_models, load_stages, run_batch
+from frame_source import Frame, FrameSource
+
+def load_frames(video, count, frame_skip):
+    if video is None:
+        rng = np.random.default_rng(0)
+        return [Frame(i, rng.integers(0, 255, (720, 1280, 3), dtype=np.uint8)) for i in range(count)]
+    import decord
+    vr = decord.VideoReader(str(video), ctx=decord.cpu(0))
+    return list(FrameSource(vr, range(0, len(vr), frame_skip)[:count], prefetch=0))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--video", type=str, default=None, help="Sample frames from this video (random noise if omitted)")
+    parser.add_argument("--frames", type=int, default=64)
+    parser.add_argument("--frame-skip", type=int, default=5)
+    parser.add_argument("--models", nargs="+", default=["identity", "phone", "persons"])
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logger = logging.getLogger("inference")
+    models = load_models(args.models, logger)
+    stages = load_stages(models, logger)
+    frames = load_frames(args.video, args.frames, args.frame_skip)
+
+    # Warm-up so lazy initialisation does not count against batch size 1
+    run_batch(models, stages, frames[:1], logger)
+
+    print(f"{'batch':>6} {'frames/s':>10} {'ms/frame':>10}")
+    for batch_size in args.batch_sizes:
+        for model in models.values():
+            if hasattr(model, "ref_vec"):
+                model.ref_vec = None
+        start = time.perf_counter()
+        for i in range(0, len(frames), batch_size):
+            run_batch(models, stages, frames[i:i + batch_size], logger)
+        elapsed = time.perf_counter() - start
+        print(f"{batch_size:>6} {len(frames) / elapsed:>10.2f} {1000 * elapsed / len(frames):>10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Startup cost of run_inference: --help, importing it, a dry run and
+loading each model, every one measured in a fresh interpreter.
+
+    python benchmarks/startup.py --models identity gaze headpose phone persons objects \
+        --dataset-root downloads/ --output startup.json
+
+For every model it reports the time to import its module, the time to build
+it with its shared stages and the heavy frameworks that ended up imported.
+"""
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+FRAMEWORKS = ("torch", "ultralytics", "insightface", "onnxruntime", "mediapipe", "openvino",
+              "decord", "cv2", "numpy")
+
+LOAD = """
+import sys, time, json, logging
+start = time.perf_counter()
+from models import registry
+spec = registry.spec({name!r})
+imported = time.perf_counter() - start
+start = time.perf_counter()
+model = registry.load_model({name!r})
+for stage in getattr(model, "requires", ()):
+    registry.load_stage(stage)
+loaded = time.perf_counter() - start
+print(json.dumps({{"import_s": imported, "load_s": loaded,
+                   "frameworks": [m for m in {frameworks!r} if m in sys.modules]}}))
+"""
+
+def run(args, repeat=1):
+    """Best wall time of `python <args>` in ROOT, and its last stdout line"""
+    best, out = None, ""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, *args], cwd=ROOT, capture_output=True, text=True)
+        elapsed = time.perf_counter() - start
+        if proc.returncode != 0:
+            raise RuntimeError(f"{' '.join(args)} failed:\n{proc.stderr[-2000:]}")
+        best = elapsed if best is None else min(best, elapsed)
+        out = proc.stdout.strip().splitlines()[-1] if proc.stdout.strip() else ""
+    return best, out
+
+def import_times(module, top=10):
+    """Modules with the largest cumulative import time (-X importtime)"""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=ROOT, capture_output=True, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "):
+            rows.append((name.strip(), int(cumulative) / 1e6))
+    return sorted(rows, key=lambda r: -r[1])[:top]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--models", nargs="+", default=["identity", "gaze", "headpose", "phone", "persons"])
+    parser.add_argument("--dataset-root", default=None, help="Also time a --dry-run over this dataset")
+    parser.add_argument("--repeat", type=int, default=3, help="Best of N runs for the timings")
+    parser.add_argument("--output", default=None, help="Write the report as JSON")
+    args = parser.parse_args()
+
+    report = {"help_s": run(["run_inference.py", "--help"], args.repeat)[0],
+              "import_s": run(["-c", "import run_inference"], args.repeat)[0],
+              "top_imports": import_times("run_inference")}
+    print(f"run_inference.py --help   {report['help_s']:.3f}s")
+    print(f"import run_inference      {report['import_s']:.3f}s")
+    for name, seconds in report["top_imports"]:
+        print(f"    {name:<28} {seconds:.3f}s")
+
+    if args.dataset_root:
+        with tempfile.TemporaryDirectory() as out_dir:
+            report["dry_run_s"] = run(["run_inference.py", "--dataset-root", args.dataset_root,
+                                       "--output-dir", out_dir, "--models", *args.models, "--dry-run"],
+                                      args.repeat)[0]
+        print(f"--dry-run                 {report['dry_run_s']:.3f}s")
+
+    report["models"] = {}
+    print(f"\n{'model':<12} {'import':>8} {'load':>8} {'process':>8}  frameworks")
+    for name in args.models:
+        try:
+            wall, out = run(["-c", LOAD.format(name=name, frameworks=FRAMEWORKS)])
+        except RuntimeError as e:
+            print(f"{name:<12} failed: {str(e).splitlines()[-1]}")
+            continue
+        entry = report["models"][name] = dict(json.loads(out), process_s=wall)
+        print(f"{name:<12} {entry['import_s']:>7.3f}s {entry['load_s']:>7.3f}s {wall:>7.3f}s  "
+              f"{', '.join(entry['frameworks'])}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
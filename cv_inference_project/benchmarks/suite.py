@@ -0,0 +1,374 @@
+"""Reproducible CPU benchmark suite: every pipeline stage measured on its own
+on synthetic exam videos, as JSON, compared against a stored baseline.
+
+    python benchmarks/suite.py --preset quick --videos bench_videos/ --output bench.json
+    python benchmarks/suite.py --preset quick --videos bench_videos/ --save-baseline benchmarks/baseline.json
+    python benchmarks/suite.py --preset quick --videos bench_videos/ --baseline benchmarks/baseline.json
+
+The videos of the preset are generated into --videos on first use (see
+synthetic.py). Like timeit, each metric is the best of --repeat runs, and a
+run repeats its work until it has taken at least --min-time seconds:
+
+    decode/<video>/stride<k>   sampled frames/s through FrameSource
+    stages/<stage>             frames/s of the shared stage's process()
+    models/<model>             frames/s of predict() on the stage outputs
+    jpeg/<size>                annotated frames encoded and written per second
+    summary/*                  rows/s appended to the column store, read back, exported to JSON
+    events/segment             rows/s through the event segmenter
+    compare/*                  FrameIndex load, pairwise comparison and lag/window stats
+    prompt/generate            LLM prompt built from the comparison
+    end_to_end/<video>         extract_and_run over the whole video, times real time
+
+Models whose frameworks are not installed are listed under "skipped". With
+--baseline every shared metric is compared to the stored run and the exit
+status is 1 if any got more than --tolerance worse; baselines are only
+comparable on the same machine and thread settings, which the report records.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+import subprocess
+from pathlib import Path
+from importlib import metadata
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from synthetic import VideoSpec, ensure_videos, synthetic_results
+
+ROOT = Path(__file__).resolve().parents[1]
+GROUPS = ("decode", "models", "jpeg", "summary", "compare", "prompt", "end_to_end")
+MIN_TIME = 0.2
+PACKAGES = ("numpy", "decord", "torch", "ultralytics", "insightface",
+            "mediapipe", "onnxruntime", "openvino")
+
+PRESETS = {
+    "quick": {
+        "videos": [VideoSpec(640, 360, 20), VideoSpec(1280, 720, 20), VideoSpec(1280, 720, 20, gop=250),
+                   VideoSpec(1280, 720, 20, codec="mpeg4")],
+        "strides": (1, 5), "reference": VideoSpec(1280, 720, 20),
+        "model_frames": 16, "jpeg_frames": 32, "summary_rows": 20000,
+    },
+    "full": {
+        "videos": [VideoSpec(640, 360, 60), VideoSpec(1280, 720, 60), VideoSpec(1920, 1080, 60),
+                   VideoSpec(1280, 720, 60, gop=250), VideoSpec(1280, 720, 60, codec="hevc"),
+                   VideoSpec(1280, 720, 60, codec="mpeg4"), VideoSpec(1280, 720, 60, codec="mjpeg", gop=1)],
+        "strides": (1, 5, 10), "reference": VideoSpec(1280, 720, 300),
+        "model_frames": 64, "jpeg_frames": 128, "summary_rows": 200000,
+    },
+}
+
+class Report:
+    def __init__(self):
+        self.metrics = {}
+        self.skipped = {}
+
+    def add(self, name, value, unit, better, runs):
+        self.metrics[name] = {"value": value, "unit": unit, "better": better,
+                              "runs": [round(r, 6) for r in runs]}
+        print(f"{name:<58} {value:>12.2f} {unit}")
+
+    def rate(self, name, count, runs, unit):
+        self.add(name, count / min(runs), unit, "higher", runs)
+
+    def seconds(self, name, runs):
+        self.add(name, min(runs), "s", "lower", runs)
+
+    def skip(self, name, error):
+        self.skipped[name] = f"{type(error).__name__}: {error}"
+        print(f"{name:<58} skipped ({self.skipped[name]})")
+
+def measure(fn, repeat, min_time=None):
+    """Seconds per call of `fn` in each of `repeat` runs"""
+    min_time = MIN_TIME if min_time is None else min_time
+    runs = []
+    for _ in range(repeat):
+        calls, start = 0, time.perf_counter()
+        while True:
+            fn()
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        runs.append(elapsed / calls)
+    return runs
+
+def machine(threads):
+    """What the numbers depend on, to tell whether two reports are comparable"""
+    info = {"platform": platform.platform(), "machine": platform.machine(), "cpus": os.cpu_count(),
+            "python": platform.python_version(), "threads": threads}
+    try:
+        with open("/proc/cpuinfo") as f:
+            info["cpu"] = next(line.split(":", 1)[1].strip() for line in f if line.startswith("model name"))
+    except (OSError, StopIteration):
+        info["cpu"] = platform.processor()
+    versions = {}
+    for package in PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            pass
+    import cv2
+    versions["opencv"] = cv2.__version__
+    info["packages"] = versions
+    try:
+        info["commit"] = subprocess.run(["git", "describe", "--always", "--dirty"], cwd=ROOT,
+                                        capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return info
+
+def read_frames(path, count, stride):
+    import decord
+    from frame_source import FrameSource
+
+    vr = decord.VideoReader(str(path), ctx=decord.cpu(0))
+    return list(FrameSource(vr, range(0, len(vr), stride)[:count], prefetch=0))
+
+def bench_decode(report, paths, strides, repeat, chunk):
+    import decord
+    from frame_source import FrameSource
+
+    for spec, path in paths.items():
+        vr = decord.VideoReader(str(path), ctx=decord.cpu(0))
+        for stride in strides:
+            indices = range(0, len(vr), stride)
+
+            def run():
+                for frame in FrameSource(vr, indices, chunk_size=chunk, prefetch=0):
+                    frame.rgb
+            report.rate(f"decode/{spec.name}/stride{stride}", len(indices), measure(run, repeat), "frames/s")
+
+def bench_models(report, model_names, frames, repeat):
+    """Load the models and their stages and time each on `frames`; returns
+    (models, stages) of the ones that loaded"""
+    from models import registry
+
+    models, stages = {}, {}
+    for name in model_names:
+        try:
+            models[name] = registry.load_model(name)
+        except Exception as e:
+            report.skip(f"models/{name}", e)
+    for model in list(models.values()):
+        for name in getattr(model, "requires", ()):
+            if name in stages or f"stages/{name}" in report.skipped:
+                continue
+            try:
+                stages[name] = registry.load_stage(name)
+            except Exception as e:
+                report.skip(f"stages/{name}", e)
+
+    shared = {}
+    for name, stage in stages.items():
+        imgs = [f.as_color(getattr(stage, "color", "bgr")) for f in frames]
+        stage.process(imgs[0])
+
+        def run():
+            shared[name] = [stage.process(img) for img in imgs]
+        report.rate(f"stages/{name}", len(imgs), measure(run, repeat), "frames/s")
+
+    imgs = [f.bgr for f in frames]
+    for name, model in list(models.items()):
+        requires = getattr(model, "requires", ())
+        if any(stage not in shared for stage in requires):
+            report.skip(f"models/{name}", RuntimeError(f"needs stages {', '.join(requires)}"))
+            del models[name]
+            continue
+
+        def run():
+            if hasattr(model, "reset"):
+                model.reset(student_id=None)
+            for i, img in enumerate(imgs):
+                model.predict(img, **{stage: shared[stage][i] for stage in requires})
+        run()
+        report.rate(f"models/{name}", len(imgs), measure(run, repeat), "frames/s")
+    return models, stages
+
+def bench_jpeg(report, frames, repeat, tmp):
+    import cv2
+    from render import draw
+
+    h, w = frames[0].bgr.shape[:2]
+    box = [0.4 * w, 0.3 * h, 0.6 * w, 0.7 * h]
+    meta = {"person_count": 1, "person_boxes": [box], "phone_count": 1, "phone_boxes": [box]}
+    out = Path(tmp) / "frames"
+    out.mkdir(exist_ok=True)
+
+    def run():
+        for frame in frames:
+            img = draw(frame.bgr.copy(), "persons", meta)
+            cv2.imwrite(str(out / f"frame_{frame.idx:05d}.jpg"), img)
+    report.rate(f"jpeg/{w}x{h}", len(frames), measure(run, repeat), "images/s")
+
+def bench_summary(report, model_names, rows, fps, repeat, tmp):
+    """Time the column store on synthetic results; returns its path"""
+    from models import registry
+    from summary_store import SummaryWriter, load_summary, export_json
+    from events import EventSegmenter
+
+    specs = {}
+    for name in model_names:
+        try:
+            specs[name] = registry.spec(name)
+        except ImportError as e:
+            report.skip(f"summary/{name}", e)
+    specs = {name: spec for name, spec in specs.items() if spec.outputs}
+    data = list(synthetic_results(specs, range(rows), fps))
+    root = Path(tmp) / "exam_summary"
+
+    def write():
+        store = SummaryWriter(root, specs)
+        for frame, timestamp, row in data:
+            for model, meta in row.items():
+                store.append(model, frame, timestamp, meta)
+        store.close()
+    report.rate("summary/write", rows, measure(write, repeat), "rows/s")
+
+    def read():
+        for entries in load_summary(root).values():
+            for _ in entries:
+                pass
+    report.rate("summary/read", rows, measure(read, repeat), "rows/s")
+    report.rate("summary/export_json", rows,
+                measure(lambda: export_json(load_summary(root), Path(tmp) / "exam_summary.json"), repeat), "rows/s")
+
+    def segment():
+        segmenter = EventSegmenter()
+        for frame, timestamp, row in data:
+            segmenter.update(frame, timestamp, row)
+        return segmenter.finish()
+    report.rate("events/segment", rows, measure(segment, repeat), "rows/s")
+    return root, segment()
+
+def bench_compare(report, root, repeat):
+    from compare_frames import FrameIndex
+
+    report.seconds("compare/load", measure(lambda: FrameIndex.load(root), repeat))
+    index = FrameIndex.load(root)
+    comparison = {}
+    runs = measure(lambda: comparison.update(index.compare()), repeat)
+    report.rate("compare/pairs", comparison["total_comparisons"], runs, "pairs/s")
+    report.seconds("compare/stats", measure(lambda: index.stats(lags=(1, 10), windows=(5.0, 60.0)), repeat))
+    return comparison
+
+def bench_prompt(report, comparison, events, fps, repeat):
+    try:
+        from send_to_llm import generate_range_analysis_prompt
+    except ImportError as e:
+        report.skip("prompt/generate", e)
+        return
+    report.seconds("prompt/generate",
+                   measure(lambda: generate_range_analysis_prompt(comparison, 6000, fps, events), repeat))
+
+def bench_end_to_end(report, models, stages, spec, path, frame_skip, repeat, tmp):
+    from run_inference import extract_and_run
+
+    logger = logging.getLogger("inference")
+    out_dir = Path(tmp) / "end_to_end"
+
+    def run():
+        extract_and_run(models, Path(path), out_dir, frame_skip, logger, stages=stages, render="none",
+                        show_progress=False, frame_range=(0, None))
+    report.rate(f"end_to_end/{spec.name}/skip{frame_skip}", spec.seconds, measure(run, repeat), "x realtime")
+
+def compare_to_baseline(report, baseline, tolerance):
+    """{metric: relative change, positive = faster} for the metrics both
+    runs have, and the names of those more than `tolerance` worse"""
+    changes, regressions = {}, []
+    for name, metric in report["metrics"].items():
+        base = baseline["metrics"].get(name)
+        if not base or not base["value"] or not metric["value"] or base["unit"] != metric["unit"]:
+            continue
+        ratio = metric["value"] / base["value"]
+        change = ratio - 1 if metric["better"] == "higher" else 1 / ratio - 1
+        changes[name] = round(change, 4)
+        if change < -tolerance:
+            regressions.append(name)
+    return changes, regressions
+
+def main():
+    global MIN_TIME
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="quick")
+    parser.add_argument("--videos", default="bench_videos", help="Directory for the synthetic videos")
+    parser.add_argument("--only", nargs="+", choices=GROUPS, default=list(GROUPS), help="Benchmark groups to run")
+    parser.add_argument("--models", nargs="+", default=["identity", "gaze", "headpose", "phone", "persons", "objects"])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=MIN_TIME, help="Minimum seconds per run")
+    parser.add_argument("--frame-skip", type=int, default=10, help="Stride of the end-to-end run")
+    parser.add_argument("--decode-chunk", type=int, default=16)
+    parser.add_argument("--threads", type=int, default=None,
+                        help="Cap torch/OpenCV/BLAS threads, for numbers comparable across runs")
+    parser.add_argument("--output", default=None, help="Write the report as JSON")
+    parser.add_argument("--baseline", default=None, help="Report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Relative slowdown against --baseline counted as a regression")
+    parser.add_argument("--save-baseline", default=None, help="Also write the report here as the new baseline")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    MIN_TIME = args.min_time
+    if args.threads:
+        from workers import limit_threads
+        limit_threads(args.threads)
+
+    preset = PRESETS[args.preset]
+    reference = preset["reference"]
+    specs = list(dict.fromkeys(preset["videos"] + [reference]))
+    paths = ensure_videos(specs, args.videos)
+    report = Report()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if "decode" in args.only:
+            bench_decode(report, {s: paths[s] for s in preset["videos"]}, preset["strides"], args.repeat,
+                         args.decode_chunk)
+        models = stages = None
+        if "models" in args.only or "end_to_end" in args.only:
+            frames = read_frames(paths[reference], preset["model_frames"], int(reference.fps))
+            models, stages = bench_models(report, args.models, frames, args.repeat)
+        if "jpeg" in args.only:
+            bench_jpeg(report, read_frames(paths[reference], preset["jpeg_frames"], 5), args.repeat, tmp)
+        if {"summary", "compare", "prompt"} & set(args.only):
+            root, events = bench_summary(report, args.models, preset["summary_rows"], reference.fps,
+                                         args.repeat, tmp)
+            if {"compare", "prompt"} & set(args.only):
+                comparison = bench_compare(report, root, args.repeat)
+                if "prompt" in args.only:
+                    bench_prompt(report, comparison, events, reference.fps, args.repeat)
+        if "end_to_end" in args.only:
+            if models:
+                bench_end_to_end(report, models, stages, reference, paths[reference], args.frame_skip,
+                                 args.repeat, tmp)
+            else:
+                report.skip("end_to_end", RuntimeError("no model could be loaded"))
+
+    result = {"preset": args.preset, "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "machine": machine(args.threads), "metrics": report.metrics, "skipped": report.skipped}
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        changes, regressions = compare_to_baseline(result, baseline, args.tolerance)
+        differs = [k for k in ("cpu", "cpus", "threads") if baseline.get("machine", {}).get(k) != result["machine"].get(k)]
+        result["baseline"] = {"path": args.baseline, "commit": baseline.get("machine", {}).get("commit"),
+                              "tolerance": args.tolerance, "changes": changes, "regressions": regressions}
+        print(f"\nAgainst {args.baseline} ({len(changes)} shared metrics, tolerance {args.tolerance:.0%}):")
+        if differs:
+            print(f"  warning: the baseline was measured with a different {', '.join(differs)}")
+        for name, change in sorted(changes.items(), key=lambda kv: kv[1]):
+            mark = "REGRESSION" if name in regressions else ""
+            print(f"  {name:<58} {change:>+8.1%} {mark}")
+        status = 1 if regressions else 0
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(result, f, indent=2)
+    sys.exit(status)
+
+if __name__ == "__main__":
+    main()
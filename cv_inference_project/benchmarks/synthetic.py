@@ -0,0 +1,197 @@
+"""Synthetic exam recordings and model results for the benchmarks, generated
+offline and deterministic for a seed.
+
+    python benchmarks/synthetic.py --output bench_videos/ --sizes 640x360 1280x720 \
+        --seconds 60 --codecs h264 mpeg4 --gops 30 250
+
+The scene is a student at a desk: a textured static background, a head that
+sways and turns, a phone-sized dark rectangle raised now and then and a
+second person walking through. Videos are encoded with an ffmpeg binary (the
+system one or the imageio-ffmpeg wheel's), which gives every codec below with
+an exact GOP; without one OpenCV's writer is used, which only knows mpeg4
+and mjpeg and always uses a GOP of 12. Existing files are reused.
+"""
+import os
+import math
+import shutil
+import argparse
+import subprocess
+from collections import namedtuple
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+# codec -> (ffmpeg encoder, container, OpenCV fourcc or None)
+CODECS = {
+    "h264": ("libx264", ".mp4", None),
+    "hevc": ("libx265", ".mkv", None),
+    "mpeg4": ("mpeg4", ".mp4", "mp4v"),
+    "mjpeg": ("mjpeg", ".avi", "MJPG"),
+}
+
+class VideoSpec(namedtuple("VideoSpec", "width height seconds fps codec gop seed",
+                           defaults=(30.0, "h264", 30, 0))):
+    @property
+    def name(self):
+        return f"exam_{self.width}x{self.height}_{self.seconds:g}s_{self.fps:g}fps_{self.codec}_g{self.gop}_s{self.seed}"
+
+    @property
+    def frames(self):
+        return int(round(self.seconds * self.fps))
+
+def parse_size(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+def ffmpeg_exe():
+    """The ffmpeg binary to encode with, or None"""
+    exe = os.environ.get("FFMPEG_BINARY") or shutil.which("ffmpeg")
+    if exe:
+        return exe
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        return None
+
+def episodes(t, period, length, phase=0.0):
+    """True during `length` seconds out of every `period` seconds"""
+    return (t + phase) % period < length
+
+def exam_frames(width, height, count, fps, seed=0):
+    """BGR frames of the synthetic exam scene"""
+    rng = np.random.default_rng(seed)
+    # Wall, desk and some low-frequency texture so the encoder has real work
+    background = np.empty((height, width, 3), dtype=np.uint8)
+    background[:] = (200, 190, 180)
+    background[int(0.7 * height):] = (60, 90, 120)
+    texture = cv2.resize(rng.integers(0, 40, (height // 16 + 1, width // 16 + 1, 1), dtype=np.uint8),
+                         (width, height), interpolation=cv2.INTER_CUBIC)
+    background = cv2.subtract(background, cv2.merge([texture] * 3))
+    s = height / 720
+    for i in range(count):
+        t = i / fps
+        img = background.copy()
+        # Sensor noise, different every frame
+        img = cv2.add(img, rng.integers(0, 6, img.shape, dtype=np.uint8))
+
+        cx = int(width / 2 + 40 * s * math.sin(t / 3) + (120 * s if episodes(t, 45, 4, 10) else 0))
+        cy = int(0.42 * height + 10 * s * math.sin(t / 2))
+        cv2.rectangle(img, (cx - int(170 * s), cy + int(110 * s)), (cx + int(170 * s), height),
+                      (90, 70, 50), -1)
+        cv2.ellipse(img, (cx, cy), (int(80 * s), int(105 * s)), 0, 0, 360, (140, 170, 215), -1)
+        turn = int(25 * s * math.sin(t / 5))
+        for dx in (-30, 30):
+            cv2.circle(img, (cx + int(dx * s) + turn, cy - int(20 * s)), max(2, int(8 * s)), (40, 30, 30), -1)
+        cv2.ellipse(img, (cx + turn, cy + int(45 * s)), (int(28 * s), int(8 * s)), 0, 0, 180, (60, 60, 150), 2)
+
+        if episodes(t, 60, 6, 20):
+            px, py = cx + int(150 * s), cy + int(60 * s)
+            cv2.rectangle(img, (px, py), (px + int(40 * s), py + int(80 * s)), (20, 20, 20), -1)
+        if episodes(t, 90, 5, 50):
+            x = int((t % 5) / 5 * (width + 200 * s)) - int(100 * s)
+            cv2.rectangle(img, (x, int(0.2 * height)), (x + int(100 * s), height), (70, 50, 80), -1)
+            cv2.circle(img, (x + int(50 * s), int(0.15 * height)), int(45 * s), (120, 150, 190), -1)
+        yield img
+
+def make_video(spec, path):
+    """Encode `spec` to `path`; returns the encoder used"""
+    encoder, _, fourcc = CODECS[spec.codec]
+    frames = exam_frames(spec.width, spec.height, spec.frames, spec.fps, spec.seed)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.stem + ".tmp" + path.suffix)
+    exe = ffmpeg_exe()
+    if exe:
+        cmd = [exe, "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "bgr24",
+               "-s", f"{spec.width}x{spec.height}", "-r", f"{spec.fps:g}", "-i", "-",
+               "-c:v", encoder, "-g", str(spec.gop), "-keyint_min", str(spec.gop), "-pix_fmt",
+               "yuvj420p" if spec.codec == "mjpeg" else "yuv420p"]
+        if spec.codec in ("h264", "hevc"):
+            cmd += ["-preset", "veryfast", "-sc_threshold", "0"]
+            if spec.codec == "hevc":
+                cmd += ["-x265-params", f"log-level=error:keyint={spec.gop}:min-keyint={spec.gop}:scenecut=0"]
+        elif spec.codec == "mpeg4":
+            cmd += ["-q:v", "5"]
+        proc = subprocess.Popen(cmd + [str(tmp)], stdin=subprocess.PIPE)
+        for img in frames:
+            proc.stdin.write(img.tobytes())
+        proc.stdin.close()
+        if proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed to encode {path.name}")
+        used = f"ffmpeg/{encoder}"
+    elif fourcc:
+        writer = cv2.VideoWriter(str(tmp), cv2.VideoWriter_fourcc(*fourcc), spec.fps, (spec.width, spec.height))
+        if not writer.isOpened():
+            raise RuntimeError(f"OpenCV cannot encode {spec.codec}")
+        for img in frames:
+            writer.write(img)
+        writer.release()
+        used = f"opencv/{fourcc} (GOP 12)"
+    else:
+        raise RuntimeError(f"Encoding {spec.codec} needs ffmpeg (install imageio-ffmpeg or set FFMPEG_BINARY)")
+    os.replace(tmp, path)
+    return used
+
+def ensure_videos(specs, root):
+    """{spec: path} with every video generated under `root` if missing"""
+    root = Path(root)
+    paths = {}
+    for spec in specs:
+        path = root / (spec.name + CODECS[spec.codec][1])
+        if not path.exists():
+            used = make_video(spec, path)
+            print(f"Generated {path.name} with {used}")
+        paths[spec] = path
+    return paths
+
+def _meta_value(field, kind, t, rng, active):
+    if kind == "bool":
+        # is_match/face_found are the normal state, everything else an anomaly
+        return not active if field in ("is_match", "face_found") else active
+    if kind == "int":
+        return int(active) + (1 if field == "person_count" else 0)
+    if kind == "float":
+        return float(math.sin(t / 7) * 20 + rng.normal(0, 2) + (30 if active else 0))
+    if kind == "text":
+        return "s01"
+    if field.endswith("_boxes"):
+        return [[float(v) for v in rng.uniform(0, 640, 4)] for _ in range(int(active))]
+    if field == "eye_points":
+        return [[float(v) for v in rng.uniform(0, 640, 2)] for _ in range(2)]
+    if field == "gallery_top":
+        return ["s01", "s02", "s03"]
+    return [float(v) for v in rng.uniform(0, 640, 4)]
+
+def synthetic_results(specs, frames, fps=30.0, seed=0):
+    """(frame, timestamp, {model: meta}) rows shaped like the models' declared
+    outputs ({model: registry.ModelSpec}), with anomaly episodes so events
+    and comparisons have something to find"""
+    rng = np.random.default_rng(seed)
+    for i, frame in enumerate(frames):
+        t = frame / fps
+        row = {}
+        for k, (model, spec) in enumerate(specs.items()):
+            active = bool(episodes(t, 60 + 15 * k, 6, 7 * k))
+            row[model] = {field: _meta_value(field, kind, t, rng, active) for field, kind in spec.outputs.items()}
+        yield frame, t, row
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", required=True, help="Directory for the videos")
+    parser.add_argument("--sizes", nargs="+", default=["1280x720"], help="WIDTHxHEIGHT")
+    parser.add_argument("--seconds", nargs="+", type=float, default=[60.0])
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--codecs", nargs="+", choices=sorted(CODECS), default=["h264"])
+    parser.add_argument("--gops", nargs="+", type=int, default=[30])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    specs = [VideoSpec(*parse_size(size), seconds, args.fps, codec, gop, args.seed)
+             for size in args.sizes for seconds in args.seconds for codec in args.codecs for gop in args.gops]
+    for spec, path in ensure_videos(specs, args.output).items():
+        print(path)
+
+if __name__ == "__main__":
+    main()
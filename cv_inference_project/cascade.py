@@ -0,0 +1,179 @@
+"""Gated execution of models: a declarative cascade policy.
+
+By default every model runs on every sampled frame. Under a policy the
+models without a Gate (in DEFAULT_POLICY persons and headpose, which give
+the person-count and face-present signals) still do, and each gated model
+runs on a frame only when
+
+- `every` seconds passed since it last ran (0: every frame),
+- one of its `when` triggers fired on this frame:
+    persons_changed    the person count differs from the previous frame
+    face_reacquired    a face is found after a frame without one
+    face_lost          no face after a frame with one
+- or it flagged (see flags.py) less than `hold` seconds ago, so a suspect
+  period is followed frame by frame and its events are not missed,
+
+and only if all its `needs` hold (face_present). The face signal comes from
+headpose's face_found, or from the face_mesh stage when headpose is not run.
+
+On frames where a gated model is skipped by its timing its last result is
+carried forward into the summary with "carried_forward": true (its fresh
+results get false), so compare_frames still sees a value on every frame.
+Carried results are not fed to the event segmenter or the sampler, and are
+not rendered. On frames where one of its `needs` fails the model gets no
+result at all (there is no face to have a gaze for), and it runs afresh on
+the next frame where they hold.
+
+A policy can be given as JSON, {model: {"every": ..., "when": [...],
+"hold": ..., "needs": [...]}}; missing keys take the Gate defaults.
+"""
+import json
+from collections import Counter, namedtuple
+
+from flags import is_flagged
+
+Gate = namedtuple("Gate", "every when hold needs", defaults=(0.0, (), 0.0, ()))
+
+TRIGGERS = ("persons_changed", "face_reacquired", "face_lost")
+CONDITIONS = ("face_present",)
+
+DEFAULT_POLICY = {
+    # ArcFace re-verification: every 10 s, when someone enters or leaves,
+    # when the face comes back, and densely for 3 s after a mismatch
+    "identity": Gate(every=10.0, when=("persons_changed", "face_reacquired"), hold=3.0),
+    "gaze": Gate(every=1.0, when=("face_reacquired",), hold=3.0, needs=("face_present",)),
+    # Both read the detector pass that persons needs on every frame anyway
+    "phone": Gate(every=2.0, when=("persons_changed",), hold=3.0),
+    "objects": Gate(every=5.0, when=("persons_changed",), hold=5.0),
+}
+
+def parse_policy(spec):
+    """{model: Gate} from {model: {field: value}}; raises ValueError"""
+    policy = {}
+    for model, fields in spec.items():
+        if not isinstance(fields, dict):
+            raise ValueError(f"{model}: expected an object, got {fields!r}")
+        unknown = set(fields) - set(Gate._fields)
+        if unknown:
+            raise ValueError(f"{model}: unknown gate fields {', '.join(sorted(unknown))}")
+        gate = Gate(**fields)
+        gate = gate._replace(every=float(gate.every), hold=float(gate.hold),
+                             when=tuple(gate.when), needs=tuple(gate.needs))
+        for name in gate.when:
+            if name not in TRIGGERS:
+                raise ValueError(f"{model}: unknown trigger {name!r} (one of {', '.join(TRIGGERS)})")
+        for name in gate.needs:
+            if name not in CONDITIONS:
+                raise ValueError(f"{model}: unknown condition {name!r} (one of {', '.join(CONDITIONS)})")
+        policy[model] = gate
+    return policy
+
+def load_policy(path=None):
+    """The policy in the JSON file `path`, or DEFAULT_POLICY, as plain
+    {model: {field: value}} (what run options carry); raises OSError or
+    ValueError"""
+    if path is None:
+        return {model: dict(gate._asdict()) for model, gate in DEFAULT_POLICY.items()}
+    with open(path) as f:
+        spec = json.load(f)
+    if not isinstance(spec, dict):
+        raise ValueError("a cascade policy is a JSON object of {model: gate}")
+    return {model: dict(gate._asdict()) for model, gate in parse_policy(spec).items()}
+
+class Cascade:
+    """Per-video state of a policy: which gated models run on each frame,
+    and their last results to carry forward"""
+
+    def __init__(self, models, policy=None):
+        policy = parse_policy(policy) if policy is not None else DEFAULT_POLICY
+        self.policy = {name: gate for name, gate in policy.items() if name in models}
+        self.frames = 0
+        self.inferred = Counter()
+        self.carried = Counter()
+        self.inapplicable = Counter()
+        self.passes = Counter()
+        self._persons = None
+        self._face = None
+        self._last_run = {}
+        self._hold_until = {}
+        self._last = {}
+
+    def signals(self, row, face=None):
+        """Triggers and conditions of a frame from its fresh ungated results
+        ({model: meta}); `face` is the face_mesh stage's verdict if known"""
+        fired = {}
+        persons = row.get("persons")
+        if isinstance(persons, dict) and "person_count" in persons:
+            count = persons["person_count"]
+            fired["persons_changed"] = self._persons is not None and count != self._persons
+            self._persons = count
+        headpose = row.get("headpose")
+        if isinstance(headpose, dict) and "face_found" in headpose:
+            face = bool(headpose["face_found"])
+        if face is not None:
+            fired["face_present"] = face
+            fired["face_reacquired"] = face and self._face is False
+            fired["face_lost"] = not face and self._face is True
+            self._face = face
+        return fired
+
+    def blocked(self, fired):
+        """The gated models whose `needs` fail on a frame with these signals"""
+        # An unknown condition (no signal for it in this run) does not block
+        return [name for name, gate in self.policy.items() if any(fired.get(c) is False for c in gate.needs)]
+
+    def due(self, t, fired):
+        """The gated models to run at time `t` given the frame's signals"""
+        self.frames += 1
+        names = []
+        blocked = self.blocked(fired)
+        for name, gate in self.policy.items():
+            if name in blocked:
+                self._last_run.pop(name, None)
+                continue
+            last = self._last_run.get(name)
+            if (last is None or t - last >= gate.every or t <= self._hold_until.get(name, -1.0)
+                    or any(fired.get(w) for w in gate.when)):
+                self._last_run[name] = t
+                names.append(name)
+        return names
+
+    def record(self, name, t, meta):
+        """A fresh result of gated model `name`; returns it marked as fresh"""
+        self.inferred[name] += 1
+        if isinstance(meta, dict):
+            if is_flagged(name, meta):
+                self._hold_until[name] = t + self.policy[name].hold
+            meta = dict(meta, carried_forward=False)
+        self._last[name] = meta
+        return meta
+
+    def carry(self, name):
+        """The last result of `name` marked as carried forward, or None if
+        it has not run yet in this video"""
+        last = self._last.get(name)
+        if not isinstance(last, dict):
+            return None
+        self.carried[name] += 1
+        return dict(last, carried_forward=True)
+
+    def drop(self, name):
+        """Forget the last result of `name` on a frame where its `needs`
+        fail, so it is not carried past that frame"""
+        self.inapplicable[name] += 1
+        self._last.pop(name, None)
+
+    def describe(self, model_count):
+        """Calls per gated model, all model calls against running every model
+        on every frame, and the shared stage passes (`passes`, counted by
+        the caller), which ungated models may still need on every frame"""
+        calls = self.frames * (model_count - len(self.policy)) + sum(self.inferred.values())
+        total = self.frames * model_count
+        parts = [f"{name} {self.inferred[name]} inferred/{self.carried[name]} carried"
+                 + (f"/{self.inapplicable[name]} not applicable" if self.inapplicable[name] else "")
+                 for name in self.policy]
+        parts.append(f"{calls} of {total} model calls" + (f" ({total / calls:.1f}x fewer)" if calls else ""))
+        if self.passes:
+            stages = ", ".join(f"{name} {n}" for name, n in self.passes.items())
+            parts.append(f"stage passes over {self.frames} frames: {stages}")
+        return "; ".join(parts)
@@ -0,0 +1,170 @@
+"""Resumable and incremental runs.
+
+RunManifest remembers which videos of an output directory are finished and
+with which configuration, so reruns skip them. VideoCheckpoint periodically
+commits one video's columnar summary so a crashed run resumes after the
+last committed frame instead of starting the video over.
+"""
+import os
+import json
+import hashlib
+from pathlib import Path
+
+# extract_and_run options that change the results; anything else (batching,
+# threads, queues) only changes how fast they are produced
+RESULT_OPTIONS = ("frame_skip", "render", "sampling", "json_summary")
+# Shared stages whose load options change the results of the models using them
+STAGE_OPTIONS = ("detector", "face_mesh")
+
+def write_json_atomic(path, data):
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def content_hash(path, chunk_size=4 << 20):
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+class RunManifest:
+    """<output_dir>/run_manifest.json: finished videos with the fingerprint
+    (content hash + model set + result options) they were produced with.
+
+    Content hashes are cached by path, size and mtime so unchanged videos are
+    only read once.
+    """
+
+    def __init__(self, output_dir):
+        self.path = Path(output_dir) / "run_manifest.json"
+        data = {}
+        if self.path.exists():
+            with open(self.path) as f:
+                data = json.load(f)
+        self.hashes = data.get("hashes", {})
+        self.videos = data.get("videos", {})
+
+    def video_hash(self, video_path):
+        st = os.stat(video_path)
+        key = str(Path(video_path).resolve())
+        cached = self.hashes.get(key)
+        if cached and cached["size"] == st.st_size and cached["mtime_ns"] == st.st_mtime_ns:
+            return cached["hash"]
+        digest = content_hash(video_path)
+        self.hashes[key] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "hash": digest}
+        return digest
+
+    def fingerprint(self, video_path, model_names, options, model_options=None):
+        config = {
+            "content": self.video_hash(video_path),
+            "models": sorted(model_names),
+            "model_options": {k: v for k, v in (model_options or {}).items()
+                              if k in model_names or k in STAGE_OPTIONS},
+            **{k: options.get(k) for k in RESULT_OPTIONS},
+        }
+        # Only when set, so fingerprints of earlier runs stay as they were
+        if options.get("frame_range"):
+            config["frame_range"] = list(options["frame_range"])
+        if options.get("cascade"):
+            config["cascade"] = options["cascade"]
+        return hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+    def lookup(self, key, fingerprint):
+        """The all_results entry of a finished video, if still valid"""
+        record = self.videos.get(key)
+        if (record and record["fingerprint"] == fingerprint
+                and Path(record["entry"]["summary_path"]).exists()):
+            return record["entry"]
+        return None
+
+    def record(self, key, fingerprint, entry):
+        self.videos[key] = {"fingerprint": fingerprint, "entry": entry}
+        self.save()
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        write_json_atomic(self.path, {"hashes": self.hashes, "videos": self.videos})
+
+class VideoCheckpoint:
+    """Periodic commit of one video's columnar summary.
+
+    Every `every` frames the summary_store.SummaryWriter is flushed and
+    <video>_checkpoint.json is atomically replaced with its committed row
+    counts, the last completed frame, the state of models that have one
+    (get_state/set_state) and of the event segmenter. Rows written after
+    the last checkpoint are cut off on resume.
+    """
+
+    def __init__(self, out_dir, video_name, fingerprint, every=100):
+        self.state_path = Path(out_dir) / f"{video_name}_checkpoint.json"
+        self.fingerprint = fingerprint
+        self.every = max(1, int(every))
+        self.last_frame = -1
+        self._added = 0
+        self._last_added = -1
+        self._models = {}
+        self._events = None
+
+    def resume(self, models, events=None):
+        """Restore model and event segmenter state. Returns the committed
+        {model: rows} of a previous partial run, or None when starting fresh."""
+        self._models = models
+        self._events = events
+        state = None
+        if self.state_path.exists():
+            with open(self.state_path) as f:
+                state = json.load(f)
+        if not state or state.get("fingerprint") != self.fingerprint:
+            return None
+
+        for model_name, model_state in state.get("models", {}).items():
+            if model_name in models and hasattr(models[model_name], "set_state"):
+                models[model_name].set_state(model_state)
+        if events is not None and "events" in state:
+            events.set_state(state["events"])
+        self.last_frame = state["last_frame"]
+        return state["rows"]
+
+    def add(self, idx, store):
+        """Count one finished frame; commits `store` every `every` frames.
+        Returns True if it committed."""
+        if self.due(idx):
+            self.flush(store)
+            return True
+        return False
+
+    def due(self, idx):
+        """Count one finished frame; True every `every` frames, when a
+        commit is due"""
+        self._added += 1
+        self._last_added = idx
+        return self._added % self.every == 0
+
+    def model_states(self):
+        return {name: model.get_state() for name, model in self._models.items() if hasattr(model, "get_state")}
+
+    def flush(self, store, last_frame=None, models=None):
+        """Commit `store` up to `last_frame` (default: the last counted
+        frame) with the model states `models` (default: the current ones),
+        for a commit made after inference has moved on"""
+        store.flush()
+        self.last_frame = self._last_added if last_frame is None else last_frame
+        state = {
+            "fingerprint": self.fingerprint,
+            "rows": store.rows,
+            "last_frame": self.last_frame,
+            "models": self.model_states() if models is None else models,
+        }
+        if self._events is not None:
+            state["events"] = self._events.get_state()
+        write_json_atomic(self.state_path, state)
+
+    def finish(self):
+        """The summary is complete; drop the checkpoint"""
+        if self.state_path.exists():
+            self.state_path.unlink()
@@ -0,0 +1,80 @@
+"""Run run_inference.py jobs on the warm inference service (service.py).
+
+    python service.py --preload identity gaze headpose phone persons &
+    python client.py --dataset-root downloads/ --output-dir out/ --models identity phone persons
+    python client.py --dataset-root downloads/ --output-dir out/ --videos downloads/s1/exam.mp4 \
+        --start-frame 0 --end-frame 900
+
+Takes the same arguments as run_inference.py, plus --socket/--server to
+reach the service. The job's log is printed as it runs and the exit status
+is the job's. Paths are sent absolute, so the service may run from any
+directory.
+"""
+import sys
+import json
+from pathlib import Path
+
+from run_inference import build_parser, check_args
+from service import SOCKET, connect
+
+PATH_ARGS = ("dataset_root", "output_dir", "gallery", "ingest", "videos", "metrics_file", "cascade_policy")
+
+def job_params(args):
+    """The parsed arguments as sent to the service, with absolute paths"""
+    params = {k: v for k, v in vars(args).items() if k not in ("socket", "server")}
+    for name in PATH_ARGS:
+        value = params.get(name)
+        if isinstance(value, list):
+            params[name] = [str(Path(v).resolve()) for v in value]
+        elif value is not None:
+            params[name] = str(Path(value).resolve())
+    return params
+
+def submit(params, socket_path=None, url=None):
+    """Send a job; returns the response streaming its messages. Raises
+    OSError if the service cannot be reached, ValueError if it rejects the job"""
+    conn = connect(socket_path, url)
+    body = json.dumps({"args": params})
+    conn.request("POST", "/run", body=body, headers={"Content-Type": "application/json"})
+    response = conn.getresponse()
+    if response.status != 200:
+        raise ValueError(json.loads(response.read() or b"{}").get("error", f"HTTP {response.status}"))
+    return response
+
+def follow(response, on_log=print, on_result=None):
+    """Hand the job's messages to the callbacks as they arrive; returns the
+    job's exit status"""
+    status = 1
+    for line in response:
+        message = json.loads(line)
+        if "log" in message:
+            on_log(message["log"])
+        elif "result" in message and on_result is not None:
+            on_result(message["result"]["key"], message["result"]["entry"])
+        elif "status" in message:
+            status = message["status"]
+    response.close()
+    return status
+
+def main():
+    parser = build_parser()
+    service = parser.add_argument_group("service")
+    service.add_argument("--socket", default=None, help=f"Unix socket of the service (default {SOCKET})")
+    service.add_argument("--server", default=None, help="http://host:port of a service started with --port")
+    args = parser.parse_args()
+    check_args(parser, args)
+
+    where = args.server or args.socket or SOCKET
+    try:
+        response = submit(job_params(args), args.socket, args.server)
+    except OSError as e:
+        print(f"No inference service at {where} ({str(e)}); start one with `python service.py` "
+              f"or run run_inference.py directly", file=sys.stderr)
+        sys.exit(2)
+    except ValueError as e:
+        print(f"The inference service rejected the job: {str(e)}", file=sys.stderr)
+        sys.exit(2)
+    sys.exit(follow(response, on_log=lambda line: print(line, flush=True)))
+
+if __name__ == "__main__":
+    main()
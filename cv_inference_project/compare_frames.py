@@ -1,103 +1,253 @@
+"""Frame comparisons over a run_inference summary.
+
+FrameIndex loads a summary once into per-model arrays aligned on the sorted
+union of inferred frames (NaN where a model has no result for a frame), so
+deltas, lags, rolling windows and any number of range queries are NumPy
+operations on slices of the same arrays.
+
+    python compare_frames.py --summary out/student/exam/exam_summary \
+        --range 100 500 --range 0 90000 --lag 1 10 --window 5 --output comparison.json
+"""
 import json
 import argparse
 import numpy as np
-from collections import defaultdict
 
-def main():
-    parser = argparse.ArgumentParser(description='Compare consecutive frames in range')
-    parser.add_argument('--summary', required=True, help='Path to summary.json')
-    parser.add_argument('--frame1', type=int, required=True, help='Start frame index')
-    parser.add_argument('--frame2', type=int, required=True, help='End frame index')
-    parser.add_argument('--output', required=True, help='Output JSON file path')
-    args = parser.parse_args()
+from summary_store import load_summary, ModelColumns, SCALAR_KINDS
 
-    with open(args.summary, 'r') as f:
-        summary = json.load(f)
+# Pairwise output of the original tool: model -> {output key: (field, op)}
+PAIR_METRICS = {
+    "gaze": {"angle_diff": ("gaze_angle", "absdiff"), "flag_changed": ("gaze_away", "changed")},
+    "headpose": {"yaw_diff": ("yaw", "absdiff"), "pitch_diff": ("pitch", "absdiff"),
+                 "roll_diff": ("roll", "absdiff")},
+    "identity": {"distance_diff": ("distance", "absdiff"), "match_changed": ("is_match", "changed")},
+    "persons": {"count_diff": ("person_count", "diff")},
+    "phone": {"count_diff": ("phone_count", "diff")},
+}
 
-    # Initialize comparison structure
-    comparison = {
-        "frame_range": [args.frame1, args.frame2],
-        "pairwise_comparisons": []
-    }
+def _numeric_columns(entries):
+    """(frames, {field: float values}) of a model's bool/int/float fields"""
+    if isinstance(entries, ModelColumns):
+        fields = {}
+        for field, column in entries.columns.items():
+            if column["kind"] in SCALAR_KINDS:
+                values = np.asarray(entries.column(field), dtype=np.float64)
+                fields[field] = np.where(entries.valid(field), values, np.nan)
+        return np.asarray(entries.frame), np.asarray(entries.timestamp), fields
 
-    # Get all frames in range for each model
-    model_frames = {
-        model: sorted([f for f in frames if args.frame1 <= f['frame'] <= args.frame2], 
-                     key=lambda x: x['frame'])
-        for model, frames in summary.items()
+    entries = list(entries)
+    frames = np.array([e['frame'] for e in entries], dtype=np.int64)
+    timestamps = np.array([e['timestamp'] for e in entries], dtype=np.float64)
+    names = []
+    for e in entries:
+        names.extend(k for k, v in e['meta'].items()
+                     if isinstance(v, (bool, int, float)) and k not in names)
+    fields = {
+        name: np.array([e['meta'].get(name, np.nan) for e in entries], dtype=np.float64)
+        for name in names
     }
+    return frames, timestamps, fields
 
-    # Get all unique frame numbers in range
-    all_frames = sorted(set(
-        f['frame'] 
-        for frames in model_frames.values() 
-        for f in frames
-    ))
-
-    # Process each consecutive pair
-    for i in range(1, len(all_frames)):
-        frame_prev = all_frames[i-1]
-        frame_current = all_frames[i]
-        
-        pair_result = {
-            "frame1": frame_prev,
-            "frame2": frame_current,
-            "results": {}
-        }
+def _sparse_table(values):
+    """Levels of running maxima for O(1) range-max queries"""
+    levels = [values]
+    width = 1
+    while 2 * width <= len(values):
+        prev = levels[-1]
+        levels.append(np.maximum(prev[:-width], prev[width:]))
+        width *= 2
+    return levels
+
+def _range_max(levels, start, stop):
+    """max(values[start[i]:stop[i]]) for every i; -inf for empty ranges"""
+    length = stop - start
+    out = np.full(len(start), -np.inf)
+    nonempty = length > 0
+    k = np.zeros(len(start), dtype=np.int64)
+    k[nonempty] = np.floor(np.log2(length[nonempty])).astype(np.int64)
+    for level in np.unique(k[nonempty]):
+        sel = nonempty & (k == level)
+        table = levels[level]
+        out[sel] = np.maximum(table[start[sel]], table[stop[sel] - (1 << level)])
+    return out
+
+class FrameIndex:
+    """A summary loaded once for any number of comparisons.
+
+    `frames`/`timestamps` are the sorted union of inferred frames; for each
+    model `present[model]` marks the frames it has a result for and
+    `fields[model][field]` holds its numeric fields (bools as 0/1) aligned on
+    `frames`.
+    """
+
+    def __init__(self, summary):
+        columns = {model: _numeric_columns(entries) for model, entries in summary.items()}
+        all_frames = [c[0] for c in columns.values()]
+        self.frames = np.unique(np.concatenate(all_frames)) if all_frames else np.empty(0, np.int64)
+        self.timestamps = np.full(len(self.frames), np.nan)
+        self.present, self.fields = {}, {}
+        for model, (frames, timestamps, fields) in columns.items():
+            pos = np.searchsorted(self.frames, frames)
+            self.timestamps[pos] = timestamps
+            present = np.zeros(len(self.frames), dtype=bool)
+            present[pos] = True
+            self.present[model] = present
+            self.fields[model] = {}
+            for field, values in fields.items():
+                aligned = np.full(len(self.frames), np.nan)
+                aligned[pos] = values
+                self.fields[model][field] = aligned
+
+    @classmethod
+    def load(cls, path):
+        return cls(load_summary(path))
+
+    def span(self, frame1=None, frame2=None):
+        """Slice of the index covering frames frame1..frame2 (inclusive)"""
+        lo = 0 if frame1 is None else np.searchsorted(self.frames, frame1, 'left')
+        hi = len(self.frames) if frame2 is None else np.searchsorted(self.frames, frame2, 'right')
+        return slice(int(lo), int(hi))
+
+    def series(self, model, field, frame1=None, frame2=None):
+        s = self.span(frame1, frame2)
+        return self.frames[s], self.fields[model][field][s]
 
-        for model, frames in model_frames.items():
-            # Find the specific frames we want to compare
-            prev_data = next((f['meta'] for f in frames if f['frame'] == frame_prev), None)
-            curr_data = next((f['meta'] for f in frames if f['frame'] == frame_current), None)
-            
-            if not prev_data or not curr_data:
+    def delta(self, model, field, lag=1, frame1=None, frame2=None, op="diff"):
+        """Compare every inferred frame in the range with the one `lag`
+        inferred frames earlier (both inside the range). `op` is "diff",
+        "absdiff" or "changed". Returns (prev_frames, frames, values,
+        both_present); values are NaN where either frame lacks the field."""
+        if lag < 1:
+            raise ValueError(f"lag must be at least 1, got {lag}")
+        s = self.span(frame1, frame2)
+        values = self.fields[model][field][s]
+        present = self.present[model][s]
+        frames = self.frames[s]
+        prev, cur = values[:-lag], values[lag:]
+        if op == "changed":
+            out = np.where(np.isnan(prev) | np.isnan(cur), np.nan, (prev != cur).astype(np.float64))
+        else:
+            with np.errstate(invalid='ignore'):
+                out = cur - prev
+            if op == "absdiff":
+                out = np.abs(out)
+        return frames[:-lag], frames[lag:], out, present[:-lag] & present[lag:]
+
+    def rolling(self, model, field, seconds, frame1=None, frame2=None):
+        """Mean, std and max of the finite values in the `seconds` of video
+        ending at each frame of the range (NaN where the window is empty)"""
+        s = self.span(frame1, frame2)
+        values = self.fields[model][field][s]
+        ts = self.timestamps[s]
+        ok = np.isfinite(values)
+        v = np.where(ok, values, 0.0)
+        csum = np.concatenate(([0.0], np.cumsum(v)))
+        csq = np.concatenate(([0.0], np.cumsum(v * v)))
+        ccount = np.concatenate(([0], np.cumsum(ok)))
+
+        stop = np.arange(1, len(values) + 1)
+        start = np.searchsorted(ts, ts - seconds, 'right')
+        count = ccount[stop] - ccount[start]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = (csum[stop] - csum[start]) / count
+            var = (csq[stop] - csq[start]) / count - mean * mean
+        std = np.sqrt(np.maximum(var, 0.0))
+
+        high = _range_max(_sparse_table(np.where(ok, values, -np.inf)), start, stop)
+        return {"frames": self.frames[s], "mean": mean, "std": std,
+                "max": np.where(np.isneginf(high), np.nan, high)}
+
+    def compare(self, frame1=None, frame2=None):
+        """The original pairwise report: every pair of consecutive inferred
+        frames in the range with the PAIR_METRICS of the models present on
+        both frames"""
+        s = self.span(frame1, frame2)
+        frames = self.frames[s]
+        pairs = [{"frame1": a, "frame2": b, "results": {}}
+                 for a, b in zip(frames[:-1].tolist(), frames[1:].tolist())]
+        for model, metrics in PAIR_METRICS.items():
+            if model not in self.fields or not all(f in self.fields[model] for f, _ in metrics.values()):
                 continue
-                
-            if model == "gaze":
-                angle_diff = abs(prev_data['gaze_angle'] - curr_data['gaze_angle'])
-                flag_changed = prev_data['gaze_away'] != curr_data['gaze_away']
-                pair_result["results"]["gaze"] = {
-                    "angle_diff": angle_diff,
-                    "flag_changed": flag_changed
-                }
-                
-            elif model == "headpose":
-                yaw_diff = abs(prev_data['yaw'] - curr_data['yaw'])
-                pitch_diff = abs(prev_data['pitch'] - curr_data['pitch'])
-                roll_diff = abs(prev_data['roll'] - curr_data['roll'])
-                pair_result["results"]["headpose"] = {
-                    "yaw_diff": yaw_diff,
-                    "pitch_diff": pitch_diff,
-                    "roll_diff": roll_diff
-                }
-                
-            elif model == "identity":
-                dist_diff = abs(prev_data['distance'] - curr_data['distance'])
-                match_changed = prev_data['is_match'] != curr_data['is_match']
-                pair_result["results"]["identity"] = {
-                    "distance_diff": dist_diff,
-                    "match_changed": match_changed
-                }
-                
-            elif model == "persons":
-                count_diff = curr_data['person_count'] - prev_data['person_count']
-                pair_result["results"]["persons"] = {
-                    "count_diff": count_diff
-                }
-                
-            elif model == "phone":
-                count_diff = curr_data['phone_count'] - prev_data['phone_count']
-                pair_result["results"]["phone"] = {
-                    "count_diff": count_diff
-                }
-
-        comparison["pairwise_comparisons"].append(pair_result)
-
-    # Calculate some aggregate statistics
-    comparison["total_comparisons"] = len(comparison["pairwise_comparisons"])
-    
+            both = self.present[model][s]
+            both = np.flatnonzero(both[:-1] & both[1:])
+            columns = []
+            for field, op in metrics.values():
+                values = self.delta(model, field, 1, frame1, frame2, op)[2][both]
+                if op == "changed":
+                    values = values == 1
+                elif op == "diff" and field.endswith("_count"):
+                    # A missing count has no difference: None, not INT64_MIN
+                    finite = np.isfinite(values)
+                    counts = values[finite].astype(np.int64).tolist()
+                    values = np.full(len(values), None, dtype=object)
+                    values[finite] = counts
+                columns.append(values.tolist())
+            keys = list(metrics)
+            for i, row in zip(both.tolist(), zip(*columns)):
+                pairs[i]["results"][model] = dict(zip(keys, row))
+        return {
+            "frame_range": [frame1, frame2],
+            "pairwise_comparisons": pairs,
+            "total_comparisons": len(pairs),
+        }
+
+    def stats(self, frame1=None, frame2=None, lags=(1,), windows=()):
+        """Per model and field: mean/max |delta| and number of changes at
+        each lag, and the peak rolling mean/std/max for each window"""
+        out = {}
+        for model, fields in self.fields.items():
+            for field in fields:
+                entry = out.setdefault(model, {}).setdefault(field, {})
+                for lag in lags:
+                    _, _, diffs, _ = self.delta(model, field, lag, frame1, frame2, "absdiff")
+                    finite = diffs[np.isfinite(diffs)]
+                    entry[f"lag_{lag}"] = {
+                        "mean_abs": float(finite.mean()) if finite.size else None,
+                        "max_abs": float(finite.max()) if finite.size else None,
+                        "changes": int(np.count_nonzero(finite)),
+                    }
+                for seconds in windows:
+                    roll = self.rolling(model, field, seconds, frame1, frame2)
+                    entry[f"window_{seconds:g}s"] = {
+                        name: (float(np.nanmax(roll[name])) if np.isfinite(roll[name]).any() else None)
+                        for name in ("mean", "std", "max")
+                    }
+        return out
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare consecutive frames in range')
+    parser.add_argument('--summary', required=True, help='<video>_summary/ directory or summary.json')
+    parser.add_argument('--frame1', type=int, help='Start frame index')
+    parser.add_argument('--frame2', type=int, help='End frame index')
+    parser.add_argument('--range', nargs=2, type=int, action='append', default=[], metavar=('START', 'END'),
+                        help='Frame range to compare; repeat for several ranges')
+    parser.add_argument('--lag', nargs='+', type=int, default=[],
+                        help='Also report deltas against the frame N inferred frames earlier')
+    parser.add_argument('--window', nargs='+', type=float, default=[],
+                        help='Also report rolling mean/std/max over N seconds')
+    parser.add_argument('--no-pairs', action='store_true', help='Skip the per-pair listing')
+    parser.add_argument('--output', required=True, help='Output JSON file path')
+    args = parser.parse_args()
+    if any(lag < 1 for lag in args.lag):
+        parser.error("--lag values must be at least 1")
+    if any(seconds <= 0 for seconds in args.window):
+        parser.error("--window values must be positive")
+
+    ranges = [tuple(r) for r in args.range]
+    if args.frame1 is not None or args.frame2 is not None or not ranges:
+        ranges.insert(0, (args.frame1, args.frame2))
+
+    index = FrameIndex.load(args.summary)
+    comparisons = []
+    for frame1, frame2 in ranges:
+        comparison = index.compare(frame1, frame2)
+        if args.no_pairs:
+            comparison["pairwise_comparisons"] = []
+        if args.lag or args.window:
+            comparison["stats"] = index.stats(frame1, frame2, args.lag or [1], args.window)
+        comparisons.append(comparison)
+
     with open(args.output, 'w') as f:
-        json.dump(comparison, f, indent=2)
+        json.dump(comparisons[0] if len(comparisons) == 1 else comparisons, f, indent=2)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,149 @@
+"""Online segmentation of per-frame model results into timed events.
+
+EventSegmenter is fed every inferred frame while extract_and_run is running
+and keeps one small state machine per rule:
+
+- an event opens once `enter` consecutive results are active (debounce),
+- stays open through inactive results for up to `release` seconds
+  (hysteresis, so a phone hidden for a moment does not split the event),
+- and is kept only if it lasted at least `min_duration` seconds.
+
+Each event is a compact record: start/end time and frame, peak value and the
+number of active frames. The per-video list is written to
+<video>_events.json; replay an existing summary with
+
+    python events.py --summary out/student/exam/exam_summary
+"""
+import argparse
+from collections import namedtuple
+from pathlib import Path
+
+# value(meta) -> float; the frame is active when value >= threshold
+Rule = namedtuple("Rule", "model value threshold enter release min_duration")
+
+RULES = {
+    "gaze_away": Rule("gaze", lambda m: float(bool(m.get("gaze_away"))), 1.0, 2, 1.0, 0.5),
+    "face_lost": Rule("headpose", lambda m: float(not m.get("face_found", True)), 1.0, 2, 1.0, 0.5),
+    "identity_mismatch": Rule("identity", lambda m: float(not m.get("is_match", True)), 1.0, 2, 2.0, 0.0),
+    "phone": Rule("phone", lambda m: float(m.get("phone_count", 0)), 1.0, 1, 2.0, 0.0),
+    "multiple_persons": Rule("persons", lambda m: float(m.get("person_count", 1)), 2.0, 2, 2.0, 0.0),
+    "objects": Rule("objects", lambda m: float(sum(v for k, v in m.items() if k.endswith("_count"))),
+                    1.0, 2, 2.0, 0.0),
+}
+
+def clock(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes:02d}:{seconds:02d}"
+
+class EventSegmenter:
+    """Turns a stream of {model: meta} rows into closed event records"""
+
+    def __init__(self, rules=None):
+        self.rules = RULES if rules is None else rules
+        self.events = []
+        # Per rule: the event being built (pending until `enter` is reached)
+        self._open = {}
+
+    def update(self, frame, timestamp, results):
+        """Feed one inferred frame's {model_name: meta}"""
+        for name, rule in self.rules.items():
+            meta = results.get(rule.model)
+            if meta is None:
+                continue
+            try:
+                value = rule.value(meta)
+            except (TypeError, ValueError):
+                continue
+            current = self._open.get(name)
+            if value >= rule.threshold:
+                if current is not None and timestamp - current["end"] > rule.release:
+                    # No inactive result arrived in between (sparse sampling)
+                    self._close(name)
+                    current = None
+                if current is None:
+                    current = self._open[name] = {
+                        "event": name, "model": rule.model, "start": timestamp, "end": timestamp,
+                        "start_frame": frame, "end_frame": frame, "peak": value, "frames": 0,
+                        "streak": 0, "confirmed": False,
+                    }
+                current.update(end=timestamp, end_frame=frame, peak=max(current["peak"], value))
+                current["frames"] += 1
+                current["streak"] += 1
+                if current["streak"] >= rule.enter:
+                    current["confirmed"] = True
+            elif current is not None:
+                current["streak"] = 0
+                if not current["confirmed"] or timestamp - current["end"] > rule.release:
+                    self._close(name)
+
+    def _close(self, name):
+        current = self._open.pop(name)
+        rule = self.rules[name]
+        if current["confirmed"] and current["end"] - current["start"] >= rule.min_duration:
+            record = {k: v for k, v in current.items() if k not in ("streak", "confirmed")}
+            record["start"] = round(record["start"], 3)
+            record["end"] = round(record["end"], 3)
+            self.events.append(record)
+
+    def finish(self):
+        """Close everything still open; events sorted by start time"""
+        for name in list(self._open):
+            self._close(name)
+        self.events.sort(key=lambda e: (e["start"], e["event"]))
+        return self.events
+
+    def get_state(self):
+        return {"events": self.events, "open": self._open}
+
+    def set_state(self, state):
+        self.events = list(state.get("events", []))
+        self._open = dict(state.get("open", {}))
+
+def counts(events):
+    out = {}
+    for event in events:
+        out[event["event"]] = out.get(event["event"], 0) + 1
+    return out
+
+def save_events(path, events):
+    from checkpoint import write_json_atomic
+    write_json_atomic(path, {"counts": counts(events), "events": events})
+    return path
+
+def segment_summary(summaries, rules=None):
+    """Replay a whole summary ({model: entries}) through a segmenter;
+    results carried forward by a cascade policy are skipped, as they are
+    while processing"""
+    from flags import is_carried
+
+    rows = {}
+    for model_name, entries in summaries.items():
+        for entry in entries:
+            if is_carried(entry["meta"]):
+                continue
+            row = rows.setdefault(entry["frame"], (entry["timestamp"], {}))
+            row[1][model_name] = entry["meta"]
+    segmenter = EventSegmenter(rules)
+    for frame in sorted(rows):
+        segmenter.update(frame, *rows[frame])
+    return segmenter.finish()
+
+def main():
+    parser = argparse.ArgumentParser(description="Segment a summary into timed events")
+    parser.add_argument("--summary", required=True, help="<video>_summary/ directory or <video>_summary.json")
+    parser.add_argument("--output", default=None, help="Defaults to <video>_events.json next to the summary")
+    args = parser.parse_args()
+
+    from summary_store import load_summary
+    summary = Path(args.summary)
+    events = segment_summary(load_summary(summary))
+    stem = summary.name[:-len(".json")] if summary.suffix == ".json" else summary.name
+    output = Path(args.output) if args.output else summary.with_name(stem.replace("_summary", "_events") + ".json")
+    save_events(output, events)
+    for event in events:
+        print(f"{event['event']:<18} {clock(event['start'])}-{clock(event['end'])}  "
+              f"peak {event['peak']:g}, {event['frames']} frames")
+    print(f"{len(events)} events written to {output}")
+
+if __name__ == "__main__":
+    main()
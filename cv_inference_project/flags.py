@@ -0,0 +1,26 @@
+"""Which per-frame model outputs count as suspicious.
+
+Shared by the renderer and anything else that needs to pick "interesting"
+frames out of a summary, so the rules live in one place.
+"""
+
+# What render.py draws: nothing, flagged results, every inferred result (one
+# image per model and frame), or one composite image per inferred frame
+RENDER_MODES = ("none", "events", "all", "composite")
+
+FLAGS = {
+    "gaze": lambda m: bool(m.get("gaze_away")),
+    "identity": lambda m: not m.get("is_match", True),
+    "phone": lambda m: m.get("phone_count", 0) > 0,
+    "persons": lambda m: m.get("person_count", 1) > 1,
+    "objects": lambda m: any(v for k, v in m.items() if k.endswith("_count")),
+}
+
+def is_flagged(model_name, meta):
+    check = FLAGS.get(model_name)
+    return bool(check and meta and check(meta))
+
+def is_carried(meta):
+    """A result repeated from an earlier frame by a cascade policy (see
+    cascade.py) rather than inferred on this one"""
+    return isinstance(meta, dict) and bool(meta.get("carried_forward"))
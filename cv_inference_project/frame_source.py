@@ -0,0 +1,125 @@
+import queue
+import threading
+import time
+import logging
+
+import cv2
+
+logger = logging.getLogger("inference")
+
+_DONE = object()
+
+class Frame:
+    """A decoded frame. Decord delivers RGB; the BGR copy is made only if a
+    consumer asks for it, and at most once."""
+    __slots__ = ("idx", "rgb", "_bgr")
+
+    def __init__(self, idx, rgb):
+        self.idx = idx
+        self.rgb = rgb
+        self._bgr = None
+
+    @property
+    def bgr(self):
+        if self._bgr is None:
+            self._bgr = cv2.cvtColor(self.rgb, cv2.COLOR_RGB2BGR)
+        return self._bgr
+
+    def as_color(self, color):
+        return self.rgb if color == "rgb" else self.bgr
+
+class FrameSource:
+    """Iterates sampled frames of a decord.VideoReader in order.
+
+    Indices are read in chunks of `chunk_size` with `get_batch`, so decord
+    decodes forward through each GOP instead of seeking for every frame.
+    With `prefetch > 0` a background thread decodes up to `prefetch` chunks
+    ahead of the consumer. Chunk decode times are recorded as `stage` into
+    `metrics` (a metrics.VideoMetrics) if given.
+    """
+
+    def __init__(self, vr, indices, chunk_size=16, prefetch=1, metrics=None, stage="decode"):
+        self.vr = vr
+        self.indices = list(indices)
+        self.chunk_size = max(1, int(chunk_size))
+        self.prefetch = max(0, int(prefetch))
+        self.decoded = 0
+        self.decode_time = 0.0
+        self.metrics = metrics
+        self.stage = stage
+        self._queue = None
+
+    def __len__(self):
+        return len(self.indices)
+
+    @property
+    def decode_fps(self):
+        return self.decoded / self.decode_time if self.decode_time else 0.0
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _chunks(self):
+        for i in range(0, len(self.indices), self.chunk_size):
+            yield self.indices[i:i + self.chunk_size]
+
+    def _read_chunk(self, chunk):
+        start = time.perf_counter()
+        try:
+            frames = list(zip(chunk, self.vr.get_batch(chunk).asnumpy()))
+        except Exception as e:
+            # Fall back to single reads so one corrupt frame only loses itself
+            logger.warning(f"Batch decode of frames {chunk[0]}-{chunk[-1]} failed, reading one by one: {str(e)}")
+            frames = []
+            for idx in chunk:
+                try:
+                    frames.append((idx, self.vr[idx].asnumpy()))
+                except Exception as e:
+                    logger.error(f"Error processing frame {idx}: {str(e)}")
+        elapsed = time.perf_counter() - start
+        self.decode_time += elapsed
+        self.decoded += len(frames)
+        if self.metrics is not None:
+            self.metrics.observe(self.stage, elapsed, len(frames))
+        return [Frame(idx, rgb) for idx, rgb in frames]
+
+    def __iter__(self):
+        if self.prefetch == 0:
+            for chunk in self._chunks():
+                yield from self._read_chunk(chunk)
+            return
+
+        q = self._queue = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        def decode():
+            try:
+                for chunk in self._chunks():
+                    if stop.is_set():
+                        return
+                    put(self._read_chunk(chunk))
+            except Exception as e:
+                logger.error(f"Decoder thread failed: {str(e)}")
+            finally:
+                put(_DONE)
+
+        worker = threading.Thread(target=decode, name="frame-source", daemon=True)
+        worker.start()
+        try:
+            while True:
+                item = q.get()
+                if item is _DONE:
+                    break
+                yield from item
+        finally:
+            stop.set()
+            worker.join()
@@ -0,0 +1,199 @@
+"""Cohort-wide face embedding gallery.
+
+Enrolled ArcFace embeddings live in one contiguous, L2-normalized float32
+matrix (optionally int8-quantized with a per-row scale) that is
+memory-mapped from disk, so every process shares the same pages. A query is
+matched against all students with one matrix-vector product.
+
+    python gallery.py enroll --gallery gallery/ --source downloads/ --frames 5
+    python gallery.py info --gallery gallery/
+"""
+import os
+import json
+import argparse
+import logging
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger("inference")
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp')
+VIDEO_EXTS = ('.mp4', '.mov', '.mkv', '.avi')
+
+def normalize(vecs):
+    vecs = np.atleast_2d(np.asarray(vecs, dtype=np.float32))
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+    return vecs / np.maximum(norms, 1e-12)
+
+def quantize(vecs):
+    """Symmetric per-row int8 quantization: vecs ~= q * scale[:, None]"""
+    scales = np.abs(vecs).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    q = np.clip(np.rint(vecs / scales[:, None]), -127, 127).astype(np.int8)
+    return q, scales.astype(np.float32)
+
+class EmbeddingGallery:
+    """Memory-mapped gallery in `root`:
+
+    labels.json           one student id per row
+    embeddings.npy        (N, D) float32, L2-normalized
+    embeddings_int8.npy   (N, D) int8 + scales.npy (N,) float32, if quantized
+    """
+    BLOCK = 65536
+
+    def __init__(self, root, use_int8=None):
+        self.root = Path(root)
+        with open(self.root / "labels.json") as f:
+            self.labels = json.load(f)
+        int8_path = self.root / "embeddings_int8.npy"
+        self.int8 = int8_path.exists() if use_int8 is None else use_int8
+        if self.int8:
+            self.matrix = np.load(int8_path, mmap_mode='r')
+            self.scales = np.load(self.root / "scales.npy", mmap_mode='r')
+        else:
+            self.matrix = np.load(self.root / "embeddings.npy", mmap_mode='r')
+            self.scales = None
+        self._rows = {}
+        for i, label in enumerate(self.labels):
+            self._rows.setdefault(label, []).append(i)
+        # Student index of every row, for the best score per student
+        self._students = list(self._rows)
+        self._student_ids = np.empty(len(self.labels), dtype=np.intp)
+        for j, rows in enumerate(self._rows.values()):
+            self._student_ids[rows] = j
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __contains__(self, label):
+        return label in self._rows
+
+    def scores(self, vec):
+        """Cosine similarity of `vec` to every enrolled row"""
+        q = normalize(vec)[0]
+        if self.scales is None:
+            return np.asarray(self.matrix @ q)
+        out = np.empty(len(self.labels), dtype=np.float32)
+        for i in range(0, len(out), self.BLOCK):
+            block = self.matrix[i:i + self.BLOCK]
+            out[i:i + len(block)] = (block @ q) * self.scales[i:i + len(block)]
+        return out
+
+    def label_score(self, scores, label):
+        """Best score of `label`'s rows, or None if it is not enrolled"""
+        rows = self._rows.get(label)
+        return None if rows is None else float(scores[rows].max())
+
+    def search(self, vec, k=3):
+        """Top-k (label, score) pairs, best row per student, best first"""
+        return self.top_k(self.scores(vec), k) if self.labels else []
+
+    def top_k(self, scores, k=3):
+        if not len(scores) or k < 1:
+            return []
+        # Best row per student first, so however many vectors a student has
+        # enrolled the result still holds k distinct students
+        best = np.full(len(self._students), -np.inf, dtype=np.float32)
+        np.maximum.at(best, self._student_ids, np.asarray(scores, dtype=np.float32))
+        n = min(len(best), k)
+        top = np.argpartition(-best, n - 1)[:n]
+        top = top[np.argsort(-best[top], kind="stable")]
+        return [(self._students[j], float(best[j])) for j in top]
+
+    @staticmethod
+    def write(root, labels, vecs, int8=False):
+        """(Re)write a gallery with the given rows"""
+        root = Path(root)
+        root.mkdir(parents=True, exist_ok=True)
+        vecs = normalize(vecs) if len(vecs) else np.empty((0, 512), dtype=np.float32)
+        _save_npy(root / "embeddings.npy", vecs)
+        if int8:
+            q, scales = quantize(vecs)
+            _save_npy(root / "embeddings_int8.npy", q)
+            _save_npy(root / "scales.npy", scales)
+        else:
+            for name in ("embeddings_int8.npy", "scales.npy"):
+                if (root / name).exists():
+                    (root / name).unlink()
+        tmp = root / "labels.json.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(list(labels), f)
+        os.replace(tmp, root / "labels.json")
+
+    @classmethod
+    def enroll(cls, root, rows, int8=False):
+        """Replace the rows of the students in `rows` ({label: [vec, ...]})
+        and keep everybody else"""
+        root = Path(root)
+        labels, vecs = [], []
+        if (root / "labels.json").exists():
+            old = cls(root, use_int8=False)
+            keep = [i for i, label in enumerate(old.labels) if label not in rows]
+            labels = [old.labels[i] for i in keep]
+            vecs = list(np.asarray(old.matrix[keep]))
+        for label, student_vecs in rows.items():
+            labels.extend([label] * len(student_vecs))
+            vecs.extend(student_vecs)
+        cls.write(root, labels, np.array(vecs, dtype=np.float32), int8)
+        return len(labels)
+
+def _save_npy(path, array):
+    tmp = path.with_name(path.name + ".tmp.npy")
+    np.save(tmp, np.ascontiguousarray(array))
+    os.replace(tmp, path)
+
+def _student_images(student_dir, frames):
+    """BGR images for enrollment: photos as-is, videos sampled evenly"""
+    import cv2
+    for path in sorted(student_dir.rglob("*")):
+        suffix = path.suffix.lower()
+        if suffix in IMAGE_EXTS:
+            img = cv2.imread(str(path))
+            if img is not None:
+                yield img
+        elif suffix in VIDEO_EXTS:
+            import decord
+            vr = decord.VideoReader(str(path), ctx=decord.cpu(0))
+            idxs = np.linspace(0, len(vr) - 1, frames).astype(int).tolist()
+            for rgb in vr.get_batch(idxs).asnumpy():
+                yield cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the identity embedding gallery")
+    sub = parser.add_subparsers(dest="command", required=True)
+    enroll = sub.add_parser("enroll", help="Embed <source>/<student_id>/ photos or videos")
+    enroll.add_argument("--gallery", required=True)
+    enroll.add_argument("--source", required=True, help="Folder with one sub-folder per student")
+    enroll.add_argument("--frames", type=int, default=5, help="Frames sampled per enrollment video")
+    enroll.add_argument("--int8", action="store_true", help="Also store an int8-quantized matrix")
+    enroll.add_argument("--det-size", type=int, default=640)
+    info = sub.add_parser("info")
+    info.add_argument("--gallery", required=True)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    if args.command == "info":
+        gallery = EmbeddingGallery(args.gallery)
+        print(f"{len(gallery)} rows, {len(set(gallery.labels))} students, "
+              f"dim {gallery.matrix.shape[1]}, {'int8' if gallery.int8 else 'float32'}")
+        return
+
+    from models.identity import IdentityModel
+    model = IdentityModel(det_size=args.det_size)
+    rows = {}
+    for student_dir in sorted(Path(args.source).iterdir()):
+        if not student_dir.is_dir():
+            continue
+        imgs = list(_student_images(student_dir, args.frames))
+        vecs = [vec for vec, _, _ in model._get_vecs(imgs) if vec is not None] if imgs else []
+        if vecs:
+            rows[student_dir.name] = vecs
+            logger.info(f"Enrolled {student_dir.name}: {len(vecs)} embeddings")
+        else:
+            logger.warning(f"No face found for {student_dir.name}")
+    total = EmbeddingGallery.enroll(args.gallery, rows, args.int8)
+    logger.info(f"Gallery {args.gallery} now holds {total} embeddings")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Local OpenAI-compatible chat completions server for testing report
+generation without an API key or network.
+
+    python llm_stub.py --port 8000 --latency 0.5 --fail-rate 0.1 --rpm 600
+
+Answers POST /v1/chat/completions after `latency` seconds (with jitter) with
+a short canned report. `fail_rate` of the requests get a 429 or 503 with
+Retry-After, and requests beyond `rpm` in the last minute get a 429;
+responses carry x-ratelimit-remaining-requests/x-ratelimit-reset-requests.
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _limit_headers(self):
+        cfg = self.config
+        with cfg["lock"]:
+            now = time.monotonic()
+            while cfg["recent"] and cfg["recent"][0] <= now - 60.0:
+                cfg["recent"].popleft()
+            if cfg["rpm"] and len(cfg["recent"]) >= cfg["rpm"]:
+                reset = cfg["recent"][0] + 60.0 - now
+                return False, {"x-ratelimit-remaining-requests": "0",
+                               "x-ratelimit-reset-requests": f"{reset:.3f}s", "retry-after": f"{reset:.3f}"}
+            cfg["recent"].append(now)
+            cfg["requests"] += 1
+            remaining = cfg["rpm"] - len(cfg["recent"]) if cfg["rpm"] else 1000
+            return True, {"x-ratelimit-remaining-requests": str(remaining),
+                          "x-ratelimit-reset-requests": "60s"}
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+
+        allowed, headers = self._limit_headers()
+        if not allowed:
+            self._send(429, {"error": {"message": "rate limit exceeded"}}, headers)
+            return
+        cfg = self.config
+        if random.random() < cfg["fail_rate"]:
+            status = random.choice((429, 503))
+            self._send(status, {"error": {"message": "injected failure"}}, dict(headers, **{"retry-after": "0.2"}))
+            return
+
+        time.sleep(max(0.0, random.gauss(cfg["latency"], cfg["latency"] / 4)))
+        prompt = request.get("messages", [{}])[-1].get("content", "")
+        content = (f"## Technical Conclusions\n- Stub report for a {len(prompt)}-character prompt "
+                   f"({prompt.count(chr(10))} lines).\n")
+        self._send(200, {
+            "id": f"chatcmpl-stub-{cfg['requests']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+                      "total_tokens": (len(prompt) + len(content)) // 4},
+        }, headers)
+
+def serve(host="127.0.0.1", port=8000, latency=0.5, fail_rate=0.0, rpm=None):
+    """Start the server on a background thread; returns the server"""
+    handler = type("Handler", (StubHandler,), {"config": {
+        "latency": latency, "fail_rate": fail_rate, "rpm": rpm,
+        "recent": deque(), "requests": 0, "lock": threading.Lock(),
+    }})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.5, help="Mean response time in seconds")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of requests answered 429/503")
+    parser.add_argument("--rpm", type=int, default=None, help="Requests per minute before answering 429")
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port, args.latency, args.fail_rate, args.rpm)
+    print(f"Serving on http://{args.host}:{server.server_address[1]}/v1")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
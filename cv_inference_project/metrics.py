@@ -0,0 +1,318 @@
+"""Where the time of a run goes: per-stage latencies, throughput, queue
+depths and memory.
+
+extract_and_run records every video into a VideoMetrics: latency samples in
+seconds per frame for decode chunks, each shared stage and model, summary
+appends, checkpoint flushes and writes; queue depths and RSS sampled once per
+batch; decode/inference/overall frames per second. It is saved as
+<video>_metrics.json. PrometheusExporter aggregates those files over a run
+in the Prometheus text format, rewritten to a file after every video (for
+node_exporter's textfile collector) and/or served on /metrics.
+
+SamplingProfiler is the opt-in profiler for chosen videos: it samples the
+Python stacks of every thread and writes them collapsed ("thread;a;b;c N"),
+the input format of flamegraph.pl and speedscope.
+"""
+import os
+import sys
+import time
+import json
+import threading
+from array import array
+from collections import Counter
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+
+# Upper bounds (seconds per frame) of the Prometheus histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Innermost frames of threads blocked on a lock, queue or socket
+IDLE = frozenset(("threading.py:wait", "threading.py:_wait_for_tstate_lock", "queue.py:get", "queue.py:put",
+                  "thread.py:_worker", "selectors.py:select", "socketserver.py:serve_forever"))
+
+def rss_bytes():
+    """Current resident set size of this process (0 where unknown)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+def peak_rss_bytes():
+    """Peak resident set size of this process so far"""
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+class Histogram:
+    """Latency samples of one stage, in seconds per frame (one per call)"""
+
+    def __init__(self):
+        self.samples = array('d')
+        self.frames = 0
+        self.total = 0.0
+
+    def observe(self, seconds, frames=1):
+        self.samples.append(seconds / max(1, frames))
+        self.frames += frames
+        self.total += seconds
+
+    def summary(self):
+        values = np.frombuffer(self.samples, dtype=np.float64) if self.samples else np.zeros(1)
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        return {
+            "calls": len(self.samples), "frames": self.frames, "total_s": round(self.total, 6),
+            "mean_ms": round(1000 * float(values.mean()), 4), "p50_ms": round(1000 * float(p50), 4),
+            "p95_ms": round(1000 * float(p95), 4), "p99_ms": round(1000 * float(p99), 4),
+            "max_ms": round(1000 * float(values.max()), 4),
+            # For PrometheusExporter: cumulative counts per BUCKETS bound and the sample sum
+            "buckets": np.searchsorted(np.sort(values), BUCKETS, side="right").tolist() if self.samples
+                       else [0] * len(BUCKETS),
+            "sum_s": float(values.sum()) if self.samples else 0.0,
+        }
+
+class VideoMetrics:
+    """Instrumentation of one video; safe to record into from the decoder,
+    inference and writer threads"""
+
+    def __init__(self, video=None):
+        self.video = video
+        self.stages = {}
+        self.queues = {}
+        self.counters = Counter()
+        self.rates = {}
+        self.profile = None
+        self.peak_rss = 0
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self._start
+
+    def observe(self, name, seconds, frames=1):
+        with self._lock:
+            self.stages.setdefault(name, Histogram()).observe(seconds, frames)
+
+    @contextmanager
+    def time(self, name, frames=1):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, frames)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def sample(self, queues=None):
+        """Record the current queue depths ({name: depth}) and RSS"""
+        with self._lock:
+            for name, depth in (queues or {}).items():
+                stat = self.queues.setdefault(name, [0, 0, 0])
+                stat[0] += 1
+                stat[1] += depth
+                stat[2] = max(stat[2], depth)
+            self.peak_rss = max(self.peak_rss, rss_bytes())
+
+    def summary(self):
+        with self._lock:
+            self.peak_rss = max(self.peak_rss, rss_bytes())
+            out = {
+                "video": self.video,
+                "wall_s": round(self.elapsed, 3),
+                "frames": dict(self.counters),
+                "fps": {k: round(v, 2) for k, v in self.rates.items()},
+                "stages": {name: hist.summary() for name, hist in self.stages.items()},
+                "queues": {name: {"samples": n, "mean": round(total / n, 2) if n else 0.0, "max": peak}
+                           for name, (n, total, peak) in self.queues.items()},
+                "rss_bytes": {"peak_video": self.peak_rss, "peak_process": peak_rss_bytes(), "end": rss_bytes()},
+            }
+        if self.profile is not None:
+            out["profile"] = self.profile
+        return out
+
+    def save(self, path):
+        from checkpoint import write_json_atomic
+        write_json_atomic(path, self.summary())
+        return path
+
+    def describe(self, top=8):
+        """One log line: the slowest stages by total time with p50/p95 ms per
+        frame, and the peak RSS"""
+        stages = sorted(self.stages.items(), key=lambda kv: -kv[1].total)[:top]
+        parts = []
+        for name, hist in stages:
+            s = hist.summary()
+            parts.append(f"{name} {s['total_s']:.2f}s ({s['p50_ms']:.1f}/{s['p95_ms']:.1f})")
+        return (f"Time by stage (p50/p95 ms/frame): {', '.join(parts) or 'none'}; "
+                f"peak RSS {max(self.peak_rss, rss_bytes()) / 2**20:.0f} MB")
+
+def _labels(**labels):
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+class PrometheusExporter:
+    """Run-level aggregate of per-video metrics summaries in the Prometheus
+    text format. Rewritten to `path` after every video and/or served on
+    http://host:port/metrics until close()."""
+
+    def __init__(self, path=None, port=None, host="127.0.0.1"):
+        self.path = path
+        self.stages = {}
+        self.frames = Counter()
+        self.queue_max = {}
+        self.fps = {}
+        self.videos = 0
+        self.wall = 0.0
+        self.peak_rss = 0
+        self._lock = threading.Lock()
+        self._server = None
+        if port is not None:
+            exporter = self
+
+            class Handler(BaseHTTPRequestHandler):
+                def log_message(self, format, *args):
+                    pass
+
+                def do_GET(self):
+                    if self.path.split("?")[0].rstrip("/") not in ("", "/metrics"):
+                        self.send_error(404)
+                        return
+                    data = exporter.render().encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+
+            self._server = ThreadingHTTPServer((host, port), Handler)
+            self._server.daemon_threads = True
+            threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True).start()
+
+    def add(self, summary):
+        """Merge one VideoMetrics.summary()"""
+        with self._lock:
+            self.videos += 1
+            self.wall += summary.get("wall_s", 0.0)
+            self.frames.update(summary.get("frames", {}))
+            self.fps = dict(summary.get("fps", {}))
+            for name, s in summary.get("stages", {}).items():
+                agg = self.stages.setdefault(name, {"buckets": [0] * len(BUCKETS), "count": 0, "sum": 0.0})
+                agg["buckets"] = [a + b for a, b in zip(agg["buckets"], s["buckets"])]
+                agg["count"] += s["calls"]
+                agg["sum"] += s["sum_s"]
+            for name, q in summary.get("queues", {}).items():
+                self.queue_max[name] = max(self.queue_max.get(name, 0), q["max"])
+            rss = summary.get("rss_bytes", {})
+            self.peak_rss = max(self.peak_rss, rss.get("peak_video", 0), rss.get("peak_process", 0))
+        if self.path:
+            self.write()
+
+    def add_file(self, path):
+        with open(path) as f:
+            self.add(json.load(f))
+
+    def render(self):
+        with self._lock:
+            lines = ["# HELP inference_stage_seconds Latency per frame of each pipeline stage",
+                     "# TYPE inference_stage_seconds histogram"]
+            for name, agg in sorted(self.stages.items()):
+                for bound, count in zip(BUCKETS, agg["buckets"]):
+                    lines.append(f"inference_stage_seconds_bucket{_labels(stage=name, le=bound)} {count}")
+                lines.append(f"inference_stage_seconds_bucket{_labels(stage=name, le='+Inf')} {agg['count']}")
+                lines.append(f"inference_stage_seconds_sum{_labels(stage=name)} {agg['sum']:.6f}")
+                lines.append(f"inference_stage_seconds_count{_labels(stage=name)} {agg['count']}")
+            lines += ["# HELP inference_frames_total Frames decoded, inferred and images written",
+                      "# TYPE inference_frames_total counter"]
+            lines += [f"inference_frames_total{_labels(kind=k)} {v}" for k, v in sorted(self.frames.items())]
+            lines += ["# HELP inference_videos_total Videos processed", "# TYPE inference_videos_total counter",
+                      f"inference_videos_total {self.videos}",
+                      "# HELP inference_video_seconds_total Wall time spent in videos",
+                      "# TYPE inference_video_seconds_total counter", f"inference_video_seconds_total {self.wall:.3f}",
+                      "# HELP inference_fps Frames per second of the last finished video",
+                      "# TYPE inference_fps gauge"]
+            lines += [f"inference_fps{_labels(kind=k)} {v}" for k, v in sorted(self.fps.items())]
+            lines += ["# HELP inference_queue_depth_max Deepest queue seen", "# TYPE inference_queue_depth_max gauge"]
+            lines += [f"inference_queue_depth_max{_labels(queue=k)} {v}" for k, v in sorted(self.queue_max.items())]
+            lines += ["# HELP inference_peak_rss_bytes Peak resident memory of a processing process",
+                      "# TYPE inference_peak_rss_bytes gauge", f"inference_peak_rss_bytes {self.peak_rss}"]
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp, self.path)
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+class SamplingProfiler:
+    """Samples the Python stack of every thread each `interval` seconds on a
+    background thread. Native code (decoding, inference) shows up as the
+    Python call it was entered from. Threads waiting in IDLE frames are not
+    counted unless `idle`."""
+
+    def __init__(self, interval=0.005, idle=False):
+        self.interval = interval
+        self.idle = idle
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                code = frame.f_code
+                if not self.idle and f"{os.path.basename(code.co_filename)}:{code.co_name}" in IDLE:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def top(self, n=15):
+        """[(function, self samples, total samples)] by self samples"""
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+            if frames:
+                own[frames[-1]] += count
+            for name in set(frames):
+                total[name] += count
+        return [(name, count, total[name]) for name, count in own.most_common(n)]
+
+    def save(self, path):
+        """Write the collapsed stacks, most frequent first"""
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
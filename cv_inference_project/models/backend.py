@@ -0,0 +1,257 @@
+"""CPU inference backends for the exported networks.
+
+"torch" is the original path: ultralytics/torch for YOLOv8 and InsightFace's
+own ONNX Runtime session for the ArcFace recognizer. "onnx" runs both through
+ONNX Runtime and "openvino" through a compiled OpenVINO CPU model; either can
+be post-training quantized to INT8 with a calibration set sampled from our
+own recordings. Converted models are kept in WEIGHTS_DIR:
+
+    python -m models.backend convert --backend openvino --int8 --calib downloads/ --calib-frames 300
+
+FP32 conversions are also made on first use; INT8 models have to be
+converted up front because they need the calibration frames.
+"""
+import os
+import shutil
+import logging
+import argparse
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from models.registry import BACKENDS
+
+logger = logging.getLogger("inference")
+
+WEIGHTS_DIR = Path(os.environ.get("WEIGHTS_DIR", Path(__file__).resolve().parents[1] / "weights"))
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp')
+VIDEO_EXTS = ('.mp4', '.mov', '.mkv', '.avi')
+
+def calibration_frames(source, count=300, offset=0.0):
+    """`count` BGR frames spread evenly over the images or videos under
+    `source` (a file or a directory). `offset` in [0, 1) shifts the sampling
+    grid, e.g. 0.5 for evaluation frames disjoint from the calibration set."""
+    source = Path(source)
+    files = [source] if source.is_file() else sorted(
+        p for p in source.rglob("*") if p.suffix.lower() in IMAGE_EXTS + VIDEO_EXTS)
+    images = [p for p in files if p.suffix.lower() in IMAGE_EXTS]
+    videos = [p for p in files if p.suffix.lower() in VIDEO_EXTS]
+    if images and not videos:
+        step = max(1, len(images) // count)
+        picked = images[int(offset * step)::step][:count]
+        return [img for img in (cv2.imread(str(p)) for p in picked) if img is not None]
+
+    import decord
+    frames = []
+    per_video = max(1, -(-count // max(1, len(videos))))
+    for video in videos:
+        vr = decord.VideoReader(str(video), ctx=decord.cpu(0))
+        step = len(vr) / per_video
+        idxs = sorted({min(len(vr) - 1, int((i + offset) * step)) for i in range(per_video)})
+        # decord decodes RGB; the models take OpenCV's BGR
+        frames.extend(f[:, :, ::-1].copy() for f in vr.get_batch(idxs).asnumpy())
+    return frames[:count]
+
+def letterbox(img, size=640):
+    """YOLOv8 preprocessing: resize keeping aspect, pad with 114 to a
+    size x size square, as a 1x3xHxW float32 RGB blob in [0, 1]"""
+    h, w = img.shape[:2]
+    scale = min(size / h, size / w)
+    nh, nw = round(h * scale), round(w * scale)
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    top, left = (size - nh) // 2, (size - nw) // 2
+    canvas[top:top + nh, left:left + nw] = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    return np.ascontiguousarray(canvas[:, :, ::-1].transpose(2, 0, 1)[None], dtype=np.float32) / 255.0
+
+def quantize_onnx(src, dst, blobs, input_name):
+    """Static INT8 (QDQ, per-channel weights) of an ONNX model, keeping its
+    metadata (ultralytics reads class names and strides from it)"""
+    import onnx
+    from onnxruntime.quantization import (quantize_static, CalibrationDataReader, QuantFormat,
+                                          QuantType, CalibrationMethod)
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self.blobs = iter(blobs)
+
+        def get_next(self):
+            blob = next(self.blobs, None)
+            return None if blob is None else {input_name: blob}
+
+    dst = Path(dst)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    # Shape inference + graph optimization first, as ONNX Runtime recommends
+    prepared = dst.with_name(dst.stem + "_prep.onnx")
+    quant_pre_process(str(src), str(prepared), skip_symbolic_shape=True)
+    try:
+        quantize_static(str(prepared), str(dst), Reader(), quant_format=QuantFormat.QDQ, per_channel=True,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+                        calibrate_method=CalibrationMethod.MinMax)
+    finally:
+        prepared.unlink(missing_ok=True)
+    original, quantized = onnx.load(str(src)), onnx.load(str(dst))
+    present = {p.key for p in quantized.metadata_props}
+    quantized.metadata_props.extend(p for p in original.metadata_props if p.key not in present)
+    onnx.save(quantized, str(dst))
+    return dst
+
+def quantize_openvino(src, dst, blobs, ignored_scope=None):
+    """NNCF post-training INT8 of an OpenVINO IR or ONNX model into IR `dst`"""
+    import nncf
+    import openvino as ov
+
+    model = ov.Core().read_model(str(src))
+    quantized = nncf.quantize(model, nncf.Dataset(blobs), preset=nncf.QuantizationPreset.MIXED,
+                              subset_size=len(blobs), ignored_scope=ignored_scope)
+    dst = Path(dst)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    ov.save_model(quantized, str(dst))
+    return dst
+
+class OpenVINOSession:
+    """The part of onnxruntime.InferenceSession that InsightFace calls,
+    backed by a model compiled for the OpenVINO CPU plugin"""
+
+    def __init__(self, path, threads=None):
+        import openvino as ov
+
+        self.path = str(path)
+        config = {"PERFORMANCE_HINT": "LATENCY"}
+        if threads:
+            config["INFERENCE_NUM_THREADS"] = int(threads)
+        self.compiled = ov.Core().compile_model(self.path, "CPU", config)
+
+    def run(self, output_names, feed):
+        # One infer request per call: a request must not be shared between threads
+        results = self.compiled.create_infer_request().infer(feed)
+        outputs = output_names or [o.get_any_name() for o in self.compiled.outputs]
+        return [results[self.compiled.output(name)] for name in outputs]
+
+    def get_providers(self):
+        return ["OpenVINO/CPU"]
+
+def open_session(path, backend, threads=None, providers=None):
+    """An InferenceSession-compatible session for a converted model"""
+    if backend == "openvino":
+        return OpenVINOSession(path, threads)
+    import onnxruntime
+    opts = onnxruntime.SessionOptions()
+    if threads:
+        opts.intra_op_num_threads = threads
+        opts.inter_op_num_threads = 1
+    return onnxruntime.InferenceSession(str(path), sess_options=opts,
+                                        providers=providers or ["CPUExecutionProvider"])
+
+def yolo_path(weights, backend, int8=False):
+    """What YOLO() loads for `weights` on `backend`"""
+    if backend == "torch":
+        return Path(weights)
+    stem = Path(weights).stem + ("_int8" if int8 else "")
+    if backend == "onnx":
+        return WEIGHTS_DIR / f"{stem}.onnx"
+    # ultralytics recognises OpenVINO models by the directory suffix
+    return WEIGHTS_DIR / f"{stem}_openvino_model"
+
+def convert_yolo(weights="yolov8n.pt", backend="openvino", int8=False, frames=None, imgsz=640):
+    """Export YOLOv8 to ONNX / OpenVINO IR (dynamic batch) and optionally
+    quantize it with `frames`; returns the path to load with YOLO()"""
+    fp32 = yolo_path(weights, backend)
+    if not fp32.exists():
+        from ultralytics import YOLO
+        logger.info(f"Exporting {weights} to {backend}")
+        exported = YOLO(weights).export(format=backend, imgsz=imgsz, dynamic=True, half=False)
+        fp32.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(str(exported), str(fp32))
+    if not int8:
+        return fp32
+
+    if not frames:
+        raise ValueError("INT8 quantization needs calibration frames")
+    dst = yolo_path(weights, backend, int8=True)
+    blobs = [letterbox(f, imgsz) for f in frames]
+    logger.info(f"Quantizing {weights} for {backend} on {len(blobs)} frames")
+    if backend == "onnx":
+        import onnxruntime
+        input_name = onnxruntime.InferenceSession(str(fp32)).get_inputs()[0].name
+        return quantize_onnx(fp32, dst, blobs, input_name)
+
+    import nncf
+    # Box decoding (DFL + grid arithmetic) and the class sigmoids stay in
+    # floating point, as in ultralytics' own INT8 export
+    ignored = nncf.IgnoredScope(types=["Sigmoid"], patterns=[r".*/dfl/.*", r".*\.22/.*/(Add|Sub|Mul|Div).*"],
+                                validate=False)
+    xml = next(fp32.glob("*.xml"))
+    if dst.exists():
+        shutil.rmtree(dst)
+    shutil.copytree(fp32, dst, ignore=shutil.ignore_patterns("*.xml", "*.bin"))
+    quantize_openvino(xml, dst / xml.name, blobs, ignored)
+    return dst
+
+def recognizer_path(model_file, backend, int8=False):
+    stem = Path(model_file).stem + ("_int8" if int8 else "")
+    return WEIGHTS_DIR / (f"{stem}.onnx" if backend == "onnx" else f"{stem}_openvino/{stem}.xml")
+
+def convert_recognizer(rec, backend="openvino", int8=False, faces=None):
+    """Convert InsightFace's ArcFace ONNX model `rec` (optionally INT8 with
+    aligned face crops); returns the path to open with open_session()"""
+    if backend == "onnx" and not int8:
+        return Path(rec.model_file)
+    dst = recognizer_path(rec.model_file, backend, int8)
+    if dst.exists():
+        return dst
+    if not int8:
+        import openvino as ov
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        ov.save_model(ov.convert_model(rec.model_file), str(dst))
+        return dst
+
+    if not faces:
+        raise ValueError("INT8 quantization needs aligned face crops")
+    size = tuple(rec.input_size)
+    blobs = [cv2.dnn.blobFromImages([face], 1.0 / rec.input_std, size,
+                                    (rec.input_mean,) * 3, swapRB=True) for face in faces]
+    logger.info(f"Quantizing {Path(rec.model_file).name} for {backend} on {len(blobs)} faces")
+    if backend == "onnx":
+        return quantize_onnx(rec.model_file, dst, blobs, rec.input_name)
+    return quantize_openvino(rec.model_file, dst, blobs)
+
+def missing(path, what):
+    return FileNotFoundError(
+        f"{what} not found at {path}; create it with "
+        f"`python -m models.backend convert --backend ... --int8 --calib <videos>`")
+
+def convert(backend, int8=False, calib=None, calib_frames=300, weights="yolov8n.pt", det_size=640):
+    """Convert (and quantize) the detector and the recognizer for `backend`"""
+    frames = calibration_frames(calib, calib_frames) if int8 else None
+    if int8 and not frames:
+        raise ValueError(f"No calibration frames found under {calib}")
+    yolo = convert_yolo(weights, backend, int8, frames)
+
+    from models.identity import IdentityModel
+    identity = IdentityModel(mode="fast", det_size=det_size)
+    faces = identity.aligned_faces(frames) if int8 else None
+    rec = convert_recognizer(identity.app.models['recognition'], backend, int8, faces)
+    return yolo, rec
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the detector and recognizer for a CPU backend")
+    sub = parser.add_subparsers(dest="command", required=True)
+    conv = sub.add_parser("convert")
+    conv.add_argument("--backend", choices=BACKENDS[1:], required=True)
+    conv.add_argument("--int8", action="store_true", help="Post-training INT8 quantization")
+    conv.add_argument("--calib", default=None, help="Videos or images to draw calibration frames from")
+    conv.add_argument("--calib-frames", type=int, default=300)
+    conv.add_argument("--weights", default="yolov8n.pt")
+    conv.add_argument("--det-size", type=int, default=640, help="Face detector input size for the face crops")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    if args.int8 and not args.calib:
+        parser.error("--int8 needs --calib")
+    yolo, rec = convert(args.backend, args.int8, args.calib, args.calib_frames, args.weights, args.det_size)
+    print(f"Detector:   {yolo}\nRecognizer: {rec}")
+
+if __name__ == "__main__":
+    main()
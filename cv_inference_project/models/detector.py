@@ -0,0 +1,77 @@
+import numpy as np
+from collections import namedtuple
+import logging
+from models.registry import StageSpec
+
+logger = logging.getLogger("inference")
+
+# COCO class ids used by the detection-based checks
+PERSON, LAPTOP, CELL_PHONE, BOOK = 0, 63, 67, 73
+
+Detections = namedtuple("Detections", ["boxes", "conf", "cls"])
+
+SPEC = StageSpec(weights=("yolov8n.pt",))
+
+class DetectionStage:
+    """Shared perception stage: one YOLO pass per frame, consumed by every
+    model that lists "detector" in its `requires`. `backend` selects torch,
+    ONNX Runtime or OpenVINO (see models.backend)."""
+    name = "detector"
+
+    def __init__(self, weights=SPEC.weights[0], backend="torch", int8=False):
+        from ultralytics import YOLO
+        logger.debug(f"Initializing DetectionStage ({backend}{', int8' if int8 else ''})")
+        path = weights
+        self.backend = backend
+        if backend != "torch":
+            from models.backend import convert_yolo, yolo_path, missing
+            path = yolo_path(weights, backend, int8)
+            if int8 and not path.exists():
+                raise missing(path, "INT8 detector")
+            path = convert_yolo(weights, backend, int8)
+        self.path = path
+        self.model = YOLO(str(path), task="detect")
+
+    def limit_threads(self, n):
+        """Reopen the ONNX Runtime / OpenVINO session that ultralytics made
+        (on all cores) with at most `n` intra-op threads; torch is capped by
+        workers.limit_threads"""
+        if self.backend == "torch":
+            return
+        from models.backend import open_session
+        # ultralytics builds its inference backend on the first prediction
+        self.model(np.zeros((64, 64, 3), dtype=np.uint8), verbose=False)
+        backend = self.model.predictor.model
+        if self.backend == "onnx":
+            backend.session = open_session(self.path, "onnx", n, backend.session.get_providers())
+        else:
+            backend.ov_compiled_model = open_session(next(self.path.glob("*.xml")), "openvino", n).compiled
+
+    def process(self, img):
+        return _to_detections(self.model(img, verbose=False)[0])
+
+    def process_batch(self, imgs):
+        """Run the detector once over a list of frames"""
+        return [_to_detections(res) for res in self.model(list(imgs), verbose=False)]
+
+def _to_detections(res):
+    boxes = res.boxes
+    return Detections(
+        boxes=boxes.xyxy.cpu().numpy(),
+        conf=boxes.conf.cpu().numpy(),
+        cls=boxes.cls.cpu().numpy().astype(int),
+    )
+
+def select(dets, class_id, conf):
+    """Boxes and confidences of `class_id` detections scoring above `conf`"""
+    if dets is None:
+        return np.empty((0, 4)), np.empty(0)
+    mask = (dets.cls == class_id) & (dets.conf > conf)
+    return dets.boxes[mask], dets.conf[mask]
+
+def box_list(boxes, confs):
+    """Boxes as JSON-friendly [x1, y1, x2, y2, conf] rows for the summary"""
+    return [[*map(float, np.round(b, 1)), round(float(c), 3)] for b, c in zip(boxes, confs)]
+
+def load_stage(**options):
+    return DetectionStage(**options)
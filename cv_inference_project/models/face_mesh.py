@@ -0,0 +1,59 @@
+import numpy as np
+import logging
+from models.registry import StageSpec
+
+logger = logging.getLogger("inference")
+
+# The FaceMesh model ships inside the mediapipe package
+SPEC = StageSpec()
+
+class FaceMeshStage:
+    """Shared perception stage: runs FaceMesh once per frame for every model
+    that lists "face_mesh" in its `requires`.
+
+    With `roi_margin`, FaceMesh runs on a crop around the previous frame's
+    face (see models.roi.FaceROI) and on the full frame only when the face
+    is lost. It then runs in static image mode, as its own tracking would
+    be thrown off by the moving crop.
+    """
+    name = "face_mesh"
+    color = "rgb"
+
+    def __init__(self, roi_margin=None):
+        import mediapipe as mp
+        logger.debug(f"Initializing FaceMeshStage{' (face ROI)' if roi_margin is not None else ''}")
+        self.roi = None
+        if roi_margin is not None:
+            from models.roi import FaceROI
+            self.roi = FaceROI(roi_margin)
+        self.mesh = mp.solutions.face_mesh.FaceMesh(static_image_mode=self.roi is not None,
+                                                   refine_landmarks=True)
+
+    def reset(self):
+        if self.roi is not None:
+            self.roi.reset()
+
+    def _landmarks(self, rgb):
+        h, w = rgb.shape[:2]
+        res = self.mesh.process(np.ascontiguousarray(rgb))
+        if not res.multi_face_landmarks:
+            return None, None
+        lm = res.multi_face_landmarks[0].landmark
+        points = np.array([(p.x*w, p.y*h) for p in lm], dtype=np.float64)
+        return points, (*points.min(axis=0), *points.max(axis=0))
+
+    def process(self, rgb):
+        """Return landmarks of the first face in an RGB frame as an (N, 2)
+        array of pixel coordinates, or None if no face was found."""
+        if self.roi is None:
+            points, _ = self._landmarks(rgb)
+        else:
+            points, _, offset = self.roi.search(rgb, self._landmarks)
+            if points is not None:
+                points += offset
+        if points is None:
+            logger.debug("No face landmarks detected")
+        return points
+
+def load_stage(**options):
+    return FaceMeshStage(**options)
@@ -1,45 +1,246 @@
-import cv2
 import numpy as np
-from insightface.app import FaceAnalysis
 import logging
+from models.registry import ModelSpec
 
 logger = logging.getLogger("inference")
 
+# embedding_reused only in fast mode, gallery_* only with a gallery
+SPEC = ModelSpec(weights=("buffalo_l",), outputs={
+    "is_match": "bool", "distance": "float", "face_box": "list", "embedding_reused": "bool",
+    "gallery_match": "text", "gallery_score": "float", "gallery_top": "json", "expected_score": "float",
+})
+
+class _Pending:
+    """Embedding of the i-th crop of the current recognition batch"""
+    __slots__ = ("i",)
+
+    def __init__(self, i):
+        self.i = i
+
+def _iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2]-a[0])*(a[3]-a[1]) + (b[2]-b[0])*(b[3]-b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
 class IdentityModel:
-    def __init__(self, thr: float = 1.0):
-        logger.debug("Initializing IdentityModel")
-        self.app = FaceAnalysis(name="buffalo_l")
-        self.app.prepare(ctx_id=0, det_size=(640, 640))
+    """Face verification against the face enrolled on the first frame.
+
+    mode="full" loads every buffalo_l module and embeds every frame.
+    mode="fast" loads only detection + recognition and tracks the embedded
+    face: while its box overlaps the box it was embedded at by at least
+    `track_iou` and its 24x24 grayscale thumbnail differs by less than
+    `appearance_thr`, the last embedding is reused (at most `max_reuse`
+    frames in a row) instead of running ArcFace again.
+
+    With `gallery` (a directory written by gallery.py) every embedding is
+    also matched against all enrolled students, reporting the `top_k`
+    closest ones and the similarity to the student the video belongs to.
+
+    `backend` "onnx"/"openvino" (optionally `int8`) swaps the ArcFace
+    session for a converted one from models.backend.
+
+    With `roi_margin`, faces are detected in a crop around the previous
+    frame's face (see models.roi.FaceROI) at `roi_det_size` instead of
+    `det_size`, and in the full frame only when the face is lost.
+    """
+
+    def __init__(self, thr: float = 1.0, mode: str = "full", det_size: int = 640,
+                 track_iou: float = 0.6, appearance_thr: float = 0.08, max_reuse: int = 25,
+                 gallery: str = None, top_k: int = 3, backend: str = "torch", int8: bool = False,
+                 roi_margin: float = None, roi_det_size: int = 256):
+        logger.debug(f"Initializing IdentityModel ({mode}, det_size={det_size}, {backend}"
+                     f"{', int8' if int8 else ''})")
+        from insightface.app import FaceAnalysis
+        self.fast = mode == "fast"
+        modules = ["detection", "recognition"] if self.fast else None
+        self.app = FaceAnalysis(name=SPEC.weights[0], allowed_modules=modules)
+        self.app.prepare(ctx_id=0, det_size=(det_size, det_size))
+        self.backend = backend
+        self._rec_path = None
+        if backend != "torch":
+            from models.backend import convert_recognizer, recognizer_path, open_session, missing
+            rec = self.app.models['recognition']
+            if int8 and not recognizer_path(rec.model_file, backend, int8).exists():
+                raise missing(recognizer_path(rec.model_file, backend, int8), "INT8 recognizer")
+            self._rec_path = convert_recognizer(rec, backend, int8)
+            rec.session = open_session(self._rec_path, backend)
         self.ref_vec = None
         self.thr = thr
+        self.track_iou = track_iou
+        self.appearance_thr = appearance_thr
+        self.max_reuse = max_reuse
+        self._track = None
+        self.roi = None
+        self.roi_det_size = (roi_det_size, roi_det_size)
+        if roi_margin is not None:
+            from models.roi import FaceROI
+            self.roi = FaceROI(roi_margin)
+        self.gallery = None
+        self.top_k = top_k
+        self.student_id = None
+        if gallery:
+            from gallery import EmbeddingGallery
+            self.gallery = EmbeddingGallery(gallery)
+            logger.info(f"Identity gallery: {len(self.gallery)} embeddings from {gallery}")
+
+    def reset(self, student_id=None):
+        """Forget the enrolled and tracked face before a new video"""
+        self.ref_vec = None
+        self._track = None
+        self.student_id = student_id
+        if self.roi is not None:
+            self.roi.reset()
+        if self.gallery is not None and student_id not in self.gallery:
+            logger.warning(f"Student {student_id} is not enrolled in the identity gallery")
 
-    def _get_vec(self, img):
-        faces = self.app.get(img)
-        return faces[0].embedding if faces else None
+    def get_state(self):
+        return {'ref_vec': None if self.ref_vec is None else self.ref_vec.tolist()}
 
-    def predict(self, img):
+    def set_state(self, state):
+        ref_vec = state.get('ref_vec')
+        self.ref_vec = None if ref_vec is None else np.asarray(ref_vec, dtype=np.float32)
+
+    def limit_threads(self, n):
+        """Recreate the ONNX Runtime / OpenVINO sessions with at most `n`
+        intra-op threads"""
+        from models.backend import open_session
+        for name, model in self.app.models.items():
+            if name == 'recognition' and self._rec_path is not None:
+                model.session = open_session(self._rec_path, self.backend, n)
+            else:
+                model.session = open_session(model.model_file, "onnx", n, model.session.get_providers())
+
+    def aligned_faces(self, imgs):
+        """Aligned recognizer-sized crops of the first face of every image
+        that has one (calibration data for models.backend)"""
+        from insightface.utils import face_align
+        size = self.app.models['recognition'].input_size[0]
+        faces = []
+        for img in imgs:
+            bboxes, kpss = self.app.det_model.detect(img, max_num=0, metric='default')
+            if bboxes.shape[0]:
+                faces.append(face_align.norm_crop(img, landmark=kpss[0], image_size=size))
+        return faces
+
+    def _detect(self, img):
+        """(bboxes, kpss) of the faces in `img`, in frame coordinates"""
+        if self.roi is None:
+            return self.app.det_model.detect(img, max_num=0, metric='default')
+
+        def detect(region):
+            size = None if region is img else self.roi_det_size
+            bboxes, kpss = self.app.det_model.detect(region, input_size=size, max_num=0, metric='default')
+            return (bboxes, kpss), (bboxes[0, :4] if bboxes.shape[0] else None)
+
+        (bboxes, kpss), _, (dx, dy) = self.roi.search(img, detect)
+        if dx or dy:
+            bboxes = bboxes.copy()
+            bboxes[:, [0, 2]] += dx
+            bboxes[:, [1, 3]] += dy
+            if kpss is not None:
+                kpss = kpss + np.array([dx, dy], dtype=kpss.dtype)
+        return bboxes, kpss
+
+    def _thumb(self, img, box):
+        h, w = img.shape[:2]
+        x1, y1 = max(0, int(box[0])), max(0, int(box[1]))
+        x2, y2 = min(w, int(box[2])), min(h, int(box[3]))
+        if x2 <= x1 or y2 <= y1:
+            return None
+        import cv2
+        crop = cv2.resize(img[y1:y2, x1:x2], (24, 24), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY).astype(np.float32)
+
+    def _tracked(self, thumb, box):
+        """The tracked embedding if the face barely moved or changed"""
+        track = self._track
+        if (track is None or thumb is None or track['thumb'] is None
+                or isinstance(track['vec'], _Pending)
+                or track['reused'] >= self.max_reuse
+                or _iou(box, track['box']) < self.track_iou
+                or np.abs(thumb - track['thumb']).mean() / 255.0 > self.appearance_thr):
+            return None
+        track['reused'] += 1
+        return track['vec']
+
+    def _get_vecs(self, imgs):
+        """Embed the first detected face of every image with a single
+        recognition call. Returns (embedding, box, reused) per image; images
+        without a face get (None, None, False)."""
+        from insightface.utils import face_align
+        rec = self.app.models['recognition']
+        crops, found = [], []
+        for img in imgs:
+            bboxes, kpss = self._detect(img)
+            if bboxes.shape[0] == 0:
+                found.append((None, None, False))
+                continue
+            box = bboxes[0, :4]
+            if self.fast:
+                thumb = self._thumb(img, box)
+                vec = self._tracked(thumb, box)
+                if vec is not None:
+                    found.append((vec, box, True))
+                    continue
+                self._track = {'box': box, 'thumb': thumb, 'vec': _Pending(len(crops)), 'reused': 0}
+            crops.append(face_align.norm_crop(img, landmark=kpss[0], image_size=rec.input_size[0]))
+            found.append((_Pending(len(crops) - 1), box, False))
+
+        feats = rec.get_feat(crops) if crops else []
+        resolve = lambda v: feats[v.i].flatten() if isinstance(v, _Pending) else v
+        if self._track is not None:
+            self._track['vec'] = resolve(self._track['vec'])
+        return [(resolve(vec), box, reused) for vec, box, reused in found]
+
+    def _verify(self, cur, box, reused=False):
+        meta = self._compare(cur, box)
+        if self.fast:
+            meta['embedding_reused'] = reused
+        if self.gallery is not None:
+            meta.update(self._search(cur))
+        return meta
+
+    def _search(self, cur):
+        """Closest enrolled students; scores are cosine similarities"""
+        if cur is None:
+            return {'gallery_match': "", 'gallery_score': 0.0, 'gallery_top': [],
+                    'expected_score': 0.0}
+        scores = self.gallery.scores(cur)
+        top = self.gallery.top_k(scores, self.top_k)
+        expected = self.gallery.label_score(scores, self.student_id)
+        return {
+            'gallery_match': top[0][0] if top else "",
+            'gallery_score': top[0][1] if top else 0.0,
+            'gallery_top': [label for label, _ in top],
+            'expected_score': 0.0 if expected is None else expected,
+        }
+
+    def _compare(self, cur, box):
+        face_box = [] if box is None else [round(float(v), 1) for v in box]
         if self.ref_vec is None:
-            vec = self._get_vec(img)
-            if vec is None:
+            if cur is None:
                 logger.warning("No face detected in enrollment frame")
-                cv2.putText(img, "NO FACE!", (20,40), cv2.FONT_HERSHEY_SIMPLEX,1,(0,0,255),2)
-                return img, {'is_match': False, 'distance': float('inf')}
+                return {'is_match': False, 'distance': float('inf'), 'face_box': face_box}
             else:
-                self.ref_vec = vec
+                self.ref_vec = cur
                 logger.info("Identity enrolled successfully")
-                return img, {'is_match': True, 'distance': 0.0}
+                return {'is_match': True, 'distance': 0.0, 'face_box': face_box}
         
-        cur = self._get_vec(img)
         if cur is None:
-            cv2.putText(img, "NO FACE!", (20,40), cv2.FONT_HERSHEY_SIMPLEX,1,(0,0,255),2)
-            return img, {'is_match': False, 'distance': float('inf')}
+            return {'is_match': False, 'distance': float('inf'), 'face_box': face_box}
         
         dist = np.linalg.norm(self.ref_vec - cur)
         ok = dist < self.thr
-        text = f"{'MATCH' if ok else 'IMPOSTOR'} {dist:.2f}"
-        color = (0,255,0) if ok else (0,0,255)
-        cv2.putText(img, text, (20,40), cv2.FONT_HERSHEY_SIMPLEX,1,color,2)
-        return img, {'is_match': ok, 'distance': dist}
+        return {'is_match': ok, 'distance': dist, 'face_box': face_box}
+
+    def predict(self, img):
+        return self._verify(*self._get_vecs([img])[0])
+
+    def predict_batch(self, imgs):
+        """Embed all frames in one recognition call, then verify them in order"""
+        return [self._verify(*found) for found in self._get_vecs(imgs)]
 
-def load_model():
-    return IdentityModel()
\ No newline at end of file
+def load_model(**options):
+    return IdentityModel(**options)
@@ -0,0 +1,32 @@
+from models.detector import select, box_list, LAPTOP, BOOK
+import logging
+from models.registry import ModelSpec
+
+logger = logging.getLogger("inference")
+
+SPEC = ModelSpec(requires=("detector",),
+                 outputs={"book_count": "int", "book_boxes": "list", "laptop_count": "int", "laptop_boxes": "list"})
+
+class ObjectsModel:
+    """Counts forbidden desk objects from the shared detector output"""
+    requires = SPEC.requires
+
+    def __init__(self, conf=0.3):
+        logger.debug("Initializing ObjectsModel")
+        self.classes = {'book': BOOK, 'laptop': LAPTOP}
+        self.conf = conf
+
+    def predict(self, img, detector=None):
+        meta = {}
+        for name, class_id in self.classes.items():
+            boxes, confs = select(detector, class_id, self.conf)
+            meta[f'{name}_count'] = len(boxes)
+            meta[f'{name}_boxes'] = box_list(boxes, confs)
+        
+        counts = {k: v for k, v in meta.items() if k.endswith('_count') and v}
+        if counts:
+            logger.warning(f"Objects detected: {counts}")
+        return meta
+
+def load_model():
+    return ObjectsModel()
@@ -1,30 +1,29 @@
-import cv2
-from ultralytics import YOLO
+from models.detector import select, box_list, PERSON
 import logging 
+from models.registry import ModelSpec
 
 logger = logging.getLogger("inference")
 
+SPEC = ModelSpec(requires=("detector",), outputs={"person_count": "int", "person_boxes": "list"})
+
 class PersonsModel:
+    requires = SPEC.requires
+
     def __init__(self, conf=0.25):
         logger.debug("Initializing PersonsModel")
-        self.model = YOLO("yolov8n.pt")
-        self.person_id = 0
+        self.person_id = PERSON
         self.conf = conf
 
-    def predict(self, img):
-        res = self.model(img, verbose=False)[0]
-        cnt = sum(int(c)==self.person_id and cf>self.conf
-                for c,cf in zip(res.boxes.cls, res.boxes.conf))
+    def predict(self, img, detector=None):
+        boxes, confs = select(detector, self.person_id, self.conf)
+        cnt = len(boxes)
         flag = cnt > 1
-        col = (0,0,255) if flag else (0,255,0)
-        cv2.putText(img,f"Persons:{cnt}",(20,190),
-                    cv2.FONT_HERSHEY_SIMPLEX,1,col,2)
         
         if flag:
             logger.warning(f"Multiple persons detected: {cnt}")
         else:
             logger.debug(f"Person count: {cnt}")
-        return img, {'person_count': cnt}
+        return {'person_count': cnt, 'person_boxes': box_list(boxes, confs)}
 
 def load_model():
-    return PersonsModel()
\ No newline at end of file
+    return PersonsModel()
@@ -0,0 +1,58 @@
+"""What every model needs, known before anything heavy is imported.
+
+Each module in models/ declares at module level either
+
+    SPEC = ModelSpec(requires=("detector",), weights=(), outputs={"phone_count": "int", ...})
+
+for a model (the shared stages it consumes, the weights it loads itself and
+its output fields with the summary_store column kinds they are stored in:
+bool, int, float, text, list (of numbers) or json), or
+
+    SPEC = StageSpec(weights=("yolov8n.pt",))
+
+for a shared stage. Frameworks (torch/ultralytics, InsightFace, MediaPipe)
+are imported only when a model or stage is constructed, so reading specs,
+--help and --dry-run never load them. Stages are built once per process for
+the same options and shared by every caller.
+"""
+import json
+import threading
+from collections import namedtuple
+from importlib import import_module
+
+BACKENDS = ("torch", "onnx", "openvino")
+
+ModelSpec = namedtuple("ModelSpec", "requires weights outputs", defaults=((), (), {}))
+StageSpec = namedtuple("StageSpec", "weights", defaults=((),))
+
+_stages = {}
+_lock = threading.Lock()
+
+def spec(name):
+    """SPEC of models/<name>.py; modules without one get an empty ModelSpec"""
+    return getattr(import_module(f"models.{name}"), "SPEC", None) or ModelSpec()
+
+def plan(model_names):
+    """({model: ModelSpec}, {stage: StageSpec}, [weights]) for a run of
+    `model_names`, in load order and without loading anything"""
+    models = {name: spec(name) for name in model_names}
+    stages = {}
+    for model in models.values():
+        for stage in getattr(model, "requires", ()):
+            stages.setdefault(stage, spec(stage))
+    weights = list(dict.fromkeys(w for s in [*models.values(), *stages.values()] for w in s.weights))
+    return models, stages, weights
+
+def load_model(name, **options):
+    """A new instance of models/<name>.py; models keep per-video state, so
+    they are never shared"""
+    return import_module(f"models.{name}").load_model(**options)
+
+def load_stage(name, **options):
+    """models/<name>.py's shared stage, built once per process for the
+    same options"""
+    key = (name, json.dumps(options, sort_keys=True, default=str))
+    with _lock:
+        if key not in _stages:
+            _stages[key] = import_module(f"models.{name}").load_stage(**options)
+        return _stages[key]
@@ -0,0 +1,98 @@
+"""Face region of interest carried from one sampled frame to the next.
+
+The student's face covers a small, slowly moving part of a webcam or phone
+recording, so the face models look for it in a crop around where it was
+last seen and search the whole frame only when it is not found there.
+"""
+import math
+
+class FaceROI:
+    """Crop window around the face of the previous frame of a video.
+
+    The window is the last face box grown by `margin` times its width and
+    height on every side, clipped to the frame. It stays put while the face
+    keeps some room inside it, so consecutive crops are steady, and is
+    recentred otherwise. A window covering more than `max_fraction` of the
+    frame is not worth cropping and the full frame is used instead.
+
+    search() runs a detector on the crop; if nothing is found there, or the
+    face touches an edge of the crop that is not a frame edge, it runs again
+    on the full frame. A face missing from the full frame drops the window
+    until the face is found again.
+    """
+
+    def __init__(self, margin=0.75, max_fraction=0.5):
+        self.margin = margin
+        self.max_fraction = max_fraction
+        self.reset()
+
+    def reset(self):
+        """Forget the face and the statistics before a new video"""
+        self.window = None
+        self.frames = 0
+        self.crops = 0
+        self.fallbacks = 0
+        self.pixels = 0
+        self.full_pixels = 0
+
+    def _grow(self, box, w, h):
+        bw, bh = box[2] - box[0], box[3] - box[1]
+        return (max(0, int(box[0] - self.margin * bw)), max(0, int(box[1] - self.margin * bh)),
+                min(w, math.ceil(box[2] + self.margin * bw)), min(h, math.ceil(box[3] + self.margin * bh)))
+
+    def _clipped(self, box, window, w, h, edge=2):
+        """Whether `box` (crop coordinates) reaches an inner edge of `window`"""
+        x1, y1, x2, y2 = window
+        return ((x1 > 0 and box[0] <= edge) or (y1 > 0 and box[1] <= edge)
+                or (x2 < w and box[2] >= x2 - x1 - edge) or (y2 < h and box[3] >= y2 - y1 - edge))
+
+    def _follow(self, box, w, h):
+        if box is None:
+            self.window = None
+            return
+        window = self.window
+        bw, bh = box[2] - box[0], box[3] - box[1]
+        room_x, room_y = 0.5 * self.margin * bw, 0.5 * self.margin * bh
+        if window is not None and (
+                (window[0] == 0 or box[0] - window[0] >= room_x)
+                and (window[1] == 0 or box[1] - window[1] >= room_y)
+                and (window[2] == w or window[2] - box[2] >= room_x)
+                and (window[3] == h or window[3] - box[3] >= room_y)
+                # the face shrank: a tighter window is cheaper
+                and window[2] - window[0] <= 2 * (1 + 2 * self.margin) * bw):
+            return
+        window = self._grow(box, w, h)
+        if (window[2] - window[0]) * (window[3] - window[1]) > self.max_fraction * w * h:
+            window = None
+        self.window = window
+
+    def search(self, img, detect):
+        """Find the face in `img` with `detect(region)`, which returns
+        (result, box) with `box` (x1, y1, x2, y2) in region coordinates, or
+        None if there is no face.
+
+        Returns (result, box, (dx, dy)): `box` in frame coordinates and the
+        offset to add to any other region coordinates of `result`."""
+        h, w = img.shape[:2]
+        self.frames += 1
+        self.full_pixels += w * h
+        window = self.window
+        if window is not None:
+            x1, y1, x2, y2 = window
+            result, box = detect(img[y1:y2, x1:x2])
+            self.pixels += (x2 - x1) * (y2 - y1)
+            if box is not None and not self._clipped(box, window, w, h):
+                self.crops += 1
+                box = (box[0] + x1, box[1] + y1, box[2] + x1, box[3] + y1)
+                self._follow(box, w, h)
+                return result, box, (x1, y1)
+            self.fallbacks += 1
+        result, box = detect(img)
+        self.pixels += w * h
+        self._follow(box, w, h)
+        return result, box, (0, 0)
+
+    def describe(self):
+        share = self.pixels / self.full_pixels if self.full_pixels else 0.0
+        return (f"{self.crops}/{self.frames} frames found on the face crop, {self.fallbacks} full-frame "
+                f"fallbacks, {100 * share:.0f}% of full-frame pixels searched")
@@ -1,184 +1,342 @@
 #!/usr/bin/env python3
+"""Downloads every exam recording listed in the dataset spreadsheet.
+
+Files are fetched by a thread pool; each worker reuses a pooled
+requests.Session, and the Google Drive service is built once per run.
+Downloads go to <name>.part and resume with an HTTP Range request after an
+interruption; files already complete on disk (same size as the remote) are
+skipped.
+
+    python parser.py --excel датасет.xlsx --output downloads --workers 8
+    python yandex_stub.py --root videos/ --port 8001 &    # local Yandex Disk for testing
+    python parser.py --excel links.xlsx --yandex-api-url http://127.0.0.1:8001/v1/disk/public/resources/download
+"""
 import os
 import re
 import sys
+import json
+import time
+import argparse
+import threading
 import requests
 import pandas as pd
 import logging
-from urllib.parse import urlparse
-from googleapiclient.discovery import build
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.http import MediaIoBaseDownload
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime
-import requests
-import re
-import os
 from urllib.parse import urlencode, urlparse, parse_qs
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('download_log.txt'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
 GOOGLE_SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
-GOOGLE_CREDENTIALS_FILE = r'creds\credentials.json'
-YANDEX_API_URL = 'https://cloud-api.yandex.net/v1/disk/public/resources/download?public_key={}'
-EXCEL_FILE = r'cv_inference_project\parser\датасет.xlsx'
+GOOGLE_CREDENTIALS_FILE = os.path.join('creds', 'credentials.json')
+GOOGLE_TOKEN_FILE = os.path.join('creds', 'token.json')
+GOOGLE_MEDIA_URL = 'https://www.googleapis.com/drive/v3/files/{}?alt=media'
+YANDEX_API_URL = os.environ.get('YANDEX_API_URL',
+                                'https://cloud-api.yandex.net/v1/disk/public/resources/download')
+EXCEL_FILE = os.path.join('cv_inference_project', 'parser', 'датасет.xlsx')
 DOWNLOAD_FOLDER = 'downloads'
+CHUNK_SIZE = 1024 * 1024
+POOL_SIZE = 16
+
+_local = threading.local()
+_drive_lock = threading.Lock()
+_drive = {}
 
-def setup_folders():
-    os.makedirs(DOWNLOAD_FOLDER, exist_ok=True)
+def setup_folders(download_folder=DOWNLOAD_FOLDER):
+    os.makedirs(download_folder, exist_ok=True)
+
+def get_session():
+    """The calling thread's pooled session (keep-alive, retries on 429/5xx)"""
+    session = getattr(_local, 'session', None)
+    if session is None:
+        retry = Retry(total=5, backoff_factor=1.0, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=('GET', 'HEAD'), respect_retry_after_header=True)
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _local.session = session
+    return session
+
+def get_google_credentials():
+    """OAuth credentials, cached in creds/token.json so the browser flow runs
+    at most once; refreshed when expired"""
+    from google.oauth2.credentials import Credentials
+    from google.auth.transport.requests import Request
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
+    with _drive_lock:
+        creds = _drive.get('creds')
+        if creds is None and os.path.exists(GOOGLE_TOKEN_FILE):
+            creds = Credentials.from_authorized_user_file(GOOGLE_TOKEN_FILE, GOOGLE_SCOPES)
+        if creds is not None and not creds.valid and creds.refresh_token:
+            creds.refresh(Request())
+        if creds is None or not creds.valid:
+            flow = InstalledAppFlow.from_client_secrets_file(GOOGLE_CREDENTIALS_FILE, GOOGLE_SCOPES)
+            creds = flow.run_local_server(port=0)
+        if creds is not _drive.get('creds'):
+            os.makedirs(os.path.dirname(GOOGLE_TOKEN_FILE) or '.', exist_ok=True)
+            with open(GOOGLE_TOKEN_FILE, 'w') as f:
+                f.write(creds.to_json())
+        _drive['creds'] = creds
+        return creds
 
 def get_google_drive_service():
-    creds = None
+    """Drive API client, built once per run"""
+    from googleapiclient.discovery import build
+
+    creds = get_google_credentials()
+    with _drive_lock:
+        if 'service' not in _drive:
+            _drive['service'] = build('drive', 'v3', credentials=creds, cache_discovery=False)
+        return _drive['service']
+
+def download_to(href, dest_path, expected_size=None, headers=None, chunk_size=CHUNK_SIZE, attempts=5):
+    """Stream href into dest_path through <dest>.part, resuming a partial
+    download (from this or an earlier run) with a Range request guarded by
+    If-Range on the ETag seen when the part was started. Returns the number
+    of bytes fetched."""
+    if expected_size is not None and os.path.exists(dest_path) and os.path.getsize(dest_path) == expected_size:
+        return 0
+    fetched = 0
+    for attempt in range(1, attempts + 1):
+        try:
+            return fetched + _fetch(href, dest_path, expected_size, headers, chunk_size)
+        except requests.HTTPError:
+            raise
+        except (requests.ConnectionError, requests.Timeout, IOError) as e:
+            part_path = dest_path + '.part'
+            if attempt == attempts or not os.path.exists(part_path):
+                raise
+            logger.warning(f"Transfer of {dest_path} interrupted at {os.path.getsize(part_path)} bytes "
+                           f"({e}), resuming")
+            fetched += getattr(e, 'fetched', 0)
 
-    flow = InstalledAppFlow.from_client_secrets_file(
-                GOOGLE_CREDENTIALS_FILE,
-                GOOGLE_SCOPES)
-    creds = flow.run_local_server(port=0)
-    
-    return build('drive', 'v3', credentials=creds)
+def _fetch(href, dest_path, expected_size, base_headers, chunk_size):
+    session = get_session()
+    headers = dict(base_headers or {})
+    part_path = dest_path + '.part'
+    meta_path = part_path + '.json'
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    etag = None
+    if offset and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            etag = json.load(f).get('etag')
+    if offset:
+        headers['Range'] = f'bytes={offset}-'
+        if etag:
+            headers['If-Range'] = etag
 
-def download_yandex_file(url, folder_path):
+    with session.get(href, headers=headers, stream=True, timeout=(10, 60)) as r:
+        if r.status_code == 416 and offset:
+            # The part already holds everything the server has
+            total = int(r.headers.get('Content-Range', '*/-1').rsplit('/', 1)[-1] or -1)
+            if total == offset:
+                os.replace(part_path, dest_path)
+                if os.path.exists(meta_path):
+                    os.remove(meta_path)
+                return 0
+            # Stale part longer than the remote file: start over
+            logger.warning(f"Discarding stale {part_path} ({offset} bytes, remote {total})")
+            os.remove(part_path)
+            if os.path.exists(meta_path):
+                os.remove(meta_path)
+            return _fetch(href, dest_path, expected_size, base_headers, chunk_size)
+        r.raise_for_status()
+        if r.status_code == 206:
+            total = int(r.headers['Content-Range'].rsplit('/', 1)[-1])
+            mode = 'ab'
+        else:
+            # Range ignored or the remote file changed: start over
+            offset = 0
+            total = int(r.headers.get('content-length', 0)) or None
+            mode = 'wb'
+        if r.headers.get('ETag'):
+            with open(meta_path, 'w') as f:
+                json.dump({'etag': r.headers['ETag'], 'size': total}, f)
+
+        fetched = 0
+        try:
+            with open(part_path, mode) as f:
+                for chunk in r.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+                    fetched += len(chunk)
+        except requests.RequestException as e:
+            e.fetched = fetched
+            raise
+
+    size = offset + fetched
+    expected = expected_size or total
+    if expected is not None and size != expected:
+        error = IOError(f"incomplete download of {dest_path}: {size} of {expected} bytes")
+        error.fetched = fetched
+        raise error
+    os.replace(part_path, dest_path)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    return fetched
+
+def normalize_yandex_link(link):
+    return re.sub(r"https://(?:disk\.)?360\.yandex\.ru", "https://disk.yandex.ru", link)
+
+def get_yandex_download_url(public_link, api_url=None):
+    response = get_session().get((api_url or YANDEX_API_URL) + '?' + urlencode({'public_key': public_link}),
+                                 timeout=(10, 60))
+    response.raise_for_status()
+    return response.json()['href']
+
+def download_yandex_file(url, folder_path, api_url=None):
     try:
-        def normalize_yandex_link(link):
-            return re.sub(r"https://(?:disk\.)?360\.yandex\.ru", "https://disk.yandex.ru", link)
-
-        def get_download_url(public_link):
-            api_url = 'https://cloud-api.yandex.net/v1/disk/public/resources/download?'
-            full_url = api_url + urlencode({'public_key': public_link})
-            response = requests.get(full_url)
-            response.raise_for_status()
-            return response.json()['href']
-
-        def extract_filename_from_url(href):
-            parsed = urlparse(href)
-            qs = parse_qs(parsed.query)
-            return qs.get('filename', ['downloaded_file.bin'])[0]
-
-        def download_file(href, dest_path):
-            with requests.get(href, stream=True) as r:
-                r.raise_for_status()
-                total = int(r.headers.get('content-length', 0))
-                downloaded = 0
-
-                with open(dest_path, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                            downloaded += len(chunk)
-                            done = int(50 * downloaded / total) if total else 0
-                            print(f"\r[{'█' * done:<50}] {downloaded/1024/1024:.2f} MB", end='')
-
-        url = normalize_yandex_link(url)
-        href = get_download_url(url)
-        filename = extract_filename_from_url(href)
+        href = get_yandex_download_url(normalize_yandex_link(url), api_url)
+        qs = parse_qs(urlparse(href).query)
+        filename = qs.get('filename', ['downloaded_file.bin'])[0]
+        expected_size = int(qs['fsize'][0]) if qs.get('fsize') else None
         dest_path = os.path.join(folder_path, filename)
-        download_file(href, dest_path)
 
-        logger.info(f"Successfully downloaded Yandex Disk file: {dest_path}")
-        return True
+        start = time.perf_counter()
+        fetched = download_to(href, dest_path, expected_size)
+        _log_done("Yandex Disk", dest_path, fetched, time.perf_counter() - start)
+        return dest_path
 
     except Exception as e:
-        logger.error(f"Error downloading Yandex Disk file: {e}")
-        return False
+        logger.error(f"Error downloading Yandex Disk file {url}: {e}")
+        return None
 
 def download_google_file(url, folder_path):
     try:
-        service = get_google_drive_service()
-        
         file_id = re.search(r'/file/d/([a-zA-Z0-9_-]+)', url, re.IGNORECASE)
         if not file_id:
             logger.error(f"Invalid Google Drive URL: {url}")
-            return False
+            return None
         file_id = file_id.group(1)
-        
-        file_metadata = service.files().get(fileId=file_id).execute()
+
+        service = get_google_drive_service()
+        with _drive_lock:
+            # The Drive client's transport is not thread-safe
+            file_metadata = service.files().get(fileId=file_id, fields='name,size').execute()
         filename = file_metadata.get('name', f"google_file_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+        expected_size = int(file_metadata['size']) if file_metadata.get('size') else None
         filepath = os.path.join(folder_path, filename)
-        
-        request = service.files().get_media(fileId=file_id)
-        with open(filepath, 'wb') as f:
-            downloader = MediaIoBaseDownload(f, request)
-            done = False
-            while not done:
-                status, done = downloader.next_chunk()
-                logger.info(f"Download progress: {int(status.progress() * 100)}%")
-        
-        logger.info(f"Successfully downloaded Google Drive file: {filepath}")
-        return True
-        
+
+        creds = get_google_credentials()
+        start = time.perf_counter()
+        fetched = download_to(GOOGLE_MEDIA_URL.format(file_id), filepath, expected_size,
+                              headers={'Authorization': f'Bearer {creds.token}'})
+        _log_done("Google Drive", filepath, fetched, time.perf_counter() - start)
+        return filepath
+
     except Exception as e:
-        logger.error(f"Error downloading Google Drive file: {e}")
-        return False
+        logger.error(f"Error downloading Google Drive file {url}: {e}")
+        return None
 
-def process_download(url, folder_path):
+def _log_done(source, path, fetched, seconds):
+    if not fetched:
+        logger.info(f"Already downloaded, skipping: {path}")
+    else:
+        logger.info(f"Downloaded {source} file: {path} "
+                    f"({fetched / 1024 / 1024:.1f} MB, {fetched / 1024 / 1024 / max(seconds, 1e-6):.1f} MB/s)")
+
+def process_download(url, folder_path, yandex_api_url=None):
+    """Download one link; returns the local path, or None on failure"""
     if 'yandex' in url.lower():
-        return download_yandex_file(url, folder_path)
+        return download_yandex_file(url, folder_path, yandex_api_url)
     elif 'google' in url.lower():
         return download_google_file(url, folder_path)
     else:
         logger.error(f"Unsupported URL type: {url}")
-        return False
+        return None
 
 def sanitize_folder_name(name):
     return re.sub(r'[<>:"/\\|?*]', '_', str(name).strip())
 
-def process_excel_file():
-    try:
-        df = pd.read_excel(EXCEL_FILE)
-        
-        for _, row in df.iterrows():
-            
-            user_login = row.get('login', '')
-            links_text = row.get('Ссылка/ссылки на облако', '')
-            comment = row.get('Комментарий (если что-то пошло не так - впишите сюда что и когда происходило)', '')
-            
-            if pd.isna(links_text) or not str(links_text).strip():
-                logger.info(f"No links found for {user_login}")
-                continue
-            
-            base_folder = os.path.join(DOWNLOAD_FOLDER, sanitize_folder_name(user_login))
-            if pd.notna(comment) and str(comment).strip():
-                subfolder = sanitize_folder_name(comment)
-                folder_path = os.path.join(base_folder, subfolder)
-            else:
-                folder_path = base_folder
-            
+def collect_downloads(excel_file=EXCEL_FILE, download_folder=DOWNLOAD_FOLDER):
+    """(url, folder_path) for every link in the spreadsheet"""
+    df = pd.read_excel(excel_file)
+    jobs = []
+    for _, row in df.iterrows():
+        user_login = row.get('login', '')
+        links_text = row.get('Ссылка/ссылки на облако', '')
+        comment = row.get('Комментарий (если что-то пошло не так - впишите сюда что и когда происходило)', '')
+
+        if pd.isna(links_text) or not str(links_text).strip():
+            logger.info(f"No links found for {user_login}")
+            continue
+
+        base_folder = os.path.join(download_folder, sanitize_folder_name(user_login))
+        if pd.notna(comment) and str(comment).strip():
+            folder_path = os.path.join(base_folder, sanitize_folder_name(comment))
+        else:
+            folder_path = base_folder
+
+        urls = re.findall(r'(https?://[^\s"]+)', str(links_text))
+        if not urls:
+            logger.info(f"No valid URLs found for {user_login}")
+            continue
+        jobs.extend((url, folder_path) for url in urls)
+    # Two threads must never write the same <name>.part
+    return list(dict.fromkeys(jobs))
+
+def process_excel_file(excel_file=EXCEL_FILE, download_folder=DOWNLOAD_FOLDER, workers=4,
+                       yandex_api_url=None, on_complete=None):
+    """Download every link of the spreadsheet with `workers` threads;
+    returns {url: local path or None}. `on_complete(url, path)` is called as
+    each file becomes available (already complete files included).
+    Raises whatever reading the spreadsheet raises."""
+    jobs = collect_downloads(excel_file, download_folder)
+
+    logger.info(f"Downloading {len(jobs)} files with {workers} workers")
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for url, folder_path in jobs:
             os.makedirs(folder_path, exist_ok=True)
-            
-            urls = re.findall(r'(https?://[^\s"]+)', str(links_text))
-            if not urls:
-                logger.info(f"No valid URLs found for {user_login}")
-                continue
-            
-            logger.info(f"Processing {len(urls)} files for {user_login}")
-            for i, url in enumerate(urls, 1):
-                logger.info(f"Downloading file {i}/{len(urls)}: {url}")
-                if not process_download(url, folder_path):
-                    logger.error(f"Failed to download: {url}")
-                
-    except Exception as e:
-        logger.error(f"Error processing Excel file: {e}")
-        sys.exit(1)
+            futures[pool.submit(process_download, url, folder_path, yandex_api_url)] = url
+        for done, future in enumerate(as_completed(futures), 1):
+            url = futures[future]
+            results[url] = future.result()
+            if results[url] is None:
+                logger.error(f"Failed to download: {url}")
+            elif on_complete is not None:
+                on_complete(url, results[url])
+            logger.info(f"Progress: {done}/{len(jobs)}")
+    return results
 
 def main():
-    setup_folders()
-    
-    if not os.path.exists(EXCEL_FILE):
-        logger.error(f"Excel file not found: {EXCEL_FILE}")
+    parser = argparse.ArgumentParser(description="Download exam recordings listed in the dataset spreadsheet")
+    parser.add_argument('--excel', default=EXCEL_FILE)
+    parser.add_argument('--output', default=DOWNLOAD_FOLDER)
+    parser.add_argument('--workers', type=int, default=4, help='Parallel downloads')
+    parser.add_argument('--yandex-api-url', default=None,
+                        help='Yandex Disk download API endpoint (default: $YANDEX_API_URL or cloud-api.yandex.net)')
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('download_log.txt'),
+            logging.StreamHandler()
+        ]
+    )
+
+    setup_folders(args.output)
+
+    if not os.path.exists(args.excel):
+        logger.error(f"Excel file not found: {args.excel}")
         sys.exit(1)
-    
-    if not os.path.exists(GOOGLE_CREDENTIALS_FILE):
+
+    if not os.path.exists(GOOGLE_CREDENTIALS_FILE) and not os.path.exists(GOOGLE_TOKEN_FILE):
         logger.warning("Google credentials file not found. Only Yandex downloads will work.")
-    
-    process_excel_file()
-    logger.info("Processing completed")
+
+    try:
+        results = process_excel_file(args.excel, args.output, args.workers, args.yandex_api_url)
+    except Exception as e:
+        logger.error(f"Error processing Excel file: {e}")
+        sys.exit(1)
+    failed = sum(path is None for path in results.values())
+    logger.info(f"Processing completed: {len(results) - failed} downloaded, {failed} failed")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
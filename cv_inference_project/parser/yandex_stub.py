@@ -0,0 +1,140 @@
+"""Local stand-in for the Yandex Disk public download API, for testing
+parser.py without network access.
+
+    python yandex_stub.py --root videos/ --port 8001 --rate 50 --drop-after 5000000
+
+GET /v1/disk/public/resources/download?public_key=<link> answers
+{"href": ...} for the file in `root` named like the link's last path segment
+(https://disk.yandex.ru/i/exam.mkv -> root/exam.mkv); the href carries
+filename and fsize like the real API. GET /files/<name> serves the file with
+ETag, Range/If-Range support, an optional bandwidth cap (`rate` MB/s per
+connection) and `drop_after` bytes per response after which the connection
+is cut, to exercise resumption.
+"""
+import os
+import json
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, urlencode, quote, unquote
+
+class YandexHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.rstrip("/").endswith("/public/resources/download"):
+            key = parse_qs(url.query).get("public_key", [""])[0]
+            name = os.path.basename(urlparse(key).path)
+            path = os.path.join(self.config["root"], name)
+            if not name or not os.path.isfile(path):
+                self._json(404, {"error": "DiskNotFoundError", "description": f"Resource not found: {key}"})
+                return
+            host = self.headers.get("Host")
+            query = urlencode({"filename": name, "fsize": os.path.getsize(path)})
+            self._json(200, {"href": f"http://{host}/files/{quote(name)}?{query}", "method": "GET",
+                             "templated": False})
+        elif url.path.startswith("/files/"):
+            self._file(os.path.join(self.config["root"], os.path.basename(unquote(url.path))))
+        else:
+            self._json(404, {"error": "NotFound"})
+
+    def _file(self, path):
+        if not os.path.isfile(path):
+            self._json(404, {"error": "NotFound"})
+            return
+        stat = os.stat(path)
+        size = stat.st_size
+        etag = f'"{stat.st_size:x}-{int(stat.st_mtime_ns):x}"'
+        start = 0
+        requested = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if requested and (if_range is None or if_range == etag):
+            start = int(requested.split("=", 1)[1].split("-", 1)[0])
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{size - 1}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(size - start))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        self.end_headers()
+
+        cfg = self.config
+        with cfg["lock"]:
+            cfg["requests"] += 1
+        budget = cfg["drop_after"] or size
+        block = 256 * 1024
+        with open(path, "rb") as f:
+            f.seek(start)
+            sent = 0
+            began = time.perf_counter()
+            while sent < size - start:
+                data = f.read(min(block, budget - sent))
+                if not data:
+                    break
+                self.wfile.write(data)
+                sent += len(data)
+                with cfg["lock"]:
+                    cfg["bytes"] += len(data)
+                if cfg["rate"]:
+                    ahead = sent / (cfg["rate"] * 1024 * 1024) - (time.perf_counter() - began)
+                    if ahead > 0:
+                        time.sleep(ahead)
+                if sent >= budget:
+                    self.close_connection = True
+                    break
+
+def serve(root, host="127.0.0.1", port=8001, rate=None, drop_after=None):
+    """Start the server on a background thread; returns the server, whose
+    `config` holds request and byte counters"""
+    config = {"root": root, "rate": rate, "drop_after": drop_after,
+              "requests": 0, "bytes": 0, "lock": threading.Lock()}
+    handler = type("Handler", (YandexHandler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.config = config
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Yandex Disk public download API stub")
+    parser.add_argument("--root", required=True, help="Directory with the files to serve")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--rate", type=float, default=None, help="Bandwidth cap per connection, MB/s")
+    parser.add_argument("--drop-after", type=int, default=None,
+                        help="Cut every response after this many bytes")
+    args = parser.parse_args()
+
+    server = serve(args.root, args.host, args.port, args.rate, args.drop_after)
+    print(f"Serving {args.root} on http://{args.host}:{server.server_address[1]}"
+          f"/v1/disk/public/resources/download")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import time
+import queue
+import threading
+import logging
+from pathlib import Path
+
+logger = logging.getLogger("inference")
+
+_STOP = object()
+
+class WriterStage:
+    """Output stage of the pipeline: runs write jobs (JPEG encodes, summary
+    dumps) on `threads` background threads.
+
+    Jobs go through a queue bounded by `queue_size`, so when disks fall
+    behind the inference stage blocks instead of buffering frames without
+    limit. With `threads=0` every job runs inline, which is the serial mode.
+    Job times are recorded as "write/<extension of desc>" into `metrics`
+    (a metrics.VideoMetrics) if given.
+    """
+
+    def __init__(self, threads=0, queue_size=64, metrics=None):
+        self.threads = max(0, int(threads))
+        self.failed = 0
+        self.metrics = metrics
+        self._queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._workers = [
+            threading.Thread(target=self._work, name=f"writer-{i}", daemon=True)
+            for i in range(self.threads)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def _run(self, desc, fn, args):
+        start = time.perf_counter()
+        try:
+            if fn(*args) is False:
+                raise IOError("writer returned False")
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Write failed for {desc}: {str(e)}")
+        if self.metrics is not None:
+            self.metrics.observe(f"write/{Path(str(desc)).suffix.lstrip('.') or 'other'}",
+                                 time.perf_counter() - start)
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is _STOP:
+                    return
+                self._run(*job)
+            finally:
+                self._queue.task_done()
+
+    def submit(self, desc, fn, *args):
+        """Queue `fn(*args)`; `desc` names the job in error messages"""
+        if not self._workers:
+            self._run(desc, fn, args)
+        else:
+            self._queue.put((desc, fn, args))
+
+    def flush(self):
+        """Block until every queued job has been written"""
+        if self._workers:
+            self._queue.join()
+
+    def close(self):
+        for _ in self._workers:
+            self._queue.put(_STOP)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
@@ -0,0 +1,167 @@
+"""Draws model annotations onto frames.
+
+Models only return metadata (plus geometry such as boxes and eye points).
+With --render all, extract_and_run draws every inferred frame while it is
+still decoded (write_annotated); events and composite need the whole
+summary, so render_video re-decodes the frames they need after inference.
+The inference loop itself never copies, draws or encodes frames.
+
+    python render.py --video downloads/student/exam.mp4 --summary out/student/exam/exam_summary --mode events
+"""
+import math
+import time
+import argparse
+import logging
+from pathlib import Path
+
+import cv2
+
+from flags import is_flagged, is_carried, RENDER_MODES
+from frame_source import FrameSource
+from pipeline import WriterStage
+from summary_store import load_summary
+
+logger = logging.getLogger("inference")
+
+RED, GREEN, BLUE, ORANGE, MAGENTA = (0,0,255), (0,255,0), (255,0,0), (0,165,255), (255,0,255)
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+def _boxes(img, boxes, label, col):
+    for x1, y1, x2, y2, conf in boxes:
+        x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
+        cv2.rectangle(img,(x1,y1),(x2,y2),col,2)
+        cv2.putText(img,f"{label} {conf:.2f}",(x1,y1-8),FONT,0.6,col,2)
+
+def draw_gaze(img, meta):
+    pts = meta.get('eye_points')
+    if not pts:
+        return
+    flag = meta.get('gaze_away', False)
+    col = RED if flag else GREEN
+    cv2.arrowedLine(img, tuple(pts[0]), tuple(pts[1]), col, 2)
+    cv2.putText(img, f"GazeAway:{flag}", (20,70), FONT, 1, col, 2)
+
+def draw_headpose(img, meta):
+    if not meta.get('face_found', True):
+        return
+    cv2.putText(img,f"Yaw:{meta.get('yaw', 0.0):+.1f}", (20,100),FONT,1,BLUE,2)
+    cv2.putText(img,f"Pitch:{meta.get('pitch', 0.0):+.1f}",(20,130),FONT,1,BLUE,2)
+    cv2.putText(img,f"Roll:{meta.get('roll', 0.0):+.1f}", (20,160),FONT,1,BLUE,2)
+
+def draw_identity(img, meta):
+    dist = meta.get('distance')
+    if dist is None or math.isinf(dist):
+        cv2.putText(img, "NO FACE!", (20,40), FONT,1,RED,2)
+        return
+    ok = meta.get('is_match', False)
+    cv2.putText(img, f"{'MATCH' if ok else 'IMPOSTOR'} {dist:.2f}", (20,40), FONT,1,GREEN if ok else RED,2)
+
+def draw_phone(img, meta):
+    _boxes(img, meta.get('phone_boxes', []), "PHONE", ORANGE)
+
+def draw_persons(img, meta):
+    cnt = meta.get('person_count', 0)
+    cv2.putText(img,f"Persons:{cnt}",(20,190),FONT,1,RED if cnt > 1 else GREEN,2)
+
+def draw_objects(img, meta):
+    for key, boxes in meta.items():
+        if key.endswith('_boxes'):
+            _boxes(img, boxes, key[:-len('_boxes')].upper(), MAGENTA)
+
+DRAWERS = {
+    "gaze": draw_gaze,
+    "headpose": draw_headpose,
+    "identity": draw_identity,
+    "phone": draw_phone,
+    "persons": draw_persons,
+    "objects": draw_objects,
+}
+
+def draw(img, model_name, meta):
+    drawer = DRAWERS.get(model_name)
+    if drawer is not None:
+        drawer(img, meta)
+    return img
+
+def select_annotations(summaries, mode):
+    """{frame: [(model_name, meta), ...]} for the annotations `mode` keeps"""
+    selected = {}
+    if mode == "none":
+        return selected
+    for model_name, entries in summaries.items():
+        for entry in entries:
+            # Repeated results would draw old boxes on a newer frame
+            if is_carried(entry['meta']):
+                continue
+            if mode == "events" and not is_flagged(model_name, entry['meta']):
+                continue
+            selected.setdefault(entry['frame'], []).append((model_name, entry['meta']))
+    return selected
+
+def write_annotated(frame, annotations, frame_dir, mode, writer, metrics=None):
+    """Draw `annotations` ([(model_name, meta)]) on a decoded frame and
+    queue its JPEGs on `writer`; returns the number queued"""
+    start = time.perf_counter()
+    frame_dir = Path(frame_dir)
+    if mode == "composite":
+        img = frame.bgr.copy()
+        for model_name, meta in annotations:
+            draw(img, model_name, meta)
+        outputs = [(frame_dir / f"frame_{frame.idx:05d}.jpg", img)]
+    else:
+        outputs = [
+            (frame_dir / f"frame_{frame.idx:05d}_{model_name}.jpg", draw(frame.bgr.copy(), model_name, meta))
+            for model_name, meta in annotations
+        ]
+    if metrics is not None and outputs:
+        metrics.observe("render/draw", time.perf_counter() - start, len(outputs))
+    for path, img in outputs:
+        writer.submit(path.name, cv2.imwrite, str(path), img)
+    return len(outputs)
+
+def render_video(vr, summaries, frame_dir, mode, writer=None, prefetch=1, metrics=None):
+    """Re-decode the frames `mode` needs from `vr` and write annotated JPEGs.
+
+    "all" and "events" write frame_<idx>_<model>.jpg per annotation (events
+    only for flagged model outputs); "composite" writes one frame_<idx>.jpg
+    with every model's annotations drawn on it. The re-decode and drawing
+    times are recorded as "render/decode" and "render/draw" into `metrics`
+    if given.
+    """
+    selected = select_annotations(summaries, mode)
+    if not selected:
+        return 0
+
+    frame_dir = Path(frame_dir)
+    frame_dir.mkdir(parents=True, exist_ok=True)
+    own_writer = writer is None
+    writer = writer or WriterStage()
+    written = 0
+    for frame in FrameSource(vr, sorted(selected), prefetch=prefetch, metrics=metrics, stage="render/decode"):
+        written += write_annotated(frame, selected[frame.idx], frame_dir, mode, writer, metrics)
+    if own_writer:
+        writer.close()
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description="Render annotated frames from a summary")
+    parser.add_argument("--video", required=True)
+    parser.add_argument("--summary", required=True, help="<video>_summary/ directory or <video>_summary.json")
+    parser.add_argument("--mode", choices=RENDER_MODES[1:], default="events")
+    parser.add_argument("--out-dir", default=None, help="Defaults to frames/ next to the summary")
+    parser.add_argument("--writer-threads", type=int, default=2)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    import decord
+    vr = decord.VideoReader(args.video, ctx=decord.cpu(0))
+    summaries = load_summary(args.summary)
+
+    out_dir = Path(args.out_dir) if args.out_dir else Path(args.summary).parent / "frames"
+    writer = WriterStage(args.writer_threads)
+    written = render_video(vr, summaries, out_dir, args.mode, writer)
+    writer.close()
+    logger.info(f"Wrote {written} images to {out_dir}")
+
+if __name__ == "__main__":
+    main()
@@ -4,26 +4,34 @@ os.environ["OPENCV_LOG_LEVEL"] = "ERROR"
 
 import sys
 import json
+import time
+import queue
 import argparse
 import logging
-from tqdm import tqdm
+import threading
+from fnmatch import fnmatch
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from importlib import import_module
-import decord
-import cv2
-import numpy as np
+from batching import MicroBatcher
+from pipeline import WriterStage
+from workers import run_pool
+from checkpoint import RunManifest, VideoCheckpoint
+from events import EventSegmenter, save_events, counts
+from flags import is_flagged, is_carried, RENDER_MODES
+from models import registry
+from models.registry import BACKENDS
 
 VIDEO_EXTS = ('.mp4', '.mov', '.mkv', '.avi')
 
-def setup_logger(out_dir, level=logging.DEBUG):
+def setup_logger(out_dir, level=logging.DEBUG, mode='w', prefix=""):
     out_dir = Path(out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
     logger = logging.getLogger("inference")
     logger.setLevel(level)
     
-    fh = logging.FileHandler(out_dir / "run_inference.log", mode='w')
+    fh = logging.FileHandler(out_dir / "run_inference.log", mode=mode)
     sh = logging.StreamHandler(sys.stdout)
-    fmt = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
+    fmt = logging.Formatter(f'%(asctime)s [%(levelname)s] {prefix}%(message)s')
     fh.setFormatter(fmt)
     sh.setFormatter(fmt)
     
@@ -41,17 +49,238 @@ def get_all_videos(dataset_root):
         if video_path.suffix.lower() in VIDEO_EXTS
     ]
 
-def save_summary(out_dir, summaries, video_name):
-    """Save summary data to JSON file"""
-    summary_path = out_dir / f"{video_name}_summary.json"
-    with open(summary_path, 'w') as f:
-        json.dump(summaries, f, indent=2)
-    return summary_path
+def stream_downloads(excel_file, dataset_root, workers, yandex_api_url, logger, admit):
+    """Download the spreadsheet's links into dataset_root on a background
+    thread. Each finished video goes through `admit(student_id, path)` and,
+    unless it returns None, onto the returned queue, which gets None once
+    every download is done. Returns (queue, event); the event is set if the
+    spreadsheet could not be read or the downloads stopped on an error."""
+    from parser.parser import process_excel_file
+
+    root = Path(dataset_root).resolve()
+    root.mkdir(parents=True, exist_ok=True)
+    arrivals = queue.Queue()
+    failed = threading.Event()
+    download_logger = logging.getLogger(process_excel_file.__module__)
+    download_logger.setLevel(logger.level)
+    handlers = list(logger.handlers)
+    for handler in handlers:
+        download_logger.addHandler(handler)
+
+    def on_complete(url, path):
+        path = Path(path).resolve()
+        if path.suffix.lower() not in VIDEO_EXTS:
+            return
+        job = admit(path.relative_to(root).parts[0], path)
+        if job is not None:
+            arrivals.put(job)
+
+    def download():
+        try:
+            process_excel_file(excel_file, str(root), workers, yandex_api_url, on_complete)
+        except Exception as e:
+            logger.error(f"Downloading failed: {str(e)}")
+            failed.set()
+        finally:
+            for handler in handlers:
+                download_logger.removeHandler(handler)
+            arrivals.put(None)
+
+    threading.Thread(target=download, name="ingest", daemon=True).start()
+    return arrivals, failed
+
+def summary_path(out_dir, video_name, json_summary=False):
+    """The <video>_summary/ column store, or the exported JSON file"""
+    return out_dir / (f"{video_name}_summary.json" if json_summary else f"{video_name}_summary")
+
+_FAILED = object()
+
+def _meta(result):
+    # Older models returned (annotated_img, meta)
+    return result[1] if isinstance(result, tuple) else result
+
+def _run_batched(name, single, batched, imgs, idxs, inputs, logger):
+    """Run `batched` over the whole batch if available, otherwise (or if it
+    fails) call `single` frame by frame. Failed frames are marked _FAILED."""
+    if batched is not None and len(imgs) > 1:
+        try:
+            return batched(imgs, **inputs)
+        except Exception as e:
+            logger.warning(f"[{name}] batch of {len(imgs)} failed, retrying per frame: {str(e)}")
+
+    outs = []
+    for i, (idx, img) in enumerate(zip(idxs, imgs)):
+        try:
+            outs.append(single(img, **{k: v[i] for k, v in inputs.items()}))
+        except Exception as e:
+            logger.error(f"[{name}] failed on frame {idx}: {str(e)}")
+            outs.append(_FAILED)
+    return outs
+
+def _run_stage(stage_name, stage, frames, idxs, logger, metrics=None):
+    start = time.perf_counter()
+    imgs = [f.as_color(getattr(stage, "color", "bgr")) for f in frames]
+    outs = _run_batched(stage_name, stage.process, getattr(stage, "process_batch", None),
+                        imgs, idxs, {}, logger)
+    if metrics is not None:
+        metrics.observe(f"stage/{stage_name}", time.perf_counter() - start, len(frames))
+    return [None if out is _FAILED else out for out in outs]
+
+def _run_model(model_name, model, imgs, idxs, inputs, logger, metrics=None):
+    start = time.perf_counter()
+    # Models only read the frame (drawing happens later in render.py), so no copies
+    outs = _run_batched(model_name, model.predict, getattr(model, "predict_batch", None),
+                        imgs, idxs, inputs, logger)
+    if metrics is not None:
+        metrics.observe(f"model/{model_name}", time.perf_counter() - start, len(imgs))
+    return outs
+
+def _map(pool, fn, calls):
+    if pool is None:
+        return [fn(*args) for args in calls]
+    return [f.result() for f in [pool.submit(fn, *args) for args in calls]]
+
+def run_batch(models, stages, frames, logger, pool=None, metrics=None, shared=None):
+    """Run the shared stages and then every model over a batch of Frames.
+
+    Stages receive frames in the color order they declare (`color`, BGR by
+    default); models always receive BGR. With a thread `pool`, independent
+    stages (and then independent models) run concurrently; each one still
+    sees the frames in order, so results do not depend on the pool. Their
+    times are recorded as "stage/<name>" and "model/<name>" into `metrics`
+    (a metrics.VideoMetrics) if given.
+
+    Only the stages `models` require are run. `shared` ({stage: {frame
+    index: output}}) caches stage outputs across calls on the same frames:
+    outputs found there are reused and new ones are added.
+
+    Returns one {model_name: meta} dict per frame; models that failed on a
+    frame are left out of its dict.
+    """
+    shared = {} if shared is None else shared
+    needed = {s for model in models.values() for s in getattr(model, "requires", ())}
+
+    # Shared stages run once per frame, whatever number of models consume them
+    todo = []
+    for name, stage in stages.items():
+        done = shared.setdefault(name, {})
+        missing = [f for f in frames if f.idx not in done]
+        if name in needed and missing:
+            todo.append((name, stage, missing, [f.idx for f in missing], logger, metrics))
+    for call, outs in zip(todo, _map(pool, _run_stage, todo)):
+        shared[call[0]].update(zip(call[3], outs))
+
+    idxs = [f.idx for f in frames]
+    imgs = [f.bgr for f in frames]
+    calls = []
+    for model_name, model in models.items():
+        inputs = {s: [shared.get(s, {}).get(i) for i in idxs] for s in getattr(model, "requires", ())}
+        calls.append((model_name, model, imgs, idxs, inputs, logger, metrics))
+
+    results = [{} for _ in frames]
+    for model_name, outs in zip(models, _map(pool, _run_model, calls)):
+        for res, out in zip(results, outs):
+            if out is not _FAILED:
+                res[model_name] = out
+    return results
+
+def run_gated_batch(cascade, models, stages, frames, fps, logger, pool=None, metrics=None):
+    """run_batch under a cascade.Cascade: the ungated models run on every
+    frame, then each gated model on the frames its gate lets through, and
+    its last result is carried forward to the others except where its
+    `needs` fail, which get no result. Gates are decided frame by frame in
+    order; a flagged result holds its gate open from the next batch on."""
+    shared = {}
+    ungated = {name: model for name, model in models.items() if name not in cascade.policy}
+    results = run_batch(ungated, stages, frames, logger, pool, metrics, shared)
+
+    due, blocked = {}, {}
+    mesh = shared.get("face_mesh", {})
+    for frame, row in zip(frames, results):
+        fired = cascade.signals(row, mesh[frame.idx] is not None if frame.idx in mesh else None)
+        due[frame.idx] = cascade.due(frame.idx / fps, fired)
+        blocked[frame.idx] = cascade.blocked(fired)
+
+    for name in cascade.policy:
+        selected = [f for f in frames if name in due[f.idx]]
+        outs = run_batch({name: models[name]}, stages, selected, logger, pool, metrics, shared) if selected else []
+        fresh = {f.idx: out[name] for f, out in zip(selected, outs) if name in out}
+        for frame, row in zip(frames, results):
+            if frame.idx in fresh:
+                row[name] = cascade.record(name, frame.idx / fps, fresh[frame.idx])
+            elif name in blocked[frame.idx]:
+                cascade.drop(name)
+            elif name not in due[frame.idx]:
+                carried = cascade.carry(name)
+                if carried is not None:
+                    row[name] = carried
+    for name, outs in shared.items():
+        cascade.passes[name] += len(outs)
+    return results
+
+def extract_and_run(models, video_path, out_dir, frame_skip, logger, stages=None,
+                    batch_size=1, batch_wait=None, decode_chunk=16, prefetch=1,
+                    decode_threads=0, inference_threads=1, writer_threads=0, queue_size=64,
+                    render="all", student_id=None, show_progress=True, checkpoint=None,
+                    sampling=None, json_summary=False, frame_range=None, metrics=None, profile=None,
+                    cascade=None):
+    """Sample frames of one video, run the models and write frames + summary.
+
+    The default is the serial mode. `inference_threads > 1` runs independent
+    stages/models concurrently and `writer_threads > 0` moves JPEG writes to
+    a writer stage fed through a bounded queue, and the summary appends,
+    event segmentation and checkpoint commits of each batch to one more
+    writer thread of their own, which keeps them in frame order; the decoder
+    stage is the FrameSource prefetch thread. Outputs are identical in every
+    mode.
+
+    Frame images are drawn as selected by `render` (see flags.RENDER_MODES):
+    "all" from each frame as it is inferred, "events" and "composite" after
+    inference from the summary. With a checkpoint.VideoCheckpoint,
+    results are flushed periodically and a previous partial run is resumed.
+    `sampling` (AdaptiveSampler keyword arguments) replaces the fixed
+    `frame_skip` stride with motion- and flag-driven sampling. `frame_range`
+    (start, end) samples only those frames (end exclusive, None for the end
+    of the video) instead of the default window. `cascade` (a policy, see
+    cascade.py) runs the gated models only on the frames their gates let
+    through and carries their last results forward to the others.
+
+    Results are appended to the <video>_summary/ column store as they come
+    (see summary_store.py); `json_summary` also exports them as strict JSON.
+    They are also segmented into timed events, written to <video>_events.json
+    (see events.py). Returns a summary_store.SummaryReader.
+
+    Stage latencies, frame rates, queue depths and memory are recorded into
+    `metrics` (a new metrics.VideoMetrics by default) and written to
+    <video>_metrics.json. With `profile` (a sampling interval in seconds)
+    the video runs under metrics.SamplingProfiler and its stacks are written
+    to <video>_profile.txt.
+    """
+    # Imported here rather than at the top so that --help and --dry-run do
+    # not load decord, OpenCV and NumPy
+    import decord
+    from tqdm import tqdm
+    from frame_source import FrameSource
+    from metrics import VideoMetrics, SamplingProfiler
+    from render import render_video, write_annotated
+    from sampling import AdaptiveSampler
+    from cascade import Cascade
+    from summary_store import SummaryWriter, export_json
+
+    if stages is None:
+        stages = load_stages(models, logger)
+
+    # Models are reused across videos; drop per-video state such as the enrolled face
+    for model in models.values():
+        if hasattr(model, "reset"):
+            model.reset(student_id=student_id)
+    for stage in stages.values():
+        if hasattr(stage, "reset"):
+            stage.reset()
 
-def extract_and_run(models, video_path, out_dir, frame_skip, logger):
     try:
         ctx = decord.cpu(0)
-        vr = decord.VideoReader(str(video_path), ctx=ctx)
+        vr = decord.VideoReader(str(video_path), ctx=ctx, num_threads=decode_threads)
     except Exception as e:
         logger.error(f"Failed to open video {video_path}: {str(e)}")
         return None
@@ -63,53 +292,174 @@ def extract_and_run(models, video_path, out_dir, frame_skip, logger):
         return None
     
     frames_10min = int(6 * fps)
-    end_frame = min(frames_10min, total_frames)
+    start_frame, end_frame = 0, min(frames_10min, total_frames)
+    if frame_range is not None:
+        start_frame, end = frame_range
+        end_frame = total_frames if end is None else min(end, total_frames)
     
-    frame_indices = range(0, end_frame, frame_skip)
+    sampler = AdaptiveSampler(fps, **sampling) if sampling else None
+    gates = Cascade(models, cascade) if cascade else None
+    if sampler is not None:
+        frame_indices = sampler.candidates(end_frame, start_frame)
+    else:
+        frame_indices = range(start_frame, end_frame, frame_skip)
     
+    out_dir.mkdir(parents=True, exist_ok=True)
     frame_dir = out_dir / "frames"
-    frame_dir.mkdir(parents=True, exist_ok=True)
-    summaries = {m: [] for m in models}
+    segmenter = EventSegmenter()
+    committed = checkpoint.resume(models, segmenter) if checkpoint is not None else None
+    # Columns take the kinds the models declare; gated models also mark carried rows
+    specs = {name: registry.spec(name) for name in models}
+    if gates is not None:
+        specs.update({name: specs[name]._replace(outputs={**specs[name].outputs, "carried_forward": "bool"})
+                      for name in gates.policy if specs[name].outputs})
+    store = SummaryWriter(summary_path(out_dir, video_path.stem), specs, resume=committed)
+    if committed is not None:
+        last_done = checkpoint.last_frame
+        frame_indices = [i for i in frame_indices if i > last_done]
+        logger.info(f"Resuming {video_path.name} after frame {last_done}")
 
-    for idx in tqdm(frame_indices, desc=f"Processing {video_path.name}"):
-        try:
-            frame = vr[idx].asnumpy()
-            if frame.shape[2] == 3:
-                frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-            
-            for model_name, model in models.items():
+    if metrics is None:
+        metrics = VideoMetrics(video_path.name)
+    profiler = SamplingProfiler(profile).start() if profile else None
+    source = FrameSource(vr, frame_indices, chunk_size=decode_chunk, prefetch=prefetch, metrics=metrics)
+    batcher = MicroBatcher(batch_size, batch_wait)
+    writer = WriterStage(writer_threads, queue_size, metrics=metrics)
+    # Summary rows, events and checkpoint commits must stay in frame order:
+    # one thread of their own in pipeline mode, inline otherwise
+    summary_lane = WriterStage(min(1, writer_threads), queue_size)
+    rendered = 0
+    if render == "all":
+        frame_dir.mkdir(parents=True, exist_ok=True)
+    pool = ThreadPoolExecutor(inference_threads, thread_name_prefix="inference") if inference_threads > 1 else None
+    progress = tqdm(total=len(source), desc=f"Processing {video_path.name}", disable=not show_progress)
+
+    def sampled_frames():
+        for frame in source:
+            progress.update(1)
+            if sampler is None or sampler.accept(frame):
+                yield frame
+
+    def append_rows(rows):
+        """Append a batch's results to the summary columns and the event
+        segmenter, in frame order, committing where a checkpoint is due
+        and drawing the frames for --render all"""
+        nonlocal rendered
+        start = time.perf_counter()
+        for frame, frame_results, states in rows:
+            idx = frame.idx
+            row = {}
+            for model_name, result in frame_results.items():
                 try:
-                    result = model.predict(frame.copy())
-                    out_img, meta = (result if isinstance(result, tuple) 
-                                   else (result, {}))
-                    
                     # Convert all non-serializable types in metadata
-                    meta = convert_to_serializable(meta)
-                    
-                    frame_out_path = frame_dir / f"frame_{idx:05d}_{model_name}.jpg"
-                    cv2.imwrite(str(frame_out_path), out_img)
-                    
-                    summaries[model_name].append({
-                        "frame": idx,
-                        "timestamp": idx / fps,
-                        "meta": meta
-                    })
+                    meta = convert_to_serializable(_meta(result))
+                    store.append(model_name, idx, idx / fps, meta)
+                    row[model_name] = meta
                 except Exception as e:
                     logger.error(f"[{model_name}] failed on frame {idx}: {str(e)}")
-        except Exception as e:
-            logger.error(f"Error processing frame {idx}: {str(e)}")
-            continue
+            # Events follow what was actually inferred on this frame
+            fresh = {m: meta for m, meta in row.items() if not is_carried(meta)}
+            segmenter.update(idx, idx / fps, fresh)
+            if render == "all" and fresh:
+                # Drawn now from the decoded frame rather than re-decoded after inference
+                rendered += write_annotated(frame, list(fresh.items()), frame_dir, render, writer, metrics)
+            if states is not None:
+                flush_start = time.perf_counter()
+                checkpoint.flush(store, idx, states)
+                metrics.observe("checkpoint", time.perf_counter() - flush_start, checkpoint.every)
+        # Includes the checkpoint flushes, which are also timed on their own
+        metrics.observe("summary", time.perf_counter() - start, len(rows))
+
+    # Queues only exist in pipeline mode
+    queues = {}
+    if prefetch > 0:
+        queues["decode"] = lambda: source.queue_depth
+    if writer_threads > 0:
+        queues["writer"] = lambda: writer.queue_depth
+        queues["summary"] = lambda: summary_lane.queue_depth
+    infer_time, inferred = 0.0, 0
+    for batch in batcher.batches(sampled_frames()):
+        metrics.sample({name: depth() for name, depth in queues.items()})
+        start = time.perf_counter()
+        if gates is None:
+            results = run_batch(models, stages, batch, logger, pool, metrics)
+        else:
+            results = run_gated_batch(gates, models, stages, batch, fps, logger, pool, metrics)
+        infer_time += time.perf_counter() - start
+        inferred += len(batch)
+
+        # Sampling decisions follow what was actually inferred on each frame
+        # and are needed for the next batch, so they stay here
+        rows = []
+        for frame, frame_results in zip(batch, results):
+            if sampler is not None:
+                sampler.observe(frame.idx, any(is_flagged(m, _meta(r)) for m, r in frame_results.items()
+                                               if not is_carried(_meta(r))))
+            # A due commit takes the model states as of this frame
+            states = None
+            if checkpoint is not None and checkpoint.due(frame.idx):
+                states = checkpoint.model_states()
+            rows.append((frame, frame_results, states))
+        summary_lane.submit("summary", append_rows, rows)
+    summary_lane.close()
+    progress.close()
+    if pool is not None:
+        pool.shutdown()
 
-    # Convert all summaries to serializable format
-    for model_name in summaries:
-        summaries[model_name] = convert_to_serializable(summaries[model_name])
+    if sampler is not None:
+        logger.info(f"Adaptive sampling: inferred {sampler.sampled} of {sampler.scanned} scanned frames")
+    if gates is not None:
+        logger.info(f"Cascade: {gates.describe(len(models))}")
+        metrics.count("carried_forward", sum(gates.carried.values()))
+    for name, part in {**stages, **models}.items():
+        if getattr(part, "roi", None) is not None and part.roi.frames:
+            logger.info(f"[{name}] Face ROI: {part.roi.describe()}")
+    logger.info(f"Decode: {source.decoded} frames in {source.decode_time:.2f}s "
+                f"({source.decode_fps:.1f} fps); inference: {inferred} frames in {infer_time:.2f}s "
+                f"({inferred / infer_time if infer_time else 0.0:.1f} fps)")
+    metrics.count("decoded", source.decoded)
+    metrics.count("inferred", inferred)
+    metrics.rates.update(decode=source.decode_fps, inference=inferred / infer_time if infer_time else 0.0)
+
+    with metrics.time("summary_close"):
+        summaries = store.close()
+    if render == "all":
+        metrics.count("rendered", rendered)
+        logger.info(f"Rendered {rendered} images ({render}) while inferring")
+    elif render != "none":
+        start = time.perf_counter()
+        written = render_video(vr, summaries, frame_dir, render, writer, prefetch, metrics)
+        metrics.count("rendered", written)
+        logger.info(f"Rendered {written} images ({render}) in {time.perf_counter() - start:.2f}s")
     
-    summary_path = save_summary(out_dir, summaries, video_path.stem)
-    logger.info(f"Saved summary to {summary_path}")
+    events = segmenter.finish()
+    events_path = out_dir / f"{video_path.stem}_events.json"
+    writer.submit(events_path.name, save_events, events_path, events)
+    logger.info(f"Events: {counts(events) or 'none'}")
+    if json_summary:
+        json_path = summary_path(out_dir, video_path.stem, json_summary=True)
+        writer.submit(json_path.name, export_json, summaries, json_path)
+    writer.close()
+    if checkpoint is not None:
+        checkpoint.finish()
+    logger.info(f"Saved summary to {summaries.root}")
+
+    if profiler is not None:
+        profiler.stop()
+        profile_path = profiler.save(out_dir / f"{video_path.stem}_profile.txt")
+        metrics.profile = {"path": str(profile_path), "interval_s": profile, "samples": profiler.samples,
+                           "top": [{"function": name, "self": own, "total": total}
+                                   for name, own, total in profiler.top()]}
+        logger.info(f"Profile: {profiler.samples} samples in {profile_path}; hottest: "
+                    + ", ".join(f"{name} {own}" for name, own, _ in profiler.top(5)))
+    metrics.rates["overall"] = inferred / metrics.elapsed if inferred else 0.0
+    logger.info(metrics.describe())
+    metrics.save(out_dir / f"{video_path.stem}_metrics.json")
     return summaries
 
 def convert_to_serializable(obj):
     """Recursively convert objects to JSON-serializable formats"""
+    import numpy as np
     if obj is None:
         return None
     elif isinstance(obj, (str, int, float, bool)):
@@ -135,57 +485,415 @@ def convert_to_serializable(obj):
         except:
             return f"Unserializable object: {type(obj)}"
 
-def load_models(model_names, logger):
+def describe_models(model_names, logger):
+    """Log the stages, weights and outputs a run of `model_names` needs
+    (from the model registry, without loading anything)"""
+    models, stages, weights = registry.plan(model_names)
+    for name, spec in models.items():
+        outputs = ", ".join(f"{field}:{kind}" for field, kind in spec.outputs.items()) or "undeclared"
+        logger.info(f"Model {name}: stages [{', '.join(spec.requires)}], outputs {outputs}")
+    logger.info(f"Shared stages: {', '.join(stages) or 'none'}; weights: {', '.join(weights) or 'none'}")
+
+def load_models(model_names, logger, model_options=None):
+    """Load models/<name>.py for every name; `model_options` maps a model
+    name to keyword arguments for its load_model()"""
+    model_options = model_options or {}
     models = {}
     for name in model_names:
         try:
-            module = import_module(f"models.{name}")
-            model = module.load_model()
-            logger.info(f"Loaded model: {name}")
+            start = time.perf_counter()
+            model = registry.load_model(name, **model_options.get(name, {}))
+            logger.info(f"Loaded model: {name} ({time.perf_counter() - start:.2f}s)")
             models[name] = model
         except Exception as e:
             logger.error(f"Failed to load model {name}: {str(e)}")
     return models
 
-def main():
+def load_stages(models, logger, stage_options=None):
+    """Load every shared stage (models/<stage>.py) requested by the models
+    once; `stage_options` maps a stage name to keyword arguments for its
+    load_stage()"""
+    stage_options = stage_options or {}
+    stages = {}
+    for model in models.values():
+        for name in getattr(model, "requires", ()):
+            if name in stages:
+                continue
+            try:
+                start = time.perf_counter()
+                stages[name] = registry.load_stage(name, **stage_options.get(name, {}))
+                logger.info(f"Loaded stage: {name} ({time.perf_counter() - start:.2f}s)")
+            except Exception as e:
+                logger.error(f"Failed to load stage {name}: {str(e)}")
+    return stages
+
+def run_options(args):
+    """extract_and_run keyword arguments for the parsed command line"""
+    options = {
+        "frame_skip": args.frame_skip,
+        "batch_size": args.batch_size,
+        "batch_wait": args.batch_wait,
+        "decode_chunk": args.decode_chunk,
+        "prefetch": args.prefetch,
+        "decode_threads": args.decode_threads,
+        "render": args.render,
+        "checkpoint_every": args.checkpoint_every,
+        "json_summary": args.json_summary,
+    }
+    if args.sampling == "adaptive":
+        options["sampling"] = {
+            "scan_skip": args.scan_skip,
+            "motion_threshold": args.motion_threshold,
+            "max_gap": args.max_gap,
+            "dense_window": args.dense_window,
+            "budget": args.budget,
+        }
+    if args.start_frame is not None or args.end_frame is not None:
+        options["frame_range"] = (args.start_frame or 0, args.end_frame)
+    if args.profile:
+        options.update(profile=args.profile, profile_interval=args.profile_interval)
+    if args.cascade:
+        from cascade import load_policy
+        options["cascade"] = load_policy(args.cascade_policy)
+    if args.pipeline:
+        options.update(
+            inference_threads=args.inference_threads,
+            writer_threads=args.writer_threads,
+            queue_size=args.queue_size,
+        )
+    return options
+
+def model_options(args):
+    """load_model()/load_stage() keyword arguments per model and shared stage
+    for the parsed command line"""
+    options = {
+        "identity": {"mode": args.identity_mode, "det_size": args.identity_det_size,
+                     "gallery": args.gallery, "top_k": args.gallery_top_k},
+    }
+    if args.backend != "torch":
+        backend = {"backend": args.backend, "int8": args.int8}
+        options["identity"].update(backend)
+        options["detector"] = dict(backend)
+    if args.face_roi:
+        options["identity"].update(roi_margin=args.roi_margin, roi_det_size=args.roi_det_size)
+        options["face_mesh"] = {"roi_margin": args.roi_margin}
+    return options
+
+def process_video(models, stages, student_id, video_path, output_dir, options, logger,
+                  fingerprint=None):
+    """Run one video into <output_dir>/<student>/<video>/ and return its
+    (key, entry) for all_results.json, or None if it failed.
+
+    With a `fingerprint`, progress is checkpointed every
+    options["checkpoint_every"] frames and an interrupted run is resumed.
+    Videos matching one of the options["profile"] patterns (see
+    profile_selected) are profiled every options["profile_interval"] seconds.
+    """
+    video_path = Path(video_path)
+    out_dir = Path(output_dir) / student_id / video_path.stem
+    out_dir.mkdir(parents=True, exist_ok=True)
+    logger.info(f"Processing {video_path} → {out_dir}")
+    
+    options = dict(options)
+    every = options.pop("checkpoint_every", 0)
+    patterns, interval = options.pop("profile", None), options.pop("profile_interval", 0.005)
+    if patterns and profile_selected(student_id, video_path, patterns):
+        options["profile"] = interval
+    checkpoint = VideoCheckpoint(out_dir, video_path.stem, fingerprint, every) if fingerprint and every else None
+    summaries = extract_and_run(models, video_path, out_dir, logger=logger, stages=stages,
+                                student_id=student_id, checkpoint=checkpoint, **options)
+    if not summaries:
+        return None
+    entry = {
+        "summary_path": str(summaries.root),
+        "frame_count": len(next(iter(summaries.values()))),
+        "models": list(summaries.keys())
+    }
+    events_path = out_dir / f"{video_path.stem}_events.json"
+    if events_path.exists():
+        with open(events_path) as f:
+            entry["events_path"] = str(events_path)
+            entry["event_counts"] = json.load(f)["counts"]
+    if options.get("json_summary"):
+        entry["summary_json"] = str(summary_path(out_dir, video_path.stem, json_summary=True))
+    metrics_path = out_dir / f"{video_path.stem}_metrics.json"
+    if metrics_path.exists():
+        entry["metrics_path"] = str(metrics_path)
+    return f"{student_id}/{video_path.name}", entry
+
+def profile_selected(student_id, video_path, patterns):
+    """Whether one of the shell-style `patterns` matches the video as
+    student/file name, file name or stem"""
+    names = (f"{student_id}/{video_path.name}", video_path.name, video_path.stem)
+    return any(fnmatch(name, pattern) for pattern in patterns for name in names)
+
+def build_parser():
+    """The command line of run_inference.py, shared with client.py"""
     parser = argparse.ArgumentParser()
     parser.add_argument("--dataset-root", type=str, required=True)
     parser.add_argument("--output-dir", type=str, required=True)
     parser.add_argument("--models", nargs="+", default=["identity", "gaze", "headpose", "phone", "persons"])
     parser.add_argument("--frame-skip", type=int, default=5)
+    parser.add_argument("--sampling", choices=("fixed", "adaptive"), default="fixed",
+                        help="fixed: every --frame-skip-th frame; adaptive: scan every --scan-skip-th "
+                             "frame and infer on motion, flagged events and heartbeats")
+    parser.add_argument("--scan-skip", type=int, default=2,
+                        help="Stride of the cheap scene-change scan in adaptive mode")
+    parser.add_argument("--motion-threshold", type=float, default=0.02,
+                        help="Fraction of changed thumbnail pixels that triggers a sample")
+    parser.add_argument("--max-gap", type=float, default=10.0,
+                        help="Seconds without a sample before one is forced")
+    parser.add_argument("--dense-window", type=float, default=3.0,
+                        help="Seconds sampled densely after a flagged frame")
+    parser.add_argument("--budget", type=int, default=None,
+                        help="Maximum inferences per minute of video in adaptive mode")
+    parser.add_argument("--identity-mode", choices=("full", "fast"), default="full",
+                        help="fast: detection + recognition only, re-embedding only when the tracked face moves or changes")
+    parser.add_argument("--identity-det-size", type=int, default=640,
+                        help="InsightFace detector input size (e.g. 320 for webcam close-ups)")
+    parser.add_argument("--gallery", default=None,
+                        help="Identity gallery directory (see gallery.py) to name the closest enrolled students")
+    parser.add_argument("--gallery-top-k", type=int, default=3)
+    parser.add_argument("--face-roi", action="store_true",
+                        help="Look for the face in a crop around its previous position (face_mesh "
+                             "for gaze/headpose, and identity), and in the full frame only when it is lost")
+    parser.add_argument("--roi-margin", type=float, default=0.75,
+                        help="Margin of the face crop on every side, as a fraction of the face size")
+    parser.add_argument("--roi-det-size", type=int, default=256,
+                        help="InsightFace detector input size on the face crop")
+    parser.add_argument("--backend", choices=BACKENDS, default="torch",
+                        help="CPU runtime for YOLOv8 and ArcFace (convert first with `python -m models.backend`)")
+    parser.add_argument("--int8", action="store_true",
+                        help="Use the INT8-quantized models of --backend")
+    parser.add_argument("--cascade", action="store_true",
+                        help="Run the gated models (identity, gaze, phone, objects) only when cheap "
+                             "signals warrant it and carry their last results forward on other "
+                             "frames (see cascade.py)")
+    parser.add_argument("--cascade-policy", default=None, metavar="JSON",
+                        help="Cascade policy file replacing the default one (implies --cascade)")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="Sampled frames submitted together to batch-capable models")
+    parser.add_argument("--batch-wait", type=float, default=None,
+                        help="Flush a partial batch after this many seconds")
+    parser.add_argument("--decode-chunk", type=int, default=16,
+                        help="Sampled frames decoded per get_batch call")
+    parser.add_argument("--prefetch", type=int, default=1,
+                        help="Decoded chunks buffered ahead by the reader thread (0 decodes inline)")
+    parser.add_argument("--render", choices=RENDER_MODES, default="all",
+                        help="Annotated frames to write after inference: none, flagged events only, "
+                             "one image per model, or one composite image per frame")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Overlap decode, inference and writes in separate stages")
+    parser.add_argument("--decode-threads", type=int, default=0,
+                        help="Decoder threads per video (0 lets decord decide)")
+    parser.add_argument("--inference-threads", type=int, default=2,
+                        help="Stages/models run concurrently in pipeline mode")
+    parser.add_argument("--writer-threads", type=int, default=2,
+                        help="JPEG/summary writer threads in pipeline mode")
+    parser.add_argument("--queue-size", type=int, default=64,
+                        help="Pending writes before inference blocks in pipeline mode")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Process videos in parallel in this many worker processes")
+    parser.add_argument("--worker-threads", type=int, default=None,
+                        help="Threads per worker for torch/OpenCV/ONNX Runtime (default: cores / workers)")
+    parser.add_argument("--checkpoint-every", type=int, default=100,
+                        help="Flush per-video progress every N sampled frames (0 disables resuming)")
+    parser.add_argument("--json-summary", action="store_true",
+                        help="Also export each columnar summary as <video>_summary.json")
+    parser.add_argument("--force", action="store_true",
+                        help="Reprocess videos even if an identical finished run is recorded")
+    parser.add_argument("--ingest", default=None, metavar="EXCEL",
+                        help="Download the spreadsheet's links into --dataset-root and process "
+                             "each video as soon as its download completes")
+    parser.add_argument("--download-workers", type=int, default=4,
+                        help="Parallel downloads in --ingest mode")
+    parser.add_argument("--yandex-api-url", default=None,
+                        help="Yandex Disk download API endpoint in --ingest mode")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="List the models, stages, weights and videos of the run without loading or processing anything")
+    parser.add_argument("--videos", nargs="+", default=None, metavar="VIDEO",
+                        help="Only process these videos under --dataset-root")
+    parser.add_argument("--start-frame", type=int, default=None,
+                        help="Process frames from this index on instead of the default window")
+    parser.add_argument("--end-frame", type=int, default=None,
+                        help="Process frames up to this index (exclusive) instead of the default window")
+    parser.add_argument("--metrics-file", default=None, metavar="PATH",
+                        help="Keep the run's stage latencies, frame counts and memory in Prometheus "
+                             "text format in this file, updated after every video")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Serve the same metrics on http://127.0.0.1:PORT/metrics during the run")
+    parser.add_argument("--profile", nargs="+", default=None, metavar="VIDEO",
+                        help="Profile the videos matching these patterns (student/name, name or stem, "
+                             "shell wildcards) into <video>_profile.txt")
+    parser.add_argument("--profile-interval", type=float, default=0.005,
+                        help="Seconds between profiler samples")
     parser.add_argument("--log-level", type=str, default="INFO")
-    args = parser.parse_args()
+    return parser
+
+def check_args(parser, args):
+    """Checks across arguments that argparse cannot express"""
+    if args.int8 and args.backend == "torch":
+        parser.error("--int8 needs --backend onnx or openvino")
+    if args.videos and args.ingest:
+        parser.error("--videos cannot be combined with --ingest")
+    if args.start_frame is not None and args.start_frame < 0:
+        parser.error("--start-frame must be >= 0")
+    if args.end_frame is not None and args.end_frame <= (args.start_frame or 0):
+        parser.error("--end-frame must be after --start-frame")
+    if args.cascade_policy:
+        args.cascade = True
+        from cascade import load_policy
+        try:
+            load_policy(args.cascade_policy)
+        except (OSError, ValueError, TypeError) as e:
+            parser.error(f"--cascade-policy: {str(e)}")
+    if args.roi_margin <= 0:
+        parser.error("--roi-margin must be > 0")
+    if args.profile_interval <= 0:
+        parser.error("--profile-interval must be > 0")
+
+def select_videos(videos, paths):
+    """The (student_id, path) entries of `videos` that are among `paths`"""
+    wanted = {Path(p).resolve() for p in paths}
+    return [(student_id, video_path) for student_id, video_path in videos if video_path.resolve() in wanted]
+
+def load_all(model_names, logger, model_opts):
+    """(models, stages) for a run; the default loader of run()"""
+    models = load_models(model_names, logger, model_opts)
+    return models, load_stages(models, logger, model_opts)
+
+def run(args, logger, loader=load_all, on_result=None, show_progress=True):
+    """Process the videos selected by the parsed command line `args` and
+    write all_results.json; returns the exit status.
+
+    `loader(model_names, logger, model_options)` returns the (models,
+    stages) to use in this process (service.py passes one that keeps them
+    loaded between runs). `on_result(key, entry)` is called as each video
+    finishes. `show_progress` toggles the per-video progress bars.
+    """
+    try:
+        describe_models(args.models, logger)
+    except ImportError as e:
+        logger.critical(f"Cannot read model specs: {str(e)}")
+        return 1
+
+    options = dict(run_options(args), show_progress=show_progress)
+    model_opts = model_options(args)
+    manifest = RunManifest(args.output_dir)
+    # The manifest is also used from the download thread in --ingest mode
+    lock = threading.Lock()
+    all_results, admitted = {}, set()
+    # Set below when --metrics-file/--metrics-port ask for run-level metrics
+    exporter = None
+
+    def admit(student_id, video_path):
+        """The job for a video, or None if it was already admitted or an
+        identical finished run (same content, models and options) is reused"""
+        key = f"{student_id}/{video_path.name}"
+        with lock:
+            if key in admitted:
+                return None
+            admitted.add(key)
+            fingerprint = manifest.fingerprint(video_path, args.models, options, model_opts)
+            cached = None if args.force else manifest.lookup(key, fingerprint)
+            if cached:
+                all_results[key] = cached
+                return None
+        return student_id, video_path, fingerprint
+
+    def finished(fingerprint, result):
+        with lock:
+            all_results[result[0]] = result[1]
+            manifest.record(result[0], fingerprint, result[1])
+        if exporter is not None and "metrics_path" in result[1]:
+            try:
+                exporter.add_file(result[1]["metrics_path"])
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not export metrics of {result[0]}: {str(e)}")
+        if on_result is not None:
+            on_result(*result)
+
+    def discovered():
+        videos = get_all_videos(args.dataset_root)
+        return select_videos(videos, args.videos) if args.videos else videos
+
+    if args.dry_run:
+        if args.ingest:
+            from parser.parser import collect_downloads
+            try:
+                links = collect_downloads(args.ingest, args.dataset_root)
+            except Exception as e:
+                logger.error(f"Cannot read links from {args.ingest}: {str(e)}")
+                return 1
+            logger.info(f"Dry run: {len(links)} links would be downloaded into {args.dataset_root}")
+        else:
+            videos = discovered()
+            todo = [job for job in (admit(student_id, video_path) for student_id, video_path in videos) if job]
+            for student_id, video_path, _ in todo:
+                logger.info(f"Would process {video_path}")
+            logger.info(f"Dry run: {len(todo)} of {len(videos)} videos would be processed, "
+                        f"{len(all_results)} unchanged since the last run")
+        return 0
 
-    logger = setup_logger(args.output_dir, getattr(logging, args.log_level.upper()))
-    
     try:
         import decord
         logger.info(f"Using decord version {decord.__version__}")
     except Exception as e:
         logger.critical(f"Decord import failed: {str(e)}")
-        sys.exit(1)
-
-    videos = get_all_videos(args.dataset_root)
-    logger.info(f"Found {len(videos)} videos")
-
-    models = load_models(args.models, logger)
-    if not models:
-        logger.error("No models loaded")
-        sys.exit(1)
-
-    all_results = {}
-    for student_id, video_path in videos:
-        out_dir = Path(args.output_dir) / student_id / video_path.stem
-        out_dir.mkdir(parents=True, exist_ok=True)
-        logger.info(f"Processing {video_path} → {out_dir}")
-        
-        summaries = extract_and_run(models, video_path, out_dir, args.frame_skip, logger)
-        if summaries:
-            all_results[f"{student_id}/{video_path.name}"] = {
-                "summary_path": str(out_dir / f"{video_path.stem}_summary.json"),
-                "frame_count": len(next(iter(summaries.values()))),
-                "models": list(summaries.keys())
-            }
+        return 1
+
+    if args.metrics_file or args.metrics_port is not None:
+        from metrics import PrometheusExporter
+        try:
+            exporter = PrometheusExporter(args.metrics_file, args.metrics_port)
+        except OSError as e:
+            logger.critical(f"Cannot serve metrics on port {args.metrics_port}: {str(e)}")
+            return 1
+        if args.metrics_port is not None:
+            logger.info(f"Serving metrics on http://127.0.0.1:{args.metrics_port}/metrics")
+
+    download_failed = None
+    if args.ingest:
+        todo, download_failed = stream_downloads(args.ingest, args.dataset_root, args.download_workers,
+                                args.yandex_api_url, logger, admit)
+    else:
+        videos = discovered()
+        logger.info(f"Found {len(videos)} videos")
+        todo = [job for job in (admit(student_id, video_path) for student_id, video_path in videos) if job]
+        with lock:
+            manifest.save()
+        logger.info(f"{len(todo)} videos to process, {len(all_results)} unchanged since the last run")
+
+    try:
+        if todo and args.workers > 1:
+            run_pool(todo, args.models, args.output_dir, options, logger,
+                     args.workers, args.worker_threads, on_result=finished, model_options=model_opts)
+        elif todo:
+            models, stages = loader(args.models, logger, model_opts)
+            if not models:
+                logger.error("No models loaded")
+                return 1
+
+            for student_id, video_path, fingerprint in (iter(todo.get, None) if args.ingest else todo):
+                result = process_video(models, stages, student_id, video_path, args.output_dir,
+                                       options, logger, fingerprint)
+                if result:
+                    finished(fingerprint, result)
+    finally:
+        if exporter is not None:
+            exporter.close()
+
+    with lock:
+        manifest.save()
+
+    if args.videos:
+        # Keep the entries of the videos this run did not select
+        for key, record in manifest.videos.items():
+            all_results.setdefault(key, record["entry"])
+
+    # Keep the discovery order whatever order the videos finished in
+    order = [f"{student_id}/{video_path.name}" for student_id, video_path in get_all_videos(args.dataset_root)]
+    all_results = {key: all_results[key] for key in order if key in all_results}
 
     # Convert all results to serializable format
     all_results = convert_to_serializable(all_results)
@@ -194,6 +902,17 @@ def main():
     with open(master_results_path, 'w') as f:
         json.dump(all_results, f, indent=2)
     logger.info(f"Saved master results to {master_results_path}")
+    if download_failed is not None and download_failed.is_set():
+        logger.error(f"Downloads from {args.ingest} failed; only the videos that arrived were processed")
+        return 1
+    return 0
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+    check_args(parser, args)
+    logger = setup_logger(args.output_dir, getattr(logging, args.log_level.upper()))
+    sys.exit(run(args, logger))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
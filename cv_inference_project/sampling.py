@@ -0,0 +1,83 @@
+import threading
+from collections import deque
+
+import cv2
+import numpy as np
+
+class AdaptiveSampler:
+    """Picks which scanned frames get full inference.
+
+    Every `scan_skip`-th frame is scanned with a cheap signature: a ~64 px
+    wide grayscale thumbnail. A scanned frame is sampled when
+
+    - more than `motion_threshold` of its thumbnail pixels changed by over
+      `pixel_delta` levels since the last sampled frame,
+    - `max_gap` seconds of video passed since the last sample (heartbeat
+      during static periods),
+    - or it falls within `dense_window` seconds after a frame on which a
+      model raised a flag (see flags.py),
+
+    and at most `budget` frames are sampled per minute of video, if set.
+    """
+
+    def __init__(self, fps, scan_skip=2, motion_threshold=0.02, pixel_delta=20,
+                 max_gap=10.0, dense_window=3.0, budget=None, thumb_width=64):
+        self.fps = fps
+        self.scan_skip = max(1, int(scan_skip))
+        self.motion_threshold = motion_threshold
+        self.pixel_delta = pixel_delta
+        self.max_gap = max_gap
+        self.dense_window = dense_window
+        self.budget = budget
+        self.thumb_width = thumb_width
+        self.scanned = 0
+        self.sampled = 0
+        self._last_sig = None
+        self._last_time = None
+        self._dense_until = -1.0
+        self._recent = deque()
+        self._lock = threading.Lock()
+
+    def candidates(self, end_frame, start_frame=0):
+        return range(start_frame, end_frame, self.scan_skip)
+
+    def _signature(self, rgb):
+        h, w = rgb.shape[:2]
+        step = max(1, w // (2 * self.thumb_width))
+        small = rgb[::step, ::step]
+        size = (self.thumb_width, max(1, round(self.thumb_width * h / w)))
+        return cv2.cvtColor(cv2.resize(small, size, interpolation=cv2.INTER_AREA), cv2.COLOR_RGB2GRAY)
+
+    def _within_budget(self, t):
+        if not self.budget:
+            return True
+        while self._recent and self._recent[0] <= t - 60.0:
+            self._recent.popleft()
+        return len(self._recent) < self.budget
+
+    def accept(self, frame):
+        """Decide whether `frame` (a frame_source.Frame) is sampled"""
+        t = frame.idx / self.fps
+        sig = self._signature(frame.rgb)
+        with self._lock:
+            self.scanned += 1
+            if self._last_sig is None:
+                sample = True
+            elif t <= self._dense_until or t - self._last_time >= self.max_gap:
+                sample = True
+            else:
+                changed = np.count_nonzero(cv2.absdiff(sig, self._last_sig) > self.pixel_delta)
+                sample = changed / sig.size > self.motion_threshold
+
+            if not sample or not self._within_budget(t):
+                return False
+            self._last_sig, self._last_time = sig, t
+            self._recent.append(t)
+            self.sampled += 1
+            return True
+
+    def observe(self, idx, flagged):
+        """Feed back model results: a flagged frame keeps sampling dense"""
+        if flagged:
+            with self._lock:
+                self._dense_until = max(self._dense_until, idx / self.fps + self.dense_window)
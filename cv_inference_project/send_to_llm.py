@@ -1,21 +1,24 @@
 from openai import OpenAI
-import json
 import os
 import math
-from typing import Dict, Any
-
+import hashlib
+import argparse
+from pathlib import Path
+from typing import Dict, Any, List, Optional
 
 import json
 from datetime import datetime
 
+import numpy as np
+
 def save_prompt_to_json(prompt: str, filename: str = None) -> str:
     """
     Сохраняет промпт в JSON файл с метаданными
-    
+
     Args:
         prompt: Текст промпта для сохранения
         filename: Имя файла (если None, будет сгенерировано автоматически)
-    
+
     Returns:
         Путь к сохраненному файлу
     """
@@ -34,14 +37,25 @@ def save_prompt_to_json(prompt: str, filename: str = None) -> str:
 
     with open(filename, 'w', encoding='utf-8') as f:
         json.dump(prompt_data, f, ensure_ascii=False, indent=2)
-    
+
     return filename
 
 #deepseekr1
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key="",
-)
+MODEL = "deepseek/deepseek-r1"
+BASE_URL = "https://openrouter.ai/api/v1"
+
+_client = None
+
+def get_client() -> OpenAI:
+    """The OpenRouter client, created on first use so prompts can be built
+    without credentials"""
+    global _client
+    if _client is None:
+        _client = OpenAI(
+            base_url=BASE_URL,
+            api_key=os.environ.get("OPENROUTER_API_KEY", ""),
+        )
+    return _client
 
 def load_comparison_data(file_path: str) -> Dict[str, Any]:
     """Load frame comparison data from JSON file"""
@@ -59,152 +73,374 @@ def safe_float(value: Any) -> float:
     except (TypeError, ValueError):
         return 0.0
 
-def generate_range_analysis_prompt(data: Dict[str, Any]) -> str:
-    """Generate prompt"""
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for this kind of text)"""
+    return len(text) // 4 + 1
+
+def clock(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes:02d}:{seconds:02d}"
+
+def fmt(value: float, spec: str = ".2f") -> str:
+    return format(value, spec) if value is not None and math.isfinite(value) else "n/a"
+
+# (model, key in pairwise results, label, kind): "delta" values are averaged
+# and maxed, "change" values are counted
+METRICS = [
+    ("gaze", "angle_diff", "gaze angle Δ", "delta"),
+    ("gaze", "flag_changed", "gaze direction changes", "change"),
+    ("headpose", "yaw_diff", "yaw Δ", "delta"),
+    ("headpose", "pitch_diff", "pitch Δ", "delta"),
+    ("headpose", "roll_diff", "roll Δ", "delta"),
+    ("identity", "distance_diff", "face distance Δ", "delta"),
+    ("identity", "match_changed", "identity match changes", "change"),
+    ("phone", "count_diff", "phone appearances", "change"),
+    ("persons", "count_diff", "person count increases", "change"),
+]
+
+CHANGE_EVENTS = {
+    ("gaze", "flag_changed"): "gaze direction changed",
+    ("identity", "match_changed"): "identity match changed",
+    ("phone", "count_diff"): "phone appeared",
+    ("persons", "count_diff"): "another person appeared",
+}
+
+# Windows (seconds) tried for the timeline, finest first
+TIMELINE_WINDOWS = (60, 120, 300, 600, 1200, 1800, 3600, 7200)
+
+class Comparisons:
+    """Pairwise comparisons as NaN-padded arrays, one per METRICS entry"""
+
+    def __init__(self, data: Dict[str, Any], fps: float = 30.0):
+        pairs = data['pairwise_comparisons']
+        self.frame1 = np.array([p['frame1'] for p in pairs], dtype=np.int64)
+        self.frame2 = np.array([p['frame2'] for p in pairs], dtype=np.int64)
+        self.time = self.frame2 / fps
+        self.values = {}
+        for model, key, _, kind in METRICS:
+            column = []
+            for p in pairs:
+                value = p['results'].get(model, {}).get(key)
+                if value is None:
+                    column.append(np.nan)
+                elif kind == "change":
+                    # Changes count as events; for counts only increases do
+                    column.append(float(value > 0) if not isinstance(value, bool) else float(value))
+                else:
+                    column.append(safe_float(value))
+            values = np.array(column, dtype=np.float64)
+            values[~np.isfinite(values)] = np.nan
+            self.values[(model, key)] = values
+
+    def __len__(self):
+        return len(self.frame2)
+
+    def aggregate(self, mask=None) -> Dict[tuple, tuple]:
+        """(mean, max) of delta metrics, (count, None) of change metrics;
+        None where no finite value exists"""
+        out = {}
+        for model, key, _, kind in METRICS:
+            values = self.values[(model, key)]
+            if mask is not None:
+                values = values[mask]
+            finite = values[np.isfinite(values)]
+            if kind == "change":
+                out[(model, key)] = (int(finite.sum()) if finite.size else None, None)
+            else:
+                out[(model, key)] = ((float(finite.mean()), float(finite.max())) if finite.size
+                                     else (None, None))
+        return out
+
+    def windows(self, seconds: float):
+        """Index of the `seconds`-long window every pair ends in"""
+        return (self.time // seconds).astype(np.int64)
+
+def _metric_line(agg: Dict[tuple, tuple]) -> str:
+    parts = []
+    for model, key, label, kind in METRICS:
+        first, second = agg[(model, key)]
+        if first is None:
+            continue
+        if kind == "change":
+            if first:
+                parts.append(f"{label} {first}")
+        else:
+            parts.append(f"{label} avg {fmt(first)}/max {fmt(second)}")
+    return "; ".join(parts) or "no data"
+
+def _timeline(comps: Comparisons, seconds: int) -> List[str]:
+    windows = comps.windows(seconds)
+    lines = []
+    for w in np.unique(windows):
+        agg = comps.aggregate(windows == w)
+        lines.append(f"- {clock(w * seconds)}–{clock((w + 1) * seconds)}: {_metric_line(agg)}")
+    return lines
+
+def _anomaly_scores(comps: Comparisons, seconds: int = 60):
+    """Per-window outlier score: summed z-scores of the window means of the
+    delta metrics plus every change event"""
+    windows = comps.windows(seconds)
+    ids = np.unique(windows)
+    score = np.zeros(len(ids))
+    pos = np.searchsorted(ids, windows)
+    for model, key, _, kind in METRICS:
+        values = comps.values[(model, key)]
+        ok = np.isfinite(values)
+        sums = np.bincount(pos[ok], weights=values[ok], minlength=len(ids))
+        if kind == "change":
+            score += 2.0 * sums
+            continue
+        counts = np.bincount(pos[ok], minlength=len(ids))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = sums / counts
+        finite = np.isfinite(means)
+        if finite.sum() > 1 and np.std(means[finite]) > 0:
+            z = (means - np.mean(means[finite])) / np.std(means[finite])
+            score += np.where(finite, np.maximum(z, 0.0), 0.0)
+    return ids, score
+
+def _pair_line(comps: Comparisons, i: int) -> str:
+    parts = []
+    for model, key, label, kind in METRICS:
+        value = comps.values[(model, key)][i]
+        if not np.isfinite(value) or (kind == "change" and not value):
+            continue
+        parts.append(CHANGE_EVENTS[(model, key)] if kind == "change" else f"{label}={fmt(value)}")
+    return f"  - Frames {comps.frame1[i]} → {comps.frame2[i]} ({clock(comps.time[i])}): " + (", ".join(parts) or "stable")
+
+def _events_section(events: List[Dict[str, Any]], budget: int) -> str:
+    """Totals per event type, then the longest events in time order as far
+    as `budget` tokens allow"""
+    lines = ["\n## Detected Events"]
+    for name in sorted({e['event'] for e in events}):
+        of_type = [e for e in events if e['event'] == name]
+        total = sum(e['end'] - e['start'] for e in of_type)
+        lines.append(f"- {name}: {len(of_type)} times, {total:.0f} s in total, "
+                     f"first at {clock(of_type[0]['start'])}, last at {clock(of_type[-1]['start'])}")
+    longest = sorted(events, key=lambda e: e['end'] - e['start'], reverse=True)
+    shown = []
+    for event in longest:
+        line = (f"- {clock(event['start'])}–{clock(event['end'])} {event['event']}, "
+                f"peak {event['peak']:g}, {event['frames']} frames")
+        if estimate_tokens("\n".join(lines + [e for _, e in shown] + [line])) > budget:
+            break
+        shown.append((event['start'], line))
+    if shown:
+        title = "Events" if len(shown) == len(events) else f"Longest {len(shown)} events"
+        lines.append(f"\n### {title}")
+        lines += [line for _, line in sorted(shown)]
+    return "\n".join(lines) + "\n"
+
+def generate_range_analysis_prompt(data: Dict[str, Any], budget: int = 6000, fps: float = 30.0,
+                                   events: Optional[List[Dict[str, Any]]] = None) -> str:
+    """Generate a prompt of at most ~`budget` tokens, whatever the video length.
+
+    Sections, most important first: overview and whole-range aggregates; the
+    timed events (if given); a timeline of per-window aggregates whose window
+    grows (1 min, 2 min, 5 min, ...) until it fits its share of the budget;
+    and frame-level excerpts of the most anomalous minutes, added while
+    budget remains.
+    """
     frame_start = data['frame_range'][0]
     frame_end = data['frame_range'][1]
-    comparisons = data['pairwise_comparisons']
-    
+    comps = Comparisons(data, fps)
+
     prompt = f"""You are a professional video data analyst. Based on analysis of consecutive frames in the range {frame_start} to {frame_end}, provide a comprehensive technical report:
 
 ## Video Segment Overview
 - Frame range analyzed: {frame_start} to {frame_end}
-- Total pairwise comparisons: {len(comparisons)}
+- Total pairwise comparisons: {len(comps)}
+- Duration covered: {clock(comps.time[-1] - comps.time[0]) if len(comps) else "00:00"}
 - Key behavioral trends observed across frames:
 """
 
-    gaze_angle_diffs = []
-    headpose_yaw_diffs = []
-    headpose_pitch_diffs = []
-    headpose_roll_diffs = []
-    identity_dist_diffs = []
-    gaze_flag_changes = 0
-    identity_match_changes = 0
-    
-    for comp in comparisons:
-        results = comp['results']
-        
-        if 'gaze' in results:
-            gaze = results['gaze']
-            gaze_angle_diffs.append(safe_float(gaze['angle_diff']))
-            if gaze['flag_changed']:
-                gaze_flag_changes += 1
-                
-        if 'headpose' in results:
-            headpose = results['headpose']
-            headpose_yaw_diffs.append(safe_float(headpose['yaw_diff']))
-            headpose_pitch_diffs.append(safe_float(headpose['pitch_diff']))
-            headpose_roll_diffs.append(safe_float(headpose['roll_diff']))
-            
-        if 'identity' in results:
-            identity = results['identity']
-            identity_dist_diffs.append(safe_float(identity['distance_diff']))
-            if identity['match_changed']:
-                identity_match_changes += 1
-                
-    def safe_agg(values, func):
-        valid = [v for v in values if not math.isinf(v)]
-        return func(valid) if valid else 0.0
-    
+    agg = comps.aggregate()
+    def avg(model, key, spec=".2f"):
+        return fmt(agg[(model, key)][0], spec)
+    def peak(model, key, spec=".2f"):
+        return fmt(agg[(model, key)][1], spec)
+    def count(model, key):
+        return agg[(model, key)][0] or 0
+
     prompt += f"""
 ## Aggregate Metrics
 ### Gaze Analysis:
-- Average gaze angle difference: {safe_agg(gaze_angle_diffs, lambda x: sum(x)/len(x)):.2f}°
-- Maximum gaze angle change: {safe_agg(gaze_angle_diffs, max):.2f}°
-- Gaze direction changes: {gaze_flag_changes} times
+- Average gaze angle difference: {avg("gaze", "angle_diff")}°
+- Maximum gaze angle change: {peak("gaze", "angle_diff")}°
+- Gaze direction changes: {count("gaze", "flag_changed")} times
 
 ### Head Pose Analysis:
-- Yaw: avg {safe_agg(headpose_yaw_diffs, lambda x: sum(x)/len(x)):.2f}°, max {safe_agg(headpose_yaw_diffs, max):.2f}°
-- Pitch: avg {safe_agg(headpose_pitch_diffs, lambda x: sum(x)/len(x)):.2f}°, max {safe_agg(headpose_pitch_diffs, max):.2f}°
-- Roll: avg {safe_agg(headpose_roll_diffs, lambda x: sum(x)/len(x)):.2f}°, max {safe_agg(headpose_roll_diffs, max):.2f}°
+- Yaw: avg {avg("headpose", "yaw_diff")}°, max {peak("headpose", "yaw_diff")}°
+- Pitch: avg {avg("headpose", "pitch_diff")}°, max {peak("headpose", "pitch_diff")}°
+- Roll: avg {avg("headpose", "roll_diff")}°, max {peak("headpose", "roll_diff")}°
 
 ### Identity Analysis:
-- Average face distance difference: {safe_agg(identity_dist_diffs, lambda x: sum(x)/len(x)):.4f}
-- Identity match changes: {identity_match_changes} times
-"""
+- Average face distance difference: {avg("identity", "distance_diff", ".4f")}
+- Identity match changes: {count("identity", "match_changed")} times
 
-    prompt += "\n## Detailed Frame-to-Frame Analysis\n"
-    for i, comp in enumerate(comparisons):
-        frame1 = comp['frame1']
-        frame2 = comp['frame2']
-        results = comp['results']
-        
-        prompt += f"\n### Frames {frame1} → {frame2}\n"
-        
-        if 'gaze' in results:
-            gaze = results['gaze']
-            prompt += f"- Gaze: angle Δ={gaze['angle_diff']:.2f}°, "
-            prompt += "direction changed" if gaze['flag_changed'] else "direction stable"
-            
-        if 'headpose' in results:
-            headpose = results['headpose']
-            prompt += f"\n- Head: yaw Δ={headpose['yaw_diff']:.2f}°, "
-            prompt += f"pitch Δ={headpose['pitch_diff']:.2f}°, "
-            prompt += f"roll Δ={headpose['roll_diff']:.2f}°"
-            
-        if 'identity' in results:
-            identity = results['identity']
-            prompt += f"\n- Identity: distance Δ={identity['distance_diff']:.4f}, "
-            prompt += "match changed" if identity['match_changed'] else "match stable"
-            
-        if 'phone' in results:
-            phone = results['phone']
-            if phone['count_diff'] > 0:
-                prompt += f"\n- Phone: +{phone['count_diff']} detected"
-            elif phone['count_diff'] < 0:
-                prompt += f"\n- Phone: {abs(phone['count_diff'])} disappeared"
-            else:
-                prompt += "\n- Phone: no change"
-                
-        prompt += "\n"
+### Phone / Persons:
+- Phone appearances: {count("phone", "count_diff")}
+- Person count increases: {count("persons", "count_diff")}
+"""
 
-    prompt += """
+    conclusions = """
 ## Technical Conclusions
 - Overall behavioral patterns:
 - Significant attention points:
 - Recommendations for further investigation:
 """
+    remaining = budget - estimate_tokens(prompt) - estimate_tokens(conclusions)
+
+    if events:
+        section = _events_section(events, remaining // 3)
+        prompt += section
+        remaining -= estimate_tokens(section)
+
+    if len(comps):
+        # The timeline gets up to half of what is left, the excerpts the rest
+        for seconds in TIMELINE_WINDOWS:
+            lines = _timeline(comps, seconds)
+            section = f"\n## Timeline ({seconds // 60} min windows)\n" + "\n".join(lines) + "\n"
+            if estimate_tokens(section) <= remaining // 2:
+                break
+        # Still too long: merge adjacent windows, so the timeline keeps
+        # covering the whole video
+        while len(lines) > 1 and estimate_tokens(section) > remaining // 2:
+            seconds *= 2
+            lines = _timeline(comps, seconds)
+            section = f"\n## Timeline ({seconds // 60} min windows)\n" + "\n".join(lines) + "\n"
+        if estimate_tokens(section) <= remaining // 2:
+            prompt += section
+            remaining -= estimate_tokens(section)
+
+        ids, scores = _anomaly_scores(comps)
+        windows = comps.windows(60)
+        excerpts = ["\n## Anomalous Minutes (frame-level excerpts)"]
+        # Only minutes that stand out from the rest of the video
+        cutoff = max(0.0, float(scores.mean() + scores.std()))
+        for w in ids[np.argsort(-scores)]:
+            if scores[np.searchsorted(ids, w)] <= cutoff:
+                break
+            idx = np.flatnonzero(windows == w)
+            # The pairs with the largest changes in that minute
+            magnitude = sum(np.nan_to_num(comps.values[(m, k)][idx]) * (10.0 if kind == "change" else 1.0)
+                            for m, k, _, kind in METRICS)
+            block = [f"- {clock(w * 60)}–{clock((w + 1) * 60)}: {_metric_line(comps.aggregate(windows == w))}"]
+            block += [_pair_line(comps, i) for i in idx[np.argsort(-magnitude)[:5]]]
+            if estimate_tokens("\n".join(excerpts + block)) > remaining:
+                break
+            excerpts += block
+        if len(excerpts) > 1:
+            prompt += "\n".join(excerpts) + "\n"
+
+    prompt += conclusions
 
     return prompt
 
-def get_ai_analysis(prompt: str) -> str:
+class CompletionCache:
+    """Completions on disk, keyed by a hash of the prompt and every request
+    parameter, so an unchanged report is never requested twice"""
+
+    def __init__(self, root: str = ".llm_cache"):
+        self.root = Path(root)
+
+    def key(self, **request) -> str:
+        return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        if not path.exists():
+            return None
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)["content"]
+
+    def put(self, key: str, content: str) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({"created_at": datetime.now().isoformat(), "content": content}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+def get_ai_analysis(prompt: str, model: str = MODEL, temperature: float = 0.3,
+                    max_tokens: int = 2000, cache: Optional[CompletionCache] = None) -> str:
     """Send prompt to DeepSeek R1 via OpenRouter API using OpenAI client"""
-    completion = client.chat.completions.create(
-        model="deepseek/deepseek-r1",
-        messages=[
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ],
-        temperature=0.3,
-        max_tokens=2000
+    messages = [
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
+    key = None
+    if cache is not None:
+        key = cache.key(base_url=BASE_URL, model=model, messages=messages,
+                        temperature=temperature, max_tokens=max_tokens)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    completion = get_client().chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        max_tokens=max_tokens
     )
-    return completion.choices[0].message.content
+    content = completion.choices[0].message.content
+    if cache is not None:
+        cache.put(key, content)
+    return content
 
 def save_analysis_results(output_path: str, analysis: str) -> None:
     """Save analysis results to file"""
+    if str(output_path).endswith(".md"):
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(analysis)
+        return
     with open(output_path, 'w') as f:
         json.dump({"analysis": analysis}, f, indent=2)
 
 def main():
+    parser = argparse.ArgumentParser(description="Generate an LLM report from frame comparisons")
+    parser.add_argument("--input", required=True, help="compare_frames.py output")
+    parser.add_argument("--output", default="analysis_results.json", help=".md for plain markdown")
+    parser.add_argument("--events", default=None, help="<video>_events.json to include")
+    parser.add_argument("--budget", type=int, default=6000, help="Prompt size limit in tokens")
+    parser.add_argument("--fps", type=float, default=30.0, help="Video frame rate, for timestamps")
+    parser.add_argument("--model", default=MODEL)
+    parser.add_argument("--temperature", type=float, default=0.3)
+    parser.add_argument("--max-tokens", type=int, default=2000)
+    parser.add_argument("--cache-dir", default=".llm_cache")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--prompt-only", action="store_true", help="Save the prompt without calling the API")
+    args = parser.parse_args()
+
     try:
-        data = load_comparison_data(r"cv_inference_project\out\all_results.json")
+        data = load_comparison_data(args.input)
+        events = None
+        if args.events:
+            with open(args.events) as f:
+                events = json.load(f)["events"]
 
-        prompt = generate_range_analysis_prompt(data)
-        print("Generated prompt:\n", prompt)
+        prompt = generate_range_analysis_prompt(data, args.budget, args.fps, events)
+        print(f"Generated prompt (~{estimate_tokens(prompt)} tokens):\n", prompt)
 
         prompt_filename = save_prompt_to_json(prompt)
         print(f"Prompt saved to {prompt_filename}")
+        if args.prompt_only:
+            return
 
         print("\nGetting AI analysis...")
-        analysis = get_ai_analysis(prompt)
-        
-        save_analysis_results("analysis_results.json", analysis)
-        print("\nAnalysis saved to analysis_results.json")
-        
+        cache = None if args.no_cache else CompletionCache(args.cache_dir)
+        analysis = get_ai_analysis(prompt, args.model, args.temperature, args.max_tokens, cache)
+
+        save_analysis_results(args.output, analysis)
+        print(f"\nAnalysis saved to {args.output}")
+
     except Exception as e:
         print(f"Error: {str(e)}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,277 @@
+"""Long-running inference service that keeps the models loaded between runs.
+
+    python service.py --socket /tmp/cv_inference.sock --preload identity gaze headpose phone persons
+    python service.py --port 8765
+
+A run_inference.py invocation pays for importing the frameworks and loading
+YOLO, InsightFace and MediaPipe before its first frame. The service loads
+every model once per set of load options and reuses it for all later jobs,
+and the shared stages are cached by the model registry. Jobs are submitted
+with client.py, which takes the same arguments as run_inference.py.
+
+POST /run takes {"args": {...}} (run_inference arguments by dest) and
+streams newline-delimited JSON back: {"log": line} for every log record of
+the job, {"result": {"key": ..., "entry": ...}} as each video finishes and
+finally {"status": exit_status}. The models keep per-video state, so jobs
+run one at a time in arrival order. A client that disconnects does not
+cancel its job. GET /status reports the loaded models and the job counts.
+"""
+import os
+import sys
+import json
+import signal
+import socket
+import logging
+import argparse
+import threading
+import http.client
+from urllib.parse import urlparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn, UnixStreamServer
+
+SOCKET = os.environ.get("INFERENCE_SOCKET", "/tmp/cv_inference.sock")
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+def connect(socket_path=None, url=None, timeout=None):
+    """An HTTP connection to the service at `url` (http://host:port) or on
+    the Unix socket `socket_path` (SOCKET by default)"""
+    if url:
+        parsed = urlparse(url)
+        return http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=timeout)
+    return UnixHTTPConnection(socket_path or SOCKET, timeout=timeout)
+
+def job_args(params):
+    """argparse.Namespace for a job: run_inference's defaults updated with
+    the client's `params`"""
+    from run_inference import build_parser
+
+    args = build_parser().parse_args(["--dataset-root", params["dataset_root"],
+                                      "--output-dir", params["output_dir"]])
+    unknown = set(params) - set(vars(args))
+    if unknown:
+        raise ValueError(f"Unknown arguments: {', '.join(sorted(unknown))}")
+    vars(args).update(params)
+    return args
+
+class WarmModels:
+    """The loader passed to run_inference.run(): each model is loaded once
+    per (name, load options) and kept for the lifetime of the service"""
+
+    def __init__(self):
+        self.models = {}
+
+    def __call__(self, model_names, logger, model_opts):
+        from run_inference import load_models, load_stages
+
+        models = {}
+        for name in model_names:
+            key = (name, json.dumps(model_opts.get(name, {}), sort_keys=True, default=str))
+            if key not in self.models:
+                loaded = load_models([name], logger, model_opts)
+                if name not in loaded:
+                    continue
+                self.models[key] = loaded[name]
+            else:
+                logger.info(f"Reusing loaded model: {name}")
+            models[name] = self.models[key]
+        return models, load_stages(models, logger, model_opts)
+
+class JobLogHandler(logging.Handler):
+    """Forwards a job's log records to its client as {"log": line}"""
+
+    def __init__(self, send):
+        super().__init__()
+        self.send = send
+
+    def emit(self, record):
+        self.send({"log": self.format(record)})
+
+class InferenceService:
+    def __init__(self):
+        self.loader = WarmModels()
+        self.queued = 0
+        self.completed = 0
+        self._job_lock = threading.Lock()
+        self._count_lock = threading.Lock()
+
+    def status(self):
+        with self._count_lock:
+            return {"models": sorted({name for name, _ in self.loader.models}),
+                    "queued": self.queued, "completed": self.completed}
+
+    def preload(self, model_names):
+        from run_inference import build_parser, model_options
+
+        logger = logging.getLogger("inference")
+        defaults = build_parser().parse_args(["--dataset-root", ".", "--output-dir", "."])
+        with self._job_lock:
+            self.loader(model_names, logger, model_options(defaults))
+
+    def submit(self, args, send):
+        """Run one job when the previous ones are done; returns its exit status"""
+        with self._count_lock:
+            self.queued += 1
+            ahead = self.queued - 1
+        if ahead:
+            send({"log": f"Queued behind {ahead} job(s)"})
+        with self._job_lock:
+            with self._count_lock:
+                self.queued -= 1
+            try:
+                return self._run(args, send)
+            finally:
+                with self._count_lock:
+                    self.completed += 1
+
+    def _run(self, args, send):
+        from run_inference import setup_logger, run
+
+        # The job gets run_inference.log in its output directory like a
+        # command line run, and its client's stream instead of the console
+        logger = logging.getLogger("inference")
+        before = list(logger.handlers)
+        setup_logger(args.output_dir, getattr(logging, args.log_level.upper()))
+        added = [h for h in logger.handlers if h not in before]
+        for handler in added:
+            if not isinstance(handler, logging.FileHandler):
+                logger.removeHandler(handler)
+        added = [h for h in added if isinstance(h, logging.FileHandler)]
+        client = JobLogHandler(send)
+        client.setFormatter(added[0].formatter)
+        logger.addHandler(client)
+        try:
+            return run(args, logger, self.loader, show_progress=False,
+                       on_result=lambda key, entry: send({"result": {"key": key, "entry": entry}}))
+        except Exception as e:
+            logger.exception(f"Job failed: {str(e)}")
+            return 1
+        finally:
+            for handler in added + [client]:
+                logger.removeHandler(handler)
+                handler.close()
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    service = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/status":
+            self._json(200, self.service.status())
+        else:
+            self._json(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/run":
+            self._json(404, {"error": f"unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            args = job_args(json.loads(self.rfile.read(length))["args"])
+        except (KeyError, TypeError, ValueError) as e:
+            self._json(400, {"error": f"bad job: {str(e)}"})
+            return
+
+        # No Content-Length: the stream ends when the connection is closed
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        lock = threading.Lock()
+        gone = False
+
+        def send(message):
+            nonlocal gone
+            with lock:
+                if gone:
+                    return
+                try:
+                    self.wfile.write((json.dumps(message) + "\n").encode())
+                    self.wfile.flush()
+                except OSError:
+                    # The job keeps running; its results still land in the output directory
+                    gone = True
+
+        send({"status": self.service.submit(args, send)})
+
+class UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+def serve(service, socket_path=None, host=None, port=None):
+    """An HTTP server for `service` on `host`:`port`, or else on the Unix
+    socket `socket_path`; call serve_forever() on it"""
+    handler = type("Handler", (ServiceHandler,), {"service": service})
+    if port is not None:
+        server = ThreadingHTTPServer((host or "127.0.0.1", port), handler)
+        server.daemon_threads = True
+        return server
+
+    socket_path = socket_path or SOCKET
+    if os.path.exists(socket_path):
+        try:
+            conn = connect(socket_path, timeout=1)
+            conn.request("GET", "/status")
+            conn.getresponse().read()
+            raise RuntimeError(f"An inference service is already listening on {socket_path}")
+        except OSError:
+            os.unlink(socket_path)
+    server = UnixHTTPServer(socket_path, handler)
+    os.chmod(socket_path, 0o600)
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Inference service that keeps the models loaded")
+    parser.add_argument("--socket", default=None, help=f"Unix socket to listen on (default {SOCKET})")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface for --port")
+    parser.add_argument("--port", type=int, default=None, help="Listen on localhost HTTP instead of a Unix socket")
+    parser.add_argument("--preload", nargs="+", default=[], metavar="MODEL",
+                        help="Models to load at startup with the default options")
+    parser.add_argument("--log-level", type=str, default="INFO")
+    args = parser.parse_args()
+
+    logger = logging.getLogger("inference")
+    logger.setLevel(getattr(logging, args.log_level.upper()))
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'))
+    logger.addHandler(console)
+    service = InferenceService()
+    if args.preload:
+        service.preload(args.preload)
+    try:
+        server = serve(service, args.socket, args.host, args.port)
+    except (RuntimeError, OSError) as e:
+        logger.critical(str(e))
+        sys.exit(1)
+    where = f"http://{args.host}:{server.server_address[1]}" if args.port is not None else args.socket or SOCKET
+    logger.info(f"Inference service listening on {where}")
+    # Shut down cleanly (and remove the socket) when stopped by a service manager
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.port is None:
+            os.unlink(args.socket or SOCKET)
+
+if __name__ == "__main__":
+    main()
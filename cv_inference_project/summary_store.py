@@ -0,0 +1,405 @@
+"""Columnar per-video summary storage.
+
+<video>_summary/ holds one directory per model with a frame and a timestamp
+column plus one typed column per metadata field, appended in chunks while
+the video is processed:
+
+    schema.json                      column kinds and committed row counts
+    <model>/frame.bin                int64
+    <model>/timestamp.bin            float64
+    <model>/<field>.bin              bool/int/float values, or the flattened
+                                     values of list/text/json fields
+    <model>/<field>.valid            uint8, 0 where the field was missing
+    <model>/<field>.ends             int64 end offsets into .bin (list/text/json)
+
+Only the row counts in schema.json are trusted, so bytes appended after the
+last flush are ignored (and cut off on resume). Columns are memory-mapped on
+read. export_json writes the old {model: [{frame, timestamp, meta}]} layout
+as standards-compliant JSON (non-finite floats become null).
+"""
+import os
+import json
+import shutil
+import logging
+import math
+from collections.abc import Mapping
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger("inference")
+
+SCALAR_KINDS = {"bool": "|u1", "int": "<i8", "float": "<f8"}
+VARIABLE_KINDS = ("list", "text", "json")
+
+def _kind(value):
+    if isinstance(value, bool):
+        return "bool", None
+    if isinstance(value, int):
+        return "int", None
+    if isinstance(value, float):
+        return "float", None
+    if isinstance(value, str):
+        return "text", None
+    if isinstance(value, (list, tuple)):
+        try:
+            arr = np.asarray(value)
+        except ValueError:
+            return "json", None
+        if arr.dtype.kind in "biuf":
+            return "list", arr
+    return "json", None
+
+def _empty(value):
+    return isinstance(value, (list, tuple)) and not len(value)
+
+def _column_spec(value, kind=None):
+    """A new column for `value`, or of the declared `kind`"""
+    arr = None
+    if kind is None:
+        kind, arr = _kind(value)
+    if kind == "list":
+        # dtype, item shape and, when not declared, even the kind (a list of
+        # strings is json) stay open until the first non-empty list
+        if arr is None or not arr.size:
+            return {"kind": kind, "dtype": None, "item_shape": None, "size": 0}
+        dtype = "<i8" if arr.dtype.kind in "biu" else "<f8"
+        return {"kind": kind, "dtype": dtype, "item_shape": list(arr.shape[1:]), "size": 0}
+    if kind in VARIABLE_KINDS:
+        return {"kind": kind, "dtype": "|u1", "size": 0}
+    return {"kind": kind, "dtype": SCALAR_KINDS[kind]}
+
+class SummaryWriter:
+    """Buffers per-frame results and appends them to the column files.
+
+    A fresh writer clears `root`; `resume` ({model: rows} from a checkpoint)
+    keeps the first rows of every model instead. Buffered rows are written
+    every `chunk_rows` frames and on flush().
+
+    When `models` maps model names to their registry.ModelSpec, fields are
+    stored in the column kinds declared in SPEC.outputs: values of another
+    kind (a non-integral number in an int column included) are marked
+    missing with a warning, and undeclared fields are stored in the kind of
+    their first value with a warning. Otherwise every column takes the kind
+    of its first value, and an int column that gets a non-integral number is
+    widened to float.
+    """
+
+    def __init__(self, root, models, resume=None, chunk_rows=256):
+        self.root = Path(root)
+        self.chunk_rows = max(1, int(chunk_rows))
+        self.schema = {"version": 1, "models": {}}
+        self.outputs = {}
+        if isinstance(models, Mapping):
+            self.outputs = {m: dict(getattr(s, "outputs", None) or {}) for m, s in models.items()}
+        for model, outputs in self.outputs.items():
+            for field, kind in outputs.items():
+                if kind not in SCALAR_KINDS and kind not in VARIABLE_KINDS:
+                    raise ValueError(f"{model}.{field}: unknown output kind {kind!r}")
+        self._pending = {m: [] for m in models}
+        self._buffered = 0
+        self._warned = set()
+
+        if resume is not None and (self.root / "schema.json").exists():
+            with open(self.root / "schema.json") as f:
+                self.schema = json.load(f)
+            self._truncate(resume)
+        elif self.root.exists():
+            shutil.rmtree(self.root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        for model in models:
+            self.schema["models"].setdefault(model, {"rows": 0, "columns": {}})
+            (self.root / model).mkdir(exist_ok=True)
+        self._save_schema()
+
+    @property
+    def rows(self):
+        """Committed rows per model"""
+        return {m: s["rows"] for m, s in self.schema["models"].items()}
+
+    def append(self, model, frame, timestamp, meta):
+        self._pending[model].append((frame, timestamp, meta))
+        self._buffered += 1
+        if self._buffered >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        if not self._buffered:
+            return
+        for model, rows in self._pending.items():
+            if rows:
+                self._write_chunk(model, rows)
+                self._pending[model] = []
+        self._buffered = 0
+        self._save_schema()
+
+    def _path(self, model, name):
+        return self.root / model / name
+
+    def _append(self, model, name, array):
+        with open(self._path(model, name), 'ab') as f:
+            f.write(np.ascontiguousarray(array).tobytes())
+
+    def _write_chunk(self, model, rows):
+        spec = self.schema["models"][model]
+        start = spec["rows"]
+        self._append(model, "frame.bin", np.array([r[0] for r in rows], dtype="<i8"))
+        self._append(model, "timestamp.bin", np.array([r[1] for r in rows], dtype="<f8"))
+
+        fields = list(spec["columns"])
+        for _, _, meta in rows:
+            fields.extend(k for k in meta if k not in spec["columns"] and k not in fields)
+        for field in fields:
+            values = [meta.get(field) for _, _, meta in rows]
+            column = spec["columns"].get(field)
+            if column is None:
+                present = [v for v in values if v is not None]
+                first = next((v for v in present if not _empty(v)), present[0] if present else None)
+                if first is None:
+                    continue
+                declared = self.outputs.get(model, {}).get(field)
+                if declared is None and self.outputs.get(model):
+                    logger.warning(f"[{model}] {field} is not declared in SPEC.outputs; "
+                                   f"stored as {_kind(first)[0]}")
+                column = spec["columns"][field] = _column_spec(first, declared)
+                # Rows written before the field first appeared are missing
+                self._write_column(model, field, column, [None] * start)
+            self._write_column(model, field, column, values)
+        spec["rows"] = start + len(rows)
+
+    def _coerce(self, column, value):
+        kind = column["kind"]
+        if kind == "json":
+            return json.dumps(value).encode()
+        if kind == "text":
+            return str(value).encode()
+        if kind == "list":
+            arr = np.asarray(value)
+            if arr.size and column["dtype"] is None:
+                column["dtype"] = "<i8" if arr.dtype.kind in "biu" else "<f8"
+                column["item_shape"] = list(arr.shape[1:])
+            if arr.size and arr.dtype.kind not in "biuf":
+                raise ValueError(f"{arr.dtype} values")
+            if arr.size and list(arr.shape[1:]) != column["item_shape"]:
+                raise ValueError(f"shape {arr.shape} does not match {column['item_shape']}")
+            return arr.reshape(-1)
+        if kind == "bool":
+            if not isinstance(value, (bool, np.bool_)):
+                raise ValueError(f"{value!r} is not a bool")
+            return bool(value)
+        if isinstance(value, (str, bytes, list, tuple, dict)):
+            raise ValueError(f"{value!r} is not a number")
+        return int(value) if kind == "int" and float(value).is_integer() else float(value)
+
+    def _write_column(self, model, field, column, values):
+        if not values:
+            return
+        if (column["kind"] == "list" and column["dtype"] is None
+                and field not in self.outputs.get(model, {})):
+            first = next((v for v in values if isinstance(v, (list, tuple)) and len(v)), None)
+            if first is not None and _kind(first)[0] == "json":
+                self._reopen_json(model, field, column)
+        kind = column["kind"]
+        declared = field in self.outputs.get(model, {})
+        valid = np.ones(len(values), dtype="|u1")
+        items = []
+        for i, value in enumerate(values):
+            try:
+                if value is None:
+                    raise KeyError(field)
+                item = self._coerce(column, value)
+                if kind == "int" and declared and isinstance(item, float):
+                    # Only inferred int columns are widened to float
+                    raise ValueError(f"{value!r} is not an integer")
+                items.append(item)
+            except Exception as e:
+                valid[i] = 0
+                items.append(None)
+                if value is not None and (model, field) not in self._warned:
+                    self._warned.add((model, field))
+                    logger.warning(f"[{model}] {field}: cannot store {type(value).__name__} "
+                                   f"in a {kind} column ({str(e)}); marked missing")
+            if kind == "int" and isinstance(items[-1], float):
+                # A float in an int column: promote the column and rewrite it
+                self._promote(model, field, column)
+                return self._write_column(model, field, column, values)
+        self._append(model, f"{field}.valid", valid)
+
+        if kind in SCALAR_KINDS:
+            fill = np.nan if kind == "float" else 0
+            self._append(model, f"{field}.bin",
+                         np.array([fill if v is None else v for v in items], dtype=column["dtype"]))
+            return
+        lengths = np.array([0 if v is None else len(v) for v in items], dtype="<i8")
+        ends = column["size"] + np.cumsum(lengths)
+        self._append(model, f"{field}.ends", ends)
+        column["size"] = int(ends[-1])
+        if kind == "list":
+            data = np.concatenate([v for v in items if v is not None] or [np.empty(0)])
+            self._append(model, f"{field}.bin", data.astype(column["dtype"] or "<f8"))
+        else:
+            self._append(model, f"{field}.bin", np.frombuffer(b"".join(v for v in items if v), "|u1"))
+
+    def _promote(self, model, field, column):
+        """Widen an inferred int column to float"""
+        path = self._path(model, f"{field}.bin")
+        values = np.fromfile(path, dtype="<i8") if path.exists() else np.empty(0, "<i8")
+        column.update(kind="float", dtype="<f8")
+        values.astype("<f8").tofile(path)
+
+    def _reopen_json(self, model, field, column):
+        """An open list column (only empty lists so far) that turns out to
+        hold non-numeric items becomes a json column of its "[]"s"""
+        path = self._path(model, f"{field}.valid")
+        valid = np.fromfile(path, dtype="|u1") if path.exists() else np.empty(0, "|u1")
+        ends = np.cumsum(2 * valid.astype("<i8"))
+        ends.tofile(self._path(model, f"{field}.ends"))
+        with open(self._path(model, f"{field}.bin"), 'wb') as f:
+            f.write(b"[]" * int(valid.sum()))
+        column.pop("item_shape", None)
+        column.update(kind="json", dtype="|u1", size=int(ends[-1]) if len(ends) else 0)
+
+    def _truncate(self, rows):
+        """Cut every model back to rows[model] committed rows"""
+        for model, spec in self.schema["models"].items():
+            n = min(rows.get(model, 0), spec["rows"])
+            _truncate_file(self._path(model, "frame.bin"), n * 8)
+            _truncate_file(self._path(model, "timestamp.bin"), n * 8)
+            for field, column in spec["columns"].items():
+                _truncate_file(self._path(model, f"{field}.valid"), n)
+                if column["kind"] in SCALAR_KINDS:
+                    _truncate_file(self._path(model, f"{field}.bin"), n * np.dtype(column["dtype"]).itemsize)
+                    continue
+                ends_path = self._path(model, f"{field}.ends")
+                ends = np.fromfile(ends_path, dtype="<i8", count=n) if n else np.empty(0, "<i8")
+                column["size"] = int(ends[-1]) if n else 0
+                _truncate_file(ends_path, n * 8)
+                width = np.dtype(column["dtype"] or "<f8").itemsize
+                _truncate_file(self._path(model, f"{field}.bin"), column["size"] * width)
+            spec["rows"] = n
+
+    def _save_schema(self):
+        from checkpoint import write_json_atomic
+        write_json_atomic(self.root / "schema.json", self.schema)
+
+    def close(self):
+        self.flush()
+        return SummaryReader(self.root)
+
+def _truncate_file(path, size):
+    if path.exists():
+        with open(path, 'r+b') as f:
+            f.truncate(size)
+
+def _memmap(path, dtype, count):
+    if count == 0 or not path.exists():
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=(count,))
+
+class ModelColumns:
+    """Memory-mapped columns of one model"""
+
+    def __init__(self, root, spec):
+        self.root = Path(root)
+        self.rows = spec["rows"]
+        self.columns = spec["columns"]
+        self.frame = _memmap(self.root / "frame.bin", "<i8", self.rows)
+        self.timestamp = _memmap(self.root / "timestamp.bin", "<f8", self.rows)
+
+    def __len__(self):
+        return self.rows
+
+    def valid(self, field):
+        return _memmap(self.root / f"{field}.valid", "|u1", self.rows).astype(bool)
+
+    def column(self, field):
+        """A bool/int/float field as an array (NaN/0 where missing); list,
+        text and json fields as (values, ends)"""
+        column = self.columns[field]
+        if column["kind"] in SCALAR_KINDS:
+            values = _memmap(self.root / f"{field}.bin", column["dtype"], self.rows)
+            return values.astype(bool) if column["kind"] == "bool" else values
+        ends = _memmap(self.root / f"{field}.ends", "<i8", self.rows)
+        count = int(ends[-1]) if len(ends) else 0
+        return _memmap(self.root / f"{field}.bin", column["dtype"] or "<f8", count), ends
+
+    def values(self, field):
+        """Per-row Python values of a field, None where missing"""
+        column = self.columns[field]
+        valid = self.valid(field)
+        kind = column["kind"]
+        if kind in SCALAR_KINDS:
+            return [v if ok else None for v, ok in zip(self.column(field).tolist(), valid)]
+        data, ends = self.column(field)
+        shape = [-1] + (column.get("item_shape") or [])
+        out, start = [], 0
+        for end, ok in zip(ends.tolist(), valid):
+            chunk = data[start:end]
+            start = end
+            if not ok:
+                out.append(None)
+            elif kind == "list":
+                out.append(np.asarray(chunk).reshape(shape).tolist())
+            elif kind == "text":
+                out.append(bytes(chunk).decode())
+            else:
+                out.append(json.loads(bytes(chunk).decode()))
+        return out
+
+    def __iter__(self):
+        """Rows in the old summary layout: {"frame", "timestamp", "meta"}"""
+        fields = {field: self.values(field) for field in self.columns}
+        for i, (frame, ts) in enumerate(zip(self.frame.tolist(), self.timestamp.tolist())):
+            meta = {field: values[i] for field, values in fields.items() if values[i] is not None}
+            yield {"frame": frame, "timestamp": ts, "meta": meta}
+
+class SummaryReader(Mapping):
+    """{model: ModelColumns} view of a <video>_summary/ directory"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        with open(self.root / "schema.json") as f:
+            self.schema = json.load(f)
+
+    def __getitem__(self, model):
+        return ModelColumns(self.root / model, self.schema["models"][model])
+
+    def __iter__(self):
+        return iter(self.schema["models"])
+
+    def __len__(self):
+        return len(self.schema["models"])
+
+def _finite(obj):
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {k: _finite(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_finite(v) for v in obj]
+    return obj
+
+def export_json(summaries, path):
+    """Write {model: [{frame, timestamp, meta}]} as strict JSON, one model
+    at a time"""
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, 'w') as f:
+        f.write("{")
+        for i, (model, entries) in enumerate(summaries.items()):
+            f.write(("," if i else "") + f"\n  {json.dumps(model)}: [")
+            for j, entry in enumerate(entries):
+                f.write(("," if j else "") + "\n    " + json.dumps(_finite(entry), allow_nan=False))
+            f.write("\n  ]")
+        f.write("\n}\n")
+    os.replace(tmp, path)
+    return path
+
+def load_summary(path):
+    """A summary as {model: entries}: a columnar <video>_summary/ directory
+    (read lazily) or a JSON file"""
+    path = Path(path)
+    if path.is_dir():
+        return SummaryReader(path)
+    with open(path) as f:
+        return json.load(f)
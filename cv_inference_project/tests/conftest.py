@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The project's modules are imported flat (from summary_store import ...)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
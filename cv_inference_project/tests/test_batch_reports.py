@@ -0,0 +1,52 @@
+import json
+import random
+import asyncio
+
+import pytest
+
+from batch_reports import LLMClient, generate_reports
+from llm_stub import serve
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(**options):
+        server = serve(port=0, latency=0.01, **options)
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+def _jobs(tmp_path, count):
+    jobs = []
+    for n in range(count):
+        summary = {"gaze": [{"frame": i, "timestamp": i / 30,
+                             "meta": {"gaze_angle": float((i + n) % 4), "gaze_away": i % 7 == 0}}
+                            for i in range(0, 300, 5)]}
+        path = tmp_path / f"video{n}_summary.json"
+        path.write_text(json.dumps(summary))
+        jobs.append((f"video{n}", path, None, tmp_path / f"video{n}_report.md"))
+    return jobs
+
+def test_reports_survive_injected_failures(stub, tmp_path):
+    random.seed(0)
+    base_url = stub(fail_rate=0.5)
+    jobs = _jobs(tmp_path, 10)
+
+    async def run():
+        client = LLMClient(base_url, concurrency=4, max_retries=20, backoff=0.05)
+        try:
+            return await generate_reports(jobs, client, budget=2000)
+        finally:
+            await client.close()
+
+    stats = asyncio.run(run())
+    assert stats["counts"] == {"ok": len(jobs)}
+    for _, _, _, report in jobs:
+        assert report.read_text().startswith("## Technical Conclusions")
+    # Half of the requests fail, so some reports only came after retries
+    assert stats["retries"] > 0
+    assert any(r["attempts"] > 1 for r in stats["videos"].values())
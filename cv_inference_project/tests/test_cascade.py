@@ -0,0 +1,51 @@
+import logging
+
+from cascade import Cascade
+from run_inference import run_gated_batch
+
+FPS = 30.0
+NO_FACE = range(300, 400)
+
+class Model:
+    def __init__(self, fn, requires=()):
+        self.fn = fn
+        self.requires = requires
+        self.calls = 0
+
+    def predict(self, img, **inputs):
+        self.calls += 1
+        return self.fn(img)
+
+class FaceMesh:
+    def process(self, img):
+        return None if img in NO_FACE else "landmarks"
+
+class Frame:
+    def __init__(self, idx):
+        self.idx = self.bgr = idx
+
+    def as_color(self, color):
+        return self.idx
+
+def _run(policy):
+    models = {
+        "headpose": Model(lambda i: {"face_found": i not in NO_FACE}, ("face_mesh",)),
+        "gaze": Model(lambda i: {"gaze_away": True, "gaze_angle": 45.0}, ("face_mesh",)),
+    }
+    cascade = Cascade(models, policy)
+    rows = {}
+    for start in range(0, 600, 40):
+        frames = [Frame(i) for i in range(start, start + 40, 5)]
+        results = run_gated_batch(cascade, models, {"face_mesh": FaceMesh()}, frames, FPS,
+                                  logging.getLogger("test"))
+        rows.update((f.idx, row) for f, row in zip(frames, results))
+    return models, cascade, rows
+
+def test_no_result_where_needs_fail():
+    models, cascade, rows = _run({"gaze": {"every": 2.0, "needs": ["face_present"]}})
+    assert all("gaze" not in rows[i] for i in NO_FACE if i in rows)
+    # Rate-limited frames carry the last result; the face's return runs afresh
+    assert rows[5]["gaze"]["carried_forward"] is True
+    assert rows[400]["gaze"]["carried_forward"] is False
+    assert cascade.inapplicable["gaze"] == 20
+    assert models["gaze"].calls == cascade.inferred["gaze"] < 100
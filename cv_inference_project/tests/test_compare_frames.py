@@ -0,0 +1,25 @@
+import pytest
+
+from compare_frames import FrameIndex
+
+def _index():
+    summary = {"gaze": [{"frame": i, "timestamp": i / 30, "meta": {"gaze_angle": float(i % 3)}}
+                        for i in range(0, 50, 5)]}
+    return FrameIndex(summary)
+
+def test_lag_deltas():
+    prev, cur, diffs, both = _index().delta("gaze", "gaze_angle", lag=2)
+    assert list(prev[:2]) == [0, 5] and list(cur[:2]) == [10, 15]
+    assert len(diffs) == len(both) == 8
+
+@pytest.mark.parametrize("lag", [0, -1])
+def test_lag_below_one_is_rejected(lag):
+    with pytest.raises(ValueError, match="lag must be at least 1"):
+        _index().stats(lags=[lag])
+
+def test_missing_count_has_no_diff():
+    counts = [1, None, 3, 5]
+    summary = {"persons": [{"frame": i, "timestamp": i / 30, "meta": {"person_count": c}}
+                           for i, c in enumerate(counts)]}
+    pairs = FrameIndex(summary).compare()["pairwise_comparisons"]
+    assert [p["results"]["persons"]["count_diff"] for p in pairs] == [None, None, 2]
@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+from parser.parser import download_to, download_yandex_file
+from parser.yandex_stub import serve
+
+SIZE = 1_000_003
+
+@pytest.fixture
+def remote(tmp_path):
+    root = tmp_path / "remote"
+    root.mkdir()
+    data = os.urandom(SIZE)
+    (root / "exam.mkv").write_bytes(data)
+    servers = []
+
+    def start(**options):
+        server = serve(str(root), port=0, **options)
+        servers.append(server)
+        return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield data, start
+    for server in servers:
+        server.shutdown()
+
+def test_resumes_cut_transfers(remote, tmp_path):
+    data, start = remote
+    # Cut on a chunk boundary, so no received byte is thrown away
+    server, base = start(drop_after=256 * 1024)
+    dest = tmp_path / "exam.mkv"
+    fetched = download_to(f"{base}/files/exam.mkv", str(dest), SIZE, chunk_size=64 * 1024)
+    assert dest.read_bytes() == data
+    assert fetched == SIZE
+    # Every byte was sent once, over several ranged requests
+    assert server.config["requests"] == 4
+    assert server.config["bytes"] == SIZE
+    assert not os.path.exists(f"{dest}.part") and not os.path.exists(f"{dest}.part.json")
+
+def test_resumes_part_from_earlier_run(remote, tmp_path):
+    data, start = remote
+    server, base = start()
+    dest = tmp_path / "exam.mkv"
+    (tmp_path / "exam.mkv.part").write_bytes(data[:400_000])
+    assert download_to(f"{base}/files/exam.mkv", str(dest), SIZE) == SIZE - 400_000
+    assert dest.read_bytes() == data
+    assert server.config["bytes"] == SIZE - 400_000
+
+def test_complete_part_is_kept_on_416(remote, tmp_path):
+    data, start = remote
+    _, base = start()
+    dest = tmp_path / "exam.mkv"
+    (tmp_path / "exam.mkv.part").write_bytes(data)
+    assert download_to(f"{base}/files/exam.mkv", str(dest)) == 0
+    assert dest.read_bytes() == data
+
+def test_stale_part_restarts_on_416(remote, tmp_path):
+    data, start = remote
+    server, base = start()
+    dest = tmp_path / "exam.mkv"
+    (tmp_path / "exam.mkv.part").write_bytes(b"x" * (SIZE + 10))
+    assert download_to(f"{base}/files/exam.mkv", str(dest), SIZE) == SIZE
+    assert dest.read_bytes() == data
+    assert server.config["requests"] == 1
+
+def test_yandex_link_through_stub_api(remote, tmp_path):
+    data, start = remote
+    _, base = start()
+    path = download_yandex_file("https://disk.yandex.ru/i/exam.mkv", str(tmp_path),
+                                f"{base}/v1/disk/public/resources/download")
+    assert path == str(tmp_path / "exam.mkv")
+    assert (tmp_path / "exam.mkv").read_bytes() == data
@@ -0,0 +1,21 @@
+import numpy as np
+
+from gallery import EmbeddingGallery
+
+def test_top_k_returns_distinct_students(tmp_path):
+    rng = np.random.default_rng(0)
+    query = rng.normal(size=512).astype(np.float32)
+    near = [query + rng.normal(scale=0.1, size=512) for _ in range(14)]
+    others = [rng.normal(size=512) for _ in range(4)]
+    labels = ["s1"] * 14 + ["s2", "s3", "s4", "s4"]
+    EmbeddingGallery.write(tmp_path, labels, np.array(near + others, dtype=np.float32))
+    gallery = EmbeddingGallery(tmp_path)
+
+    matches = gallery.search(query, k=3)
+    assert [label for label, _ in matches][0] == "s1"
+    assert len({label for label, _ in matches}) == 3
+    scores = gallery.scores(query)
+    for label, score in matches:
+        assert score == gallery.label_score(scores, label)
+    assert [label for label, _ in gallery.search(query, k=10)][0] == "s1"
+    assert len(gallery.search(query, k=10)) == 4
@@ -0,0 +1,85 @@
+from summary_store import SummaryWriter, SummaryReader
+
+def _rows(root, model):
+    return list(SummaryReader(root)[model])
+
+def test_empty_list_then_labels_across_chunks(tmp_path):
+    # Identity's no-face frames report gallery_top: [] before any match
+    store = SummaryWriter(tmp_path, ["identity"], chunk_rows=2)
+    metas = [{"gallery_top": []}, {"gallery_top": []}, {"gallery_top": []},
+             {"gallery_top": ["s1", "s2"]}, {}, {"gallery_top": ["s3"]}]
+    for i, meta in enumerate(metas):
+        store.append("identity", i, i / 10, meta)
+    store.close()
+    assert [r["meta"] for r in _rows(tmp_path, "identity")] == metas
+
+def test_empty_list_then_labels_in_one_chunk(tmp_path):
+    store = SummaryWriter(tmp_path, ["identity"])
+    metas = [{"gallery_top": []}, {"gallery_top": [["s1", 0.9]]}]
+    for i, meta in enumerate(metas):
+        store.append("identity", i, float(i), meta)
+    store.close()
+    assert [r["meta"] for r in _rows(tmp_path, "identity")] == metas
+
+def test_empty_list_then_boxes(tmp_path):
+    store = SummaryWriter(tmp_path, ["phone"], chunk_rows=1)
+    metas = [{"phone_boxes": []}, {"phone_boxes": [[1, 2, 3, 4]]}, {"phone_boxes": []}]
+    for i, meta in enumerate(metas):
+        store.append("phone", i, float(i), meta)
+    store.close()
+    assert [r["meta"] for r in _rows(tmp_path, "phone")] == metas
+
+def test_resume_after_reopened_column(tmp_path):
+    store = SummaryWriter(tmp_path, ["identity"], chunk_rows=1)
+    for i, meta in enumerate([{"gallery_top": []}, {"gallery_top": ["s1"]}, {"gallery_top": ["s2"]}]):
+        store.append("identity", i, float(i), meta)
+    store.close()
+    store = SummaryWriter(tmp_path, ["identity"], resume={"identity": 2})
+    store.append("identity", 5, 5.0, {"gallery_top": ["s9"]})
+    store.close()
+    assert [r["meta"]["gallery_top"] for r in _rows(tmp_path, "identity")] == [[], ["s1"], ["s9"]]
+
+def test_declared_output_kinds(tmp_path, caplog):
+    from models import registry
+    from models.registry import ModelSpec
+
+    specs = {"identity": registry.spec("identity"),
+             "phone": ModelSpec(outputs={"phone_count": "int", "phone_boxes": "list"})}
+    store = SummaryWriter(tmp_path, specs)
+    store.append("identity", 0, 0.0, {"gallery_top": [], "is_match": False})
+    store.append("identity", 1, 0.1, {"gallery_top": ["s1"], "is_match": True})
+    store.append("phone", 0, 0.0, {"phone_count": 1, "phone_boxes": ["not", "boxes"], "extra": 1.5})
+    reader = store.close()
+
+    assert reader.schema["models"]["identity"]["columns"]["gallery_top"]["kind"] == "json"
+    assert [r["meta"] for r in reader["identity"]] == [
+        {"gallery_top": [], "is_match": False}, {"gallery_top": ["s1"], "is_match": True}]
+    # A value of another kind than declared is dropped with a warning
+    assert [r["meta"] for r in reader["phone"]] == [{"phone_count": 1, "extra": 1.5}]
+    assert "cannot store list in a list column" in caplog.text
+    assert "extra is not declared" in caplog.text
+
+def test_model_specs_declare_known_kinds():
+    from models import registry
+    from summary_store import SCALAR_KINDS, VARIABLE_KINDS
+
+    for name in ("gaze", "headpose", "identity", "objects", "persons", "phone"):
+        for field, kind in registry.spec(name).outputs.items():
+            assert kind in SCALAR_KINDS or kind in VARIABLE_KINDS, (name, field, kind)
+
+def test_declared_int_is_not_widened(tmp_path, caplog):
+    from models.registry import ModelSpec
+
+    store = SummaryWriter(tmp_path, {"phone": ModelSpec(outputs={"phone_count": "int"}),
+                                     "zzfake": ModelSpec()})
+    for i, count in enumerate([1, 2.5, 3.0]):
+        store.append("phone", i, float(i), {"phone_count": count})
+        store.append("zzfake", i, float(i), {"count": count})
+    reader = store.close()
+
+    assert reader.schema["models"]["phone"]["columns"]["phone_count"]["kind"] == "int"
+    assert reader["phone"].values("phone_count") == [1, None, 3]
+    assert "2.5 is not an integer" in caplog.text
+    # An inferred int column is widened instead
+    assert reader.schema["models"]["zzfake"]["columns"]["count"]["kind"] == "float"
+    assert reader["zzfake"].values("count") == [1.0, 2.5, 3.0]
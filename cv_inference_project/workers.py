@@ -0,0 +1,137 @@
+"""Process-pool execution of run_inference across videos.
+
+Each worker process loads the models once in its initializer and then takes
+whole videos from the pool. Numeric libraries are capped to a share of the
+cores so N workers do not each start one thread per core.
+"""
+import os
+import queue
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS",
+                   "NUMEXPR_NUM_THREADS", "VECLIB_MAXIMUM_THREADS")
+
+_worker = {}
+
+def threads_per_worker(workers, threads=None):
+    return threads or max(1, (os.cpu_count() or 1) // workers)
+
+def limit_threads(n):
+    """Cap torch/OpenCV/BLAS thread pools of the current process to `n`"""
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(n)
+    import cv2
+    cv2.setNumThreads(n)
+    try:
+        import torch
+        torch.set_num_threads(n)
+        torch.set_num_interop_threads(1)
+    except (ImportError, RuntimeError):
+        pass
+
+def video_duration(video_path):
+    """Duration in seconds, or 0.0 if the container cannot be read"""
+    try:
+        import decord
+        vr = decord.VideoReader(str(video_path), ctx=decord.cpu(0))
+        return len(vr) / vr.get_avg_fps()
+    except Exception:
+        return 0.0
+
+def longest_first(videos):
+    """Order (student_id, path, ...) jobs longest video first (file size breaks
+    ties and covers unreadable headers) so the slowest jobs start early"""
+    return sorted(videos, key=lambda v: (video_duration(v[1]), Path(v[1]).stat().st_size), reverse=True)
+
+def _init_worker(model_names, output_dir, log_level, threads, model_options):
+    limit_threads(threads)
+    from run_inference import setup_logger, load_models, load_stages
+
+    logger = setup_logger(output_dir, log_level, mode='a',
+                          prefix=f"[{multiprocessing.current_process().name}] ")
+    models = load_models(model_names, logger, model_options)
+    stages = load_stages(models, logger, model_options)
+    # ONNX Runtime and OpenVINO ignore the thread variables: their sessions are reopened
+    for part in [*models.values(), *stages.values()]:
+        if hasattr(part, "limit_threads"):
+            part.limit_threads(threads)
+    _worker.update(models=models, stages=stages, output_dir=output_dir, logger=logger)
+
+def _run_video(student_id, video_path, options, fingerprint):
+    from run_inference import process_video
+
+    if not _worker["models"]:
+        raise RuntimeError("No models loaded")
+    return process_video(_worker["models"], _worker["stages"], student_id, video_path,
+                         _worker["output_dir"], options, _worker["logger"], fingerprint)
+
+def _arrivals(jobs, poll=1.0):
+    """Jobs from a queue as they are put, None for every `poll` seconds
+    without one; ends at the None sentinel"""
+    while True:
+        try:
+            job = jobs.get(timeout=poll)
+        except queue.Empty:
+            yield None
+            continue
+        if job is None:
+            return
+        yield job
+
+def run_pool(videos, model_names, output_dir, options, logger, workers, threads=None,
+             on_result=None, model_options=None):
+    """Process (student_id, video_path, fingerprint) jobs on `workers`
+    processes. `videos` is either a list, run longest video first, or a
+    queue.Queue that is still being fed (None ends it), run as the jobs
+    arrive. `on_result(fingerprint, (key, entry))` is called in this process
+    as each video finishes; returns {key: entry} for all_results.json"""
+    threads = threads_per_worker(workers, threads)
+    # Inherited by the spawned workers before they import any numeric library
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+    options = dict(options, show_progress=False)
+    if not options.get("decode_threads"):
+        options["decode_threads"] = threads
+
+    if isinstance(videos, queue.Queue):
+        jobs = _arrivals(videos)
+        logger.info(f"Processing videos as they arrive on {workers} workers x {threads} threads")
+    else:
+        jobs = longest_first(videos)
+        logger.info(f"Processing {len(jobs)} videos on {workers} workers x {threads} threads")
+
+    results = {}
+    futures = {}
+    finished = 0
+
+    def collect(done):
+        nonlocal finished
+        for future in done:
+            video_path, fingerprint = futures[future]
+            finished += 1
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"Worker failed on {video_path}: {str(e)}")
+                continue
+            if result:
+                results[result[0]] = result[1]
+                if on_result is not None:
+                    on_result(fingerprint, result)
+            logger.info(f"Finished {finished}/{len(futures)}: {video_path}")
+
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=ctx, initializer=_init_worker,
+                             initargs=(model_names, output_dir, logger.level, threads, model_options)) as pool:
+        collected = set()
+        for job in jobs:
+            if job is not None:
+                student_id, video_path, fingerprint = job
+                futures[pool.submit(_run_video, student_id, video_path, options, fingerprint)] = (video_path, fingerprint)
+            done = {f for f in futures if f.done()} - collected
+            collected |= done
+            collect(done)
+        collect(as_completed(set(futures) - collected))
+    return results